@@ -1,14 +1,21 @@
 # app.py — finální s metrikami logu
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, abort
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, abort, jsonify
 from dotenv import load_dotenv
 import os
 import io
+import sys
+import signal
 import re
 import time
 import datetime as dt
 from collections import defaultdict, deque
 from typing import Optional  # pro kompatibilitu s Python <3.10
 
+# načti .env ze stejného adresáře (před monitor/collector – čtou os.getenv už při importu)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_PATH = os.path.join(BASE_DIR, ".env")
+load_dotenv(dotenv_path=ENV_PATH)
+
 from auth import login_required, check_credentials
 from monitor import (
     get_system_info,
@@ -18,11 +25,8 @@ from monitor import (
     get_all_vnstat_stats,
     get_iperf_test,
 )
-
-# načti .env ze stejného adresáře
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ENV_PATH = os.path.join(BASE_DIR, ".env")
-load_dotenv(dotenv_path=ENV_PATH)
+from collector import DataCollector
+from jobs import JobManager, JobRejected
 
 app = Flask(__name__)
 app.secret_key = os.getenv("UI_SECRET", "change-me")
@@ -30,6 +34,29 @@ app.secret_key = os.getenv("UI_SECRET", "change-me")
 # ---------- Pomocné ----------
 LOG_FILE = os.getenv("LOG_FILE", "/var/log/modbus_proxy.log")
 
+# ---------- Sběr dat pro dashboard na pozadí ----------
+# každý zdroj má vlastní interval obnovy (s); dashboard čte jen z cache
+DASH_SYS_INTERVAL_S      = float(os.getenv("DASH_SYS_INTERVAL_S", "15"))
+DASH_SERVICES_INTERVAL_S = float(os.getenv("DASH_SERVICES_INTERVAL_S", "10"))
+DASH_PING_INTERVAL_S     = float(os.getenv("DASH_PING_INTERVAL_S", "60"))
+DASH_VNSTAT_INTERVAL_S   = float(os.getenv("DASH_VNSTAT_INTERVAL_S", "10"))
+
+collector = DataCollector()
+collector.register("info", get_system_info, DASH_SYS_INTERVAL_S, default={})
+collector.register("services", get_services_status, DASH_SERVICES_INTERVAL_S, default={})
+collector.register("ping_stats", get_multi_ping_stats, DASH_PING_INTERVAL_S, default=[])
+collector.register("vnstat_stats", get_all_vnstat_stats, DASH_VNSTAT_INTERVAL_S, default=[])
+collector.start()
+
+# ---------- Fronta síťových testů ----------
+# iperf jen jeden najednou (single-flight), ping s omezeným počtem souběžných běhů
+JOBS_PING_WORKERS = int(os.getenv("JOBS_PING_WORKERS", "2"))
+IPERF_MAX_DURATION_S = 60
+
+jobs = JobManager()
+jobs.register("iperf", get_iperf_test, workers=1)
+jobs.register("ping", get_multi_ping_stats, workers=JOBS_PING_WORKERS)
+
 def _read_tail(path: str, max_bytes: int = 200_000) -> str:
     """Rychlé přečtení konce souboru (max_bytes)."""
     if not os.path.exists(path):
@@ -143,16 +170,15 @@ def parse_log_metrics(
 @app.route("/", methods=["GET"])
 @login_required
 def index():
-    info = get_system_info()
-    services = get_services_status()
-    ping_stats = get_multi_ping_stats()
-    vnstat_stats = get_all_vnstat_stats()
+    # data jsou připravená kolektorem na pozadí -> render okamžitě
+    snap = collector.snapshot()
     return render_template(
         "index.html",
-        info=info,
-        services=services,
-        ping_stats=ping_stats,
-        vnstat_stats=vnstat_stats,
+        info=snap["info"]["value"],
+        services=snap["services"]["value"],
+        ping_stats=snap["ping_stats"]["value"],
+        vnstat_stats=snap["vnstat_stats"]["value"],
+        ages={name: entry["age_s"] for name, entry in snap.items()},
         title="Dashboard",
     )
 
@@ -160,6 +186,7 @@ def index():
 @login_required
 def restart(service):
     ok, msg = restart_service_safe(service)
+    collector.refresh("services")
     flash(msg, "success" if ok else "error")
     return redirect(url_for("index"))
 
@@ -249,29 +276,53 @@ def logout():
 @app.route("/network", methods=["GET", "POST"])
 @login_required
 def network():
-    ping_results = []
-    iperf_result = None
     default_targets = "8.8.8.8, 192.168.1.1, 192.168.1.9, 192.168.1.10, 192.168.1.20"
 
     if request.method == "POST":
+        # test se jen zařadí do fronty, stránka se vrací okamžitě (PRG)
         action = request.form.get("action")
-        if action == "ping":
-            targets = request.form.get("targets", default_targets)
-            ip_list = [ip.strip() for ip in targets.split(",") if ip.strip()]
-            ping_results = get_multi_ping_stats(ip_list)
-        elif action == "iperf":
-            iperf_ip = request.form.get("iperf_ip", "192.168.1.20")
-            duration = int(request.form.get("duration", 10))
-            iperf_result = get_iperf_test(iperf_ip, duration)
-
+        try:
+            if action == "ping":
+                targets = request.form.get("targets", default_targets)
+                ip_list = [ip.strip() for ip in targets.split(",") if ip.strip()]
+                jobs.submit("ping", {"targets": ip_list})
+                flash("Ping test zařazen do fronty", "success")
+            elif action == "iperf":
+                iperf_ip = request.form.get("iperf_ip", "192.168.1.20")
+                duration = max(1, min(IPERF_MAX_DURATION_S, int(request.form.get("duration", 10))))
+                jobs.submit("iperf", {"server_ip": iperf_ip, "duration": duration}, expected_s=duration)
+                flash("iPerf test zařazen do fronty", "success")
+        except JobRejected as e:
+            flash(str(e), "error")
+        except ValueError:
+            flash("Neplatná délka testu", "error")
+        return redirect(url_for("network"))
+
+    last_ping = jobs.latest_result("ping")
+    last_iperf = jobs.latest_result("iperf")
     return render_template(
         "network.html",
-        ping_results=ping_results,
-        iperf_result=iperf_result,
+        ping_results=(last_ping["result"] or []) if last_ping else [],
+        iperf_result=(last_iperf["result"] or {"server": last_iperf["params"]["server_ip"], "error": last_iperf["error"]})
+                     if last_iperf else None,
+        jobs=jobs.list(),
         default_targets=default_targets,
         title="Síťové testy",
     )
 
+@app.route("/network/jobs", methods=["GET"])
+@login_required
+def network_jobs():
+    return jsonify(jobs.list())
+
+@app.route("/network/jobs/<job_id>", methods=["GET"])
+@login_required
+def network_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        abort(404)
+    return jsonify(job)
+
 # ---------- LOGS + METRIKY ----------
 
 @app.route("/logs", methods=["GET"])
@@ -338,5 +389,7 @@ def logs_download():
     )
 
 if __name__ == "__main__":
-    # pro vývoj; v produkci běží přes systemd
+    # pro vývoj; v produkci běží přes systemd – ten zastavuje SIGTERM, přes SystemExit
+    # proběhnou atexit handlery (uložení stavu netstat_sampler)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 8080)))
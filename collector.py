@@ -0,0 +1,98 @@
+# collector.py — sběr dat pro dashboard na pozadí (cache s časovými značkami)
+import threading
+import time
+import traceback
+
+
+class DataCollector:
+    """
+    Každý zdroj dat (funkce bez parametrů) běží ve vlastním vlákně a obnovuje se
+    ve vlastním intervalu. Výsledek se ukládá do cache spolu s časem pořízení,
+    takže request na dashboard jen čte hotová data a nikdy nečeká na subprocessy.
+    """
+
+    def __init__(self):
+        self._sources = {}          # name -> (func, interval_s, default)
+        self._cache = {}            # name -> {"value", "ts", "duration_s", "error"}
+        self._lock = threading.Lock()
+        self._wake = {}             # name -> threading.Event (vynucená obnova)
+        self._stop = threading.Event()
+        self._started = False
+
+    def register(self, name, func, interval_s, default=None):
+        with self._lock:
+            self._sources[name] = (func, float(interval_s), default)
+            self._wake[name] = threading.Event()
+            self._cache.setdefault(name, {"value": default, "ts": None, "duration_s": None, "error": None})
+
+    def start(self):
+        """Spustí vlákna zdrojů (opakované volání nic nedělá)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            names = list(self._sources)
+        for name in names:
+            threading.Thread(target=self._loop, args=(name,), name=f"collector-{name}", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        for evt in self._wake.values():
+            evt.set()
+
+    def refresh(self, name):
+        """Požádá o okamžitou obnovu zdroje (např. po restartu služby)."""
+        evt = self._wake.get(name)
+        if evt:
+            evt.set()
+
+    def _loop(self, name):
+        func, interval_s, _ = self._sources[name]
+        wake = self._wake[name]
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            # clear před sběrem: refresh() během běhu funkce vyvolá hned další běh
+            wake.clear()
+            try:
+                value = func()
+                err = None
+            except Exception as e:
+                value = None
+                err = str(e)
+                traceback.print_exc()
+            dur = time.monotonic() - t0
+            with self._lock:
+                entry = self._cache[name]
+                if err is None:
+                    entry["value"] = value
+                    entry["ts"] = time.time()
+                entry["duration_s"] = round(dur, 3)
+                entry["error"] = err
+            # fixed-rate: interval se počítá od začátku běhu, ne od konce
+            wake.wait(max(0.0, interval_s - dur))
+
+    def get(self, name):
+        """Vrátí (value, age_s); age_s je None, pokud data ještě nejsou."""
+        with self._lock:
+            entry = self._cache.get(name)
+            if not entry:
+                return None, None
+            ts = entry["ts"]
+            return entry["value"], (None if ts is None else max(0.0, time.time() - ts))
+
+    def snapshot(self):
+        """Kopie celé cache doplněná o stáří hodnot (pro šablonu / JSON)."""
+        now = time.time()
+        out = {}
+        with self._lock:
+            for name, entry in self._cache.items():
+                ts = entry["ts"]
+                out[name] = {
+                    "value": entry["value"],
+                    "ts": ts,
+                    "age_s": None if ts is None else int(max(0.0, now - ts)),
+                    "interval_s": self._sources[name][1],
+                    "duration_s": entry["duration_s"],
+                    "error": entry["error"],
+                }
+        return out
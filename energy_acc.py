@@ -0,0 +1,92 @@
+# energy_acc.py — integrace výkonu na energii (kWh) řízená příchozími událostmi, s ošetřením výpadků
+import time
+import threading
+
+INTEGRATION_METHODS = ("step", "trapezoid")
+GAP_MODES = ("hold", "zero")
+
+
+class EnergyAccumulator:
+    """
+    Integruje přesně mezi časy událostí (žádný periodický tick):
+      apply(updates, ts)  nové výkony (W) kanálů z jedné události; úsek od předchozí
+                          události se integruje hned, ostatní kanály drží svoji hodnotu
+      gap()               výpadek zdroje (odpojený WS) – následující úsek je mezera
+
+    method    "step"      hodnota platí až do další změny (Infigy posílá změny)
+              "trapezoid" lineárně mezi starou a novou hodnotou kanálu
+    gap_mode  "hold"      v mezeře drží poslední výkon, nejvýš max_hold_s
+              "zero"      mezera nepřispívá ničím
+    Délka úseku mezi událostmi sama o sobě mezeru neznamená (ustálená zátěž
+    chodí řídce) – výpadek hlásí jen gap() po odpojení nebo zásahu WS
+    watchdogu; max_hold_s omezuje jen takovou mezeru. power a totals jsou
+    sdílené slovníky volajícího (W, kWh), mění se jen pod zámkem.
+    """
+
+    def __init__(self, power, totals, method="trapezoid", gap_mode="hold", max_hold_s=60.0):
+        if method not in INTEGRATION_METHODS:
+            raise ValueError(f"unknown integration method {method!r}")
+        if gap_mode not in GAP_MODES:
+            raise ValueError(f"unknown gap mode {gap_mode!r}")
+        self.power = power
+        self.totals = totals
+        self.method = method
+        self.gap_mode = gap_mode
+        self.max_hold_s = float(max_hold_s)
+        self._t = None          # čas poslední integrované události (monotonic)
+        self._gap = False
+        self._lock = threading.Lock()
+        self.counters = {"events": 0, "gaps": 0, "gap_held_s": 0.0, "gap_dropped_s": 0.0}
+
+    def apply(self, updates, ts=None):
+        ts = time.monotonic() if ts is None else ts
+        with self._lock:
+            self.counters["events"] += 1
+            if self._t is not None and ts > self._t:
+                self._integrate(ts - self._t, updates)
+            if self._t is None or ts > self._t:
+                self._t = ts
+            for key, w in updates.items():
+                self.power[key] = float(w)
+
+    def _integrate(self, dt, updates):
+        gap = self._gap
+        if gap:
+            self._gap = False
+            self.counters["gaps"] += 1
+            if self.gap_mode == "zero":
+                self.counters["gap_dropped_s"] += dt
+                return
+            held = min(dt, self.max_hold_s)
+            self.counters["gap_held_s"] += held
+            self.counters["gap_dropped_s"] += dt - held
+            dt = held
+        h = dt / 3600.0
+        for key, p_prev in self.power.items():
+            p = float(p_prev)
+            # přes mezeru lineární průběh neznáme -> jen držení staré hodnoty
+            if self.method == "trapezoid" and not gap and key in updates:
+                p = (p + float(updates[key])) / 2.0
+            if p > 0:
+                self.totals[key] = float(self.totals.get(key, 0.0)) + p * h / 1000.0
+
+    def gap(self):
+        """Zdroj přestal posílat (disconnect); úsek do další události se počítá podle gap_mode."""
+        with self._lock:
+            self._gap = True
+
+    def set_total(self, key, kwh):
+        """Ruční nastavení čítače (kWh); úsek do další události se integruje už k nové hodnotě."""
+        if key not in self.totals:
+            raise KeyError(key)
+        kwh = float(kwh)
+        if kwh < 0:
+            raise ValueError("energy counter must be >= 0")
+        with self._lock:
+            old = self.totals[key]
+            self.totals[key] = kwh
+            return old
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.totals)
@@ -0,0 +1,162 @@
+# energy_journal.py — append-only žurnál energií (kWh) s CRC, dávkovým fsync a kompakcí do snapshotu
+import os
+import json
+import time
+import struct
+import zlib
+import threading
+
+_MAGIC = b"EJ1\n"
+
+
+class EnergyJournal:
+    """
+    Snapshot (JSON, zapisuje se jen při kompakci) + žurnál pevně dlouhých
+    binárních záznamů. Záznam nese absolutní stav všech kanálů:
+    ts (wall clock), seq, n x kWh (double), CRC32 – obnova tedy jen vezme
+    poslední záznam s platným CRC, useknutý nebo poškozený konec se zahodí.
+    Hlavička žurnálu (magic + JSON seznam kanálů) určuje pořadí hodnot, takže
+    změna sady kanálů starý žurnál nerozbije.
+
+    append() zapisuje do OS bufferu, fsync nejvýš jednou za fsync_interval_s
+    (okno ztráty při výpadku napájení); nad max_bytes se stav zkompaktuje do
+    snapshotu (tmp + fsync + rename) a žurnál začne znovu.
+    """
+
+    def __init__(self, snapshot_path, journal_path, channels, fsync_interval_s=30.0, max_bytes=256 * 1024):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.channels = tuple(channels)
+        self.fsync_interval_s = float(fsync_interval_s)
+        self.max_bytes = int(max_bytes)
+        self._rec = struct.Struct(f">dQ{len(self.channels)}d")
+        self._f = None
+        self._seq = 0
+        self._last_sync = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.counters = {"records": 0, "fsyncs": 0, "compactions": 0, "recovered": 0, "corrupt": 0}
+
+    # --- obnova ---
+    def load(self):
+        """Snapshot + poslední platný záznam žurnálu -> {kanál: kWh}; pak kompakce."""
+        totals = {}
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                totals.update({k: float(v) for k, v in data.items() if k in self.channels})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("ENERGY snapshot load error:", e)
+        last = self._replay()
+        if last:
+            # čítače jen rostou; pád uprostřed kompakce nechá starší žurnál vedle novějšího snapshotu
+            for k, v in last.items():
+                totals[k] = max(v, totals.get(k, 0.0))
+            self.counters["recovered"] += 1
+        with self._lock:
+            self._compact(totals)
+        return totals
+
+    def _replay(self):
+        try:
+            with open(self.journal_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print("ENERGY journal read error:", e)
+            return None
+        if not data.startswith(_MAGIC):
+            return None
+        nl = data.find(b"\n", len(_MAGIC))
+        try:
+            names = json.loads(data[len(_MAGIC):nl].decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            print("ENERGY journal header corrupt")
+            return None
+        rec = struct.Struct(f">dQ{len(names)}d")
+        size = rec.size + 4
+        off, last = nl + 1, None
+        while off + size <= len(data):
+            body = data[off:off + rec.size]
+            (crc,) = struct.unpack_from(">I", data, off + rec.size)
+            if zlib.crc32(body) != crc:
+                self.counters["corrupt"] += 1
+                break   # poškozený záznam – dál se nečte
+            vals = rec.unpack(body)
+            self._seq = max(self._seq, vals[1])
+            last = {k: v for k, v in zip(names, vals[2:]) if k in self.channels}
+            off += size
+        if off < len(data):
+            print(f"ENERGY journal: ignored tail {len(data) - off} B (torn/corrupt record)")
+        return last
+
+    # --- zápis ---
+    def _open(self):
+        self._f = open(self.journal_path, "wb")
+        self._f.write(_MAGIC + json.dumps(list(self.channels)).encode("utf-8") + b"\n")
+        self._f.flush()
+
+    def append(self, totals, sync=False):
+        with self._lock:
+            try:
+                if self._f is None:
+                    self._open()
+                self._seq += 1
+                body = self._rec.pack(time.time(), self._seq,
+                                      *(float(totals.get(k, 0.0)) for k in self.channels))
+                self._f.write(body + struct.pack(">I", zlib.crc32(body)))
+                self._f.flush()
+                self._dirty = True
+                self.counters["records"] += 1
+                now = time.monotonic()
+                if sync or now - self._last_sync >= self.fsync_interval_s:
+                    self._fsync(now)
+                if self._f.tell() >= self.max_bytes:
+                    self._compact(totals)
+            except OSError as e:
+                print("ENERGY journal write error:", e)
+
+    def _fsync(self, now):
+        if self._dirty:
+            os.fsync(self._f.fileno())
+            self._dirty = False
+            self.counters["fsyncs"] += 1
+        self._last_sync = now
+
+    def _compact(self, totals):
+        """Stav do snapshotu (atomicky), žurnál od nuly."""
+        try:
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({k: float(totals.get(k, 0.0)) for k in self.channels}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if self._f is not None:
+                self._f.close()
+            self._open()
+            os.fsync(self._f.fileno())
+            self._dirty = False
+            self.counters["compactions"] += 1
+        except OSError as e:
+            print("ENERGY compaction error:", e)
+
+    def compact(self, totals):
+        """Okamžitá kompakce (ruční změna čítače – i snížení musí přežít restart, load bere maximum)."""
+        with self._lock:
+            self._compact(totals)
+
+    def close(self, totals=None):
+        """Při ukončení: poslední stav do snapshotu (nebo aspoň fsync žurnálu)."""
+        with self._lock:
+            if totals is not None:
+                self._compact(totals)
+            elif self._f is not None:
+                self._fsync(time.monotonic())
+            if self._f is not None:
+                self._f.close()
+                self._f = None
@@ -0,0 +1,154 @@
+# energy_stats.py — hodinové/denní/měsíční součty energií v kruhových bufferech (array) + odvozené KPI
+import os
+import json
+import time
+import threading
+from array import array
+
+# název -> (klíč periody z time.struct_time, počet uchovaných period)
+GRANULARITIES = {
+    "hour":  (lambda lt: ((lt.tm_year * 100 + lt.tm_mon) * 100 + lt.tm_mday) * 100 + lt.tm_hour, 48),
+    "day":   (lambda lt: (lt.tm_year * 100 + lt.tm_mon) * 100 + lt.tm_mday, 62),
+    "month": (lambda lt: lt.tm_year * 100 + lt.tm_mon, 24),
+}
+
+
+def _pct(num, den):
+    if den <= 1e-9:
+        return None
+    return max(0.0, min(100.0, num / den * 100.0))
+
+def kpis(kwh):
+    """KPI periody ze součtů kanálů – O(1), nic se nepřepočítává zpětně."""
+    pv, home = kwh.get("pv", 0.0), kwh.get("home", 0.0)
+    return {
+        # podíl výroby FVE spotřebovaný doma (nebo do baterie)
+        "self_consumption": _pct(pv - kwh.get("grid_export", 0.0), pv),
+        # podíl spotřeby domu pokrytý bez odběru ze sítě
+        "autarky": _pct(home - kwh.get("grid_import", 0.0), home),
+        # vybito / nabito (round trip; v rámci jedné periody jen orientačně)
+        "battery_efficiency": _pct(kwh.get("bat_discharge", 0.0), kwh.get("bat_charge", 0.0)),
+    }
+
+
+class _Ring:
+    """N period x C kanálů v jednom array('d'); keys[i] = klíč periody slotu i (0 = prázdný)."""
+
+    def __init__(self, size, nch):
+        self.size = size
+        self.nch = nch
+        self.pos = 0
+        self.keys = array("q", [0]) * size
+        self.values = array("d", [0.0]) * (size * nch)
+
+    def roll(self, key):
+        """Posun na periodu key; vrací klíč uzavřené periody (nebo None)."""
+        cur = self.keys[self.pos]
+        if cur == key:
+            return None
+        if cur:
+            self.pos = (self.pos + 1) % self.size
+        self.keys[self.pos] = key
+        base = self.pos * self.nch
+        for i in range(self.nch):
+            self.values[base + i] = 0.0
+        return cur or None
+
+    def slot(self, back=0):
+        i = (self.pos - back) % self.size
+        return self.keys[i], self.values[i * self.nch:(i + 1) * self.nch]
+
+
+class EnergyStats:
+    """
+    Z rostoucích celkových čítačů (kWh) počítá přírůstky a přičítá je do
+    aktuální hodiny/dne/měsíce (lokální čas). Stav (kruhové buffery
+    a poslední viděné čítače) se ukládá do JSON; energie z doby, kdy proces
+    neběžel, po startu spadne do aktuální periody.
+    """
+
+    def __init__(self, channels, path):
+        self.channels = tuple(channels)
+        self.path = path
+        self.rings = {g: _Ring(n, len(self.channels)) for g, (_, n) in GRANULARITIES.items()}
+        self._last = None
+        self._lock = threading.Lock()
+
+    def update(self, totals, ts=None):
+        """Vrací seznam (granularita, klíč) právě uzavřených period."""
+        lt = time.localtime(time.time() if ts is None else ts)
+        closed = []
+        with self._lock:
+            last = self._last
+            self._last = {k: float(totals.get(k, 0.0)) for k in self.channels}
+            for g, (keyfn, _) in GRANULARITIES.items():
+                ring = self.rings[g]
+                prev = ring.roll(keyfn(lt))
+                if prev:
+                    closed.append((g, prev))
+                if last is None:
+                    continue
+                base = ring.pos * ring.nch
+                for i, k in enumerate(self.channels):
+                    if k not in last:
+                        continue   # nový kanál – začíná se počítat od teď
+                    d = self._last[k] - last[k]
+                    if d > 0:   # záporný rozdíl = reset čítače, nepočítá se
+                        ring.values[base + i] += d
+        return closed
+
+    def rebase(self, totals):
+        """Nové výchozí čítače bez připsání rozdílu do period (ruční nastavení čítače)."""
+        with self._lock:
+            self._last = {k: float(totals.get(k, 0.0)) for k in self.channels}
+
+    def period(self, granularity, back=0):
+        """(klíč periody, {kanál: kWh}, {kpi: %}) pro aktuální (back=0) nebo starší periodu."""
+        with self._lock:
+            key, vals = self.rings[granularity].slot(back)
+        kwh = dict(zip(self.channels, vals))
+        return key, kwh, kpis(kwh)
+
+    # --- perzistence ---
+    def save(self):
+        with self._lock:
+            data = {
+                "channels": list(self.channels),
+                "last": self._last,
+                "rings": {g: {"pos": r.pos, "keys": r.keys.tolist(), "values": r.values.tolist()}
+                          for g, r in self.rings.items()},
+            }
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print("ENERGY STATS save error:", e)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("ENERGY STATS load error:", e)
+            return
+        try:
+            names = data["channels"]
+            col = {k: names.index(k) for k in self.channels if k in names}
+            with self._lock:
+                for g, r in self.rings.items():
+                    src = data["rings"].get(g)
+                    if not src or len(src["keys"]) != r.size:
+                        continue
+                    r.pos = int(src["pos"]) % r.size
+                    for i in range(r.size):
+                        r.keys[i] = int(src["keys"][i])
+                        for j, k in enumerate(self.channels):
+                            r.values[i * r.nch + j] = float(src["values"][i * len(names) + col[k]]) if k in col else 0.0
+                if isinstance(data.get("last"), dict):
+                    self._last = {k: float(v) for k, v in data["last"].items() if k in self.channels}
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            print("ENERGY STATS load error:", e)
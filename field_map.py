@@ -0,0 +1,174 @@
+# field_map.py — tabulkové mapování polí událostí (Infigy store:change) na MQTT topicy a kanály integrátoru
+import re
+
+from topic_throttle import TopicThrottle
+
+_MISSING = object()
+
+
+def _to_float(v):
+    return float(v)
+
+def _bool01(v):
+    return "1" if v else "0"
+
+def _sum(vals):
+    return sum(float(v) for v in vals)
+
+# transformace podle jména (pro tabulku pravidel); lze předat i vlastní callable
+TRANSFORMS = {
+    "float":  _to_float,
+    "str":    str,
+    "bool01": _bool01,
+    "sum":    _sum,
+}
+
+
+def _parse_path(path):
+    """'HW_INFO.Consumption[0]' i 'HW_INFO.Consumption.0' -> ('HW_INFO', 'Consumption', 0)."""
+    segs = []
+    for part in re.sub(r"\[(\d+)\]", r".\1", path).split("."):
+        if part == "":
+            continue
+        segs.append(int(part) if part.isdigit() else part)
+    return tuple(segs)
+
+
+class FieldRule:
+    """
+    Jedno pravidlo mapování:
+      source          cesta (nebo n-tice cest – transform pak dostane seznam hodnot);
+                      plochý klíč se stejným jménem (např. "HW_INFO.Consumption.0") má přednost
+      topic           topic suffix pro publish
+      transform       jméno z TRANSFORMS nebo callable
+      scale, digits   násobek (kW -> W = 1000) a zaokrouhlení výsledku
+      qos, retain     parametry publikace
+      deadband        změna <= deadband se nepublikuje (0 = každá změna)
+      min_interval_s  nejvýš jedna publikace za interval, poslední hodnota jde ven na konci (trailing edge)
+      agg             None | "mean" | "min" | "max" – místo vzorků agregát za interval
+      change_only     publikovat jen změny i bez deadbandu/intervalu (stavy a příznaky)
+      integrate       kanál integrátoru ("pv") nebo dvojice (kladný, záporný) pro rozdělení podle znaménka
+      integrate_scale přepočet hodnoty na W pro integrátor
+    """
+
+    __slots__ = ("sources", "topic", "transform", "scale", "digits", "qos", "retain",
+                 "deadband", "min_interval_s", "agg", "change_only", "integrate", "integrate_scale", "multi", "_paths")
+
+    def __init__(self, source, topic, transform="float", scale=1.0, digits=None, qos=0, retain=True,
+                 deadband=0.0, min_interval_s=0.0, agg=None, change_only=False, integrate=None, integrate_scale=1.0):
+        self.multi = isinstance(source, (tuple, list))
+        self.sources = tuple(source) if self.multi else (source,)
+        self.topic = topic
+        self.transform = TRANSFORMS[transform] if isinstance(transform, str) else transform
+        self.scale = scale
+        self.digits = digits
+        self.qos = qos
+        self.retain = retain
+        self.deadband = deadband
+        self.min_interval_s = min_interval_s
+        self.agg = agg
+        self.change_only = change_only
+        self.integrate = integrate
+        self.integrate_scale = integrate_scale
+        self._paths = [(s, _parse_path(s)) for s in self.sources]
+
+    def top_keys(self):
+        """Klíče nejvyšší úrovně, při jejichž výskytu má smysl pravidlo vyhodnotit."""
+        keys = set()
+        for literal, segs in self._paths:
+            keys.add(literal)
+            if segs:
+                keys.add(segs[0])
+        return keys
+
+    def resolve(self, payload):
+        vals = []
+        for literal, segs in self._paths:
+            if literal in payload:
+                v = payload[literal]
+            else:
+                v = payload
+                for seg in segs:
+                    if isinstance(seg, int):
+                        v = v[seg] if isinstance(v, (list, tuple)) and len(v) > seg else _MISSING
+                    else:
+                        v = v.get(seg, _MISSING) if isinstance(v, dict) else _MISSING
+                    if v is _MISSING:
+                        break
+            if v is _MISSING or v is None:
+                return _MISSING
+            vals.append(v)
+        return vals if self.multi else vals[0]
+
+    def value(self, payload):
+        raw = self.resolve(payload)
+        if raw is _MISSING:
+            return _MISSING
+        v = self.transform(raw)
+        if self.scale != 1.0:
+            v = float(v) * self.scale
+        if self.digits is not None:
+            v = round(v, self.digits)
+        return v
+
+
+class FieldMapper:
+    """
+    Pravidla se při startu zkompilují do indexu klíč -> pravidla, takže
+    událost vyhodnotí jen pravidla, jejichž klíče v payloadu jsou (v pořadí
+    tabulky). publish(topic, value, qos, retain) a integrate(kanál, W) dodá volající.
+    Integrátor dostává každý vzorek, publikace jde přes TopicThrottle podle
+    deadbandu/intervalu pravidla (časovač pro throttle.flush_due spouští volající).
+    """
+
+    def __init__(self, rules, publish, integrate=None):
+        self.rules = list(rules)
+        self.publish = publish
+        self.integrate = integrate
+        self._index = {}
+        for i, rule in enumerate(self.rules):
+            for key in rule.top_keys():
+                self._index.setdefault(key, []).append(i)
+        self.throttle = TopicThrottle(publish)
+        for rule in self.rules:
+            if rule.deadband or rule.min_interval_s or rule.agg or rule.change_only:
+                self.throttle.configure(rule.topic, rule.min_interval_s, rule.deadband, rule.agg, rule.digits)
+        self.counters = {"events": 0, "errors": 0}
+
+    def handle(self, payload, now=None):
+        """now: čas události pro throttle (monotonic; replay dodá čas ze záznamu)."""
+        self.counters["events"] += 1
+        hit = set()
+        for key in payload:
+            idx = self._index.get(key)
+            if idx:
+                hit.update(idx)
+        for i in sorted(hit):
+            rule = self.rules[i]
+            try:
+                v = rule.value(payload)
+            except (TypeError, ValueError) as e:
+                self.counters["errors"] += 1
+                print(f"[MAP] {rule.topic}: {e}")
+                continue
+            if v is _MISSING:
+                continue
+            if rule.integrate and self.integrate:
+                self._integrate(rule, v)
+            self._publish(rule, v, now)
+
+    def _integrate(self, rule, v):
+        w = float(v) * rule.integrate_scale
+        if isinstance(rule.integrate, (tuple, list)):
+            pos, neg = rule.integrate
+            self.integrate(pos, max(0.0, w))
+            self.integrate(neg, max(0.0, -w))
+        else:
+            self.integrate(rule.integrate, w)
+
+    def _publish(self, rule, v, now=None):
+        self.throttle.offer(rule.topic, v, rule.qos, rule.retain, now)
+
+    def reset(self):
+        """Po reconnectu poslat znovu i hodnoty v deadbandu."""
+        self.throttle.reset()
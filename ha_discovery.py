@@ -0,0 +1,89 @@
+# ha_discovery.py — Home Assistant MQTT discovery: předpočítané payloady, hash a publikace jen změn
+import os
+import json
+import hashlib
+import threading
+
+DISCOVERY_PREFIX = os.getenv("DISCOVERY_PREFIX", "homeassistant")
+HA_STATUS_TOPIC  = os.getenv("HA_STATUS_TOPIC", f"{DISCOVERY_PREFIX}/status")   # birth/will zpráva HA
+
+
+class DiscoveryRegistry:
+    """
+    Konfigurace entit se serializují jednou (set_entities) a ke každému
+    config topicu se drží hash obsahu. sync() pošle jen nové a změněné
+    konfigurace, u entit, které z tabulky zmizely, pošle prázdný retained
+    payload (tombstone – HA entitu odstraní). Odeslané hashe se ukládají
+    do JSON, takže restart bridge nic znovu neposílá; sync(force=True)
+    po "online" na homeassistant/status pošle vše (HA mohl přijít o stav).
+    """
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self._payloads = {}    # topic -> (json, hash)
+        self._published = {}   # topic -> hash naposledy odeslaný
+        self._lock = threading.Lock()
+        self.counters = {"sent": 0, "skipped": 0, "removed": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._published = {str(k): str(v) for k, v in data.items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("DISCOVERY state load error:", e)
+
+    def _save(self):
+        try:
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._published, f, ensure_ascii=False, sort_keys=True)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            print("DISCOVERY state save error:", e)
+
+    def set_entities(self, entries):
+        """entries: iterovatelné (config_topic, cfg dict); serializace proběhne jen tady."""
+        payloads = {}
+        for topic, cfg in entries:
+            blob = json.dumps(cfg, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+            payloads[topic] = (blob, hashlib.sha1(blob.encode("utf-8")).hexdigest())
+        with self._lock:
+            self._payloads = payloads
+
+    def sync(self, publish_raw, force=False):
+        """
+        publish_raw(topic, payload) -> True, pokud zprávu převzal klient.
+        Vrací počet odeslaných zpráv (konfigurace + tombstony).
+        """
+        sent = 0
+        with self._lock:
+            for topic, (blob, digest) in self._payloads.items():
+                if not force and self._published.get(topic) == digest:
+                    self.counters["skipped"] += 1
+                    continue
+                if publish_raw(topic, blob):
+                    self._published[topic] = digest
+                    self.counters["sent"] += 1
+                    sent += 1
+            for topic in [t for t in self._published if t not in self._payloads]:
+                if publish_raw(topic, ""):
+                    del self._published[topic]
+                    self.counters["removed"] += 1
+                    sent += 1
+            if sent:
+                self._save()
+        if sent:
+            print(f"[DISCOVERY] published {sent} config(s){' (forced)' if force else ''}")
+        return sent
+
+    def on_ha_status(self, publish_raw):
+        """Handler pro HA_STATUS_TOPIC: po startu HA pošli všechny konfigurace znovu."""
+        def _handler(topic, payload):
+            if payload.strip().lower() == "online":
+                self.sync(publish_raw, force=True)
+        return _handler
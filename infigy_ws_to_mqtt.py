@@ -1,697 +1,827 @@
 import os
 import time
 import json
+import signal
+import asyncio
 import threading
 import socketio
-import socket
 import traceback
 import sys
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
-# --- connection latches ---
-connected = threading.Event()
-last_event_ts = time.monotonic() # heartbeat for WS payloads
-
-# --- log runtime ---
-print("__file__ running from:", __file__)
-print("PYTHON:", sys.executable)
-print("PAHO_VERSION:", getattr(mqtt, "__version__", "unknown"))
-print("HAS_V2:", hasattr(mqtt, "CallbackAPIVersion"))
-
-# aktuální výkonové hodnoty (W) pro integrátor
-current_power = {
-"home": 0.0,
-"pv": 0.0,
-"grid_import": 0.0, # >0 = beru ze sítě
-"grid_export": 0.0, # >0 = posílám do sítě
-"bat_charge": 0.0, # >0 = nabíjím z/do sítě/FVE
-"bat_discharge": 0.0, # >0 = vybíjím do domu/sítě
-"boiler_total": 0.0
-}
-
-
-# integrované energie (kWh)
-energy_totals = {
-"home": 0.0,
-"pv": 0.0,
-"grid_import": 0.0,
-"grid_export": 0.0,
-"bat_charge": 0.0,
-"bat_discharge": 0.0,
-"boiler_total": 0.0
-}
-
-# --- .env ---
+# --- .env ---  (před importem vlastních modulů – ty čtou os.getenv už při importu)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ENV_PATH = os.path.join(BASE_DIR, ".env")
 load_dotenv(dotenv_path=ENV_PATH)
 
+from mqtt_bridge import MqttBridge, acquire_singleton
+from ha_discovery import DiscoveryRegistry, HA_STATUS_TOPIC
+from field_map import FieldRule, FieldMapper
+from energy_acc import EnergyAccumulator
+from energy_journal import EnergyJournal
+from energy_stats import EnergyStats, GRANULARITIES
+import ws_codec
+from ws_recorder import EventRecorder
+from ws_watchdog import StallDetector, Backoff
+from mqtt_cmd import CommandRouter, parse_acl
+
 # --- Konfig z .env ---
-# --- MQTT ---
-MQTT_HOST   = os.getenv("MQTT_HOST", "localhost")
-MQTT_PORT   = int(os.getenv("MQTT_PORT", "1883"))
-MQTT_USER   = os.getenv("MQTT_USER", "")
-MQTT_PASS   = os.getenv("MQTT_PASS", "")
+# --- MQTT (připojení, watchdog a QoS politika viz mqtt_bridge.py) ---
 MQTT_BASE   = os.getenv("MQTT_BASE_INFIGY", "infigy")
 CLIENT_ID   = os.getenv("CLIENT_ID_INFIGY","infigy-bridge")
 AUTH_COOKIE = os.getenv("AUTH_COOKIE", "").strip()
 AUTH_BEARER = os.getenv("AUTH_BEARER", "").strip()
-MQTT_WATCHDOG_INTERVAL_S = int(os.getenv("MQTT_WATCHDOG_INTERVAL_S", "15"))
-MQTT_RECONNECT_BACKOFF_MAX_S = int(os.getenv("MQTT_RECONNECT_BACKOFF_MAX_S", "60"))
 # --- Infigy ---
+# více zařízení v jednom procesu: INFIGY_DEVICES=default,garaz – "default" = hodnoty níže (historické
+# topicy/entity), ostatní čtou INFIGY_<NAME>_HOST, _SOCKET_PATH, _DEVICE_ID, _ENTITY_PREFIX, _AUTH_COOKIE,
+# _AUTH_BEARER, _RECORD_PATH a publikují pod <MQTT_BASE>/<name>/...; stavové soubory dostanou příponu _<name>
+INFIGY_DEVICES = [n.strip().lower() for n in os.getenv("INFIGY_DEVICES", "").split(",") if n.strip()] or ["default"]
 INFIGY_HOST = os.getenv("INFIGY_HOST", "http://127.0.0.1")
 SOCKET_PATH = os.getenv("SOCKET_PATH", "/socket.io")
+WS_CODEC    = os.getenv("INFIGY_WS_CODEC", "auto")   # auto|json|orjson|msgpack (msgpack musí umět i server)
+RECORD_PATH = os.getenv("INFIGY_RECORD_PATH", "")    # gzip JSONL záznam událostí pro replay ("" = vypnuto)
+RECORD_MAX_MB = int(os.getenv("INFIGY_RECORD_MAX_MB", "200"))
+RUNTIME     = os.getenv("INFIGY_RUNTIME", "threads")  # threads|asyncio (asyncio potřebuje aiohttp pro AsyncClient)
 DISCOVERY_PREFIX = os.getenv("DISCOVERY_PREFIX", "homeassistant")
 DEVICE_ID = os.getenv("DEVICE_ID", "Infigy") 
 ENTITY_PREFIX = os.getenv("ENTITY_PREFIX", "infigy") # optional, defaults to "infigy"
 SW_VERSION = os.getenv("SW_VERSION", "1.1")
 ENERGY_STATE_PATH = os.getenv("ENERGY_STATE_PATH", os.path.join(BASE_DIR, "energy_state.json"))
 ENERGY_PUBLISH_INTERVAL_S = int(os.getenv("ENERGY_PUBLISH_INTERVAL_S", "30"))
-INTEGRATOR_TICK_S = float(os.getenv("INTEGRATOR_TICK_S", "5"))
+# žurnál energií: snapshot (ENERGY_STATE_PATH) se přepisuje jen při kompakci
+ENERGY_JOURNAL_PATH       = os.getenv("ENERGY_JOURNAL_PATH", os.path.join(BASE_DIR, "energy_state.journal"))
+ENERGY_JOURNAL_INTERVAL_S = float(os.getenv("ENERGY_JOURNAL_INTERVAL_S", "5"))    # okno ztráty při pádu procesu
+ENERGY_FSYNC_INTERVAL_S   = float(os.getenv("ENERGY_FSYNC_INTERVAL_S", "30"))     # okno ztráty při výpadku napájení
+ENERGY_JOURNAL_MAX_KB     = int(os.getenv("ENERGY_JOURNAL_MAX_KB", "256"))        # pak kompakce do snapshotu
+# hodinové/denní/měsíční součty + KPI (ukládají se při uzavření periody a po ENERGY_STATS_SAVE_S)
+ENERGY_STATS_PATH   = os.getenv("ENERGY_STATS_PATH", os.path.join(BASE_DIR, "energy_stats.json"))
+ENERGY_STATS_SAVE_S = float(os.getenv("ENERGY_STATS_SAVE_S", "300"))
+# integrace energie přímo z událostí store:change (bez ticku)
+ENERGY_INTEGRATION = os.getenv("ENERGY_INTEGRATION", "trapezoid")    # step|trapezoid
+ENERGY_GAP_MODE    = os.getenv("ENERGY_GAP_MODE", "hold")            # hold|zero – co s mezerou ve streamu
+ENERGY_MAX_HOLD_S  = float(os.getenv("ENERGY_MAX_HOLD_S", "60"))     # max. držení poslední hodnoty v mezeře po odpojení WS
 HEARTBEAT_MAX_AGE_S = int(os.getenv("HEARTBEAT_MAX_AGE_S", "180"))
+# WS watchdog: výpadek = ticho > WS_STALL_K × naučený interval událostí, v mezích WS_STALL_MIN_S..HEARTBEAT_MAX_AGE_S
+WS_STALL_K        = float(os.getenv("WS_STALL_K", "10"))
+WS_STALL_MIN_S    = float(os.getenv("WS_STALL_MIN_S", "20"))
+WS_EWMA_ALPHA     = float(os.getenv("WS_EWMA_ALPHA", "0.05"))
+WS_BACKOFF_BASE_S = float(os.getenv("WS_BACKOFF_BASE_S", "1"))
+WS_BACKOFF_MAX_S  = float(os.getenv("WS_BACKOFF_MAX_S", "60"))
+# omezení publikací živých hodnot (store:change chodí několikrát za sekundu); integrace bere každý vzorek
+PUB_INTERVAL_S = float(os.getenv("INFIGY_PUB_INTERVAL_S", "5"))     # nejvýš 1 publikace/topic za interval (0 = bez limitu)
+PUB_DEADBAND_W = float(os.getenv("INFIGY_PUB_DEADBAND_W", "10"))    # změna výkonu <= W se neposílá
+PUB_DEADBAND_C = float(os.getenv("INFIGY_PUB_DEADBAND_C", "0.1"))   # změna teploty <= °C se neposílá
+PUB_AGG        = os.getenv("INFIGY_PUB_AGG", "") or None             # ""|mean|min|max – agregát za interval místo vzorků
+MQTT_SPOOL_PATH = os.getenv("MQTT_SPOOL_PATH_INFIGY", os.path.join(BASE_DIR, "mqtt_spool_infigy.bin"))
+DISCOVERY_STATE_PATH = os.getenv("DISCOVERY_STATE_PATH_INFIGY", os.path.join(BASE_DIR, "discovery_state_infigy.json"))
+# příkazy na <MQTT_BASE>/cmd/# (viz mqtt_cmd.py): fnmatch vzory povolených příkazů, "" = vypnuto
+# celý seznam: help,stats,discovery,throttle/*,energy/set/*,energy/reset/*  (energy/* jen s ACL brokeru!)
+CMD_ACL = parse_acl(os.getenv("MQTT_CMD_ACL_INFIGY", "help,stats,discovery"))
+
+# --- MQTT kanál na sdíleném klientovi (LWT, store-and-forward buffer), nastaví attach() ---
+# jeden kanál, spool a discovery registr pro všechna zařízení
+chan = None
+connected = threading.Event()
 
-# --- Singleton lock: zabran spusteni 2. instance ---
-_singleton = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
-try:
-    _singleton.bind("\0infigy_ws_to_mqtt.singleton")
-except OSError:
-    print("Another infigy_ws_to_mqtt instance is running. Exiting.")
-    sys.exit(1)
-
-# --- MQTT klient ---
-mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,client_id=CLIENT_ID,clean_session=True)
-if MQTT_USER:
-    mqttc.username_pw_set(MQTT_USER, MQTT_PASS)
-
-# LWT (bridge offline) dostupnost zařízení
-mqttc.will_set(f"{MQTT_BASE}/bridge/online", "0", qos=1, retain=True)
-# Auto-reconnect backoff
-mqttc.reconnect_delay_set(min_delay=2, max_delay=MQTT_RECONNECT_BACKOFF_MAX_S)
-
-# --- helpers ---
-def touch():
-    global last_event_ts
-    last_event_ts = time.monotonic()
-
-def kw_to_w(x):
-    try:
-        return float(x) * 1000.0
-    except Exception:
-        return 0.0
+# kanály integrátoru (W -> kWh)
+CHANNELS = ("home", "pv", "grid_import", "grid_export", "bat_charge", "bat_discharge", "boiler_total")
+
+# kanál integrátoru -> topic energy/<x> a stats/<g>/<x>
+ENERGY_TOPICS = {
+    "home": "home_kwh",
+    "pv": "pv_kwh",
+    "grid_import": "grid_import_kwh",
+    "grid_export": "grid_export_kwh",
+    "bat_charge": "bat_charge_kwh",
+    "bat_discharge": "bat_discharge_kwh",
+    "boiler_total": "boiler_kwh",
+}
 
-def publish(topic_suffix, payload, retain=True, qos=1):
-    # Bezpecny publish s odchytem vyjimek
-    topic = f"{MQTT_BASE}/{topic_suffix}"
-    try:
-        mqttc.publish(topic, str(payload), qos=qos, retain=retain)
-    except Exception as e:
-        print(f"[MQTT] publish failed {topic}: {e}")    
+# ---------- MQTT Discovery ----------
+# Deklarativní tabulka entit:
+# (domain, object suffix, název, unique_id suffix, state topic, jednotka, device_class, state_class, extra)
+# unique_id suffixy jsou historické – neměnit, jinak HA založí nové entity.
+_AVAIL_LWT = {
+    "availability_topic": f"{MQTT_BASE}/bridge/online",
+    "payload_available": "1",
+    "payload_not_available": "0",
+}
+DISCOVERY_ENTITIES = [
+    # -------- Živé výkonové a teplotní senzory --------
+    ("sensor", "boiler_temperature",    "Boiler aktuální teplota",     "boiler_temperature",    "boiler/temperature",     "°C", "temperature", "measurement", None),
+    # ------- Boiler per-phase power (W) + total -------
+    ("sensor", "boiler_power_w_phase1", "Boiler aktuální odběr fáze 1", "boiler_power_w_phase1", "boiler/power_w/phase1", "W",  "power",       "measurement", None),
+    ("sensor", "boiler_power_w_phase2", "Boiler aktuální odběr fáze 2", "boiler_power_w_phase2", "boiler/power_w/phase2", "W",  "power",       "measurement", None),
+    ("sensor", "boiler_power_w_phase3", "Boiler aktuální odběr fáze 3", "boiler_power_w_phase3", "boiler/power_w/phase3", "W",  "power",       "measurement", None),
+    ("sensor", "boiler_power_w_total",  "Boiler aktuální odběr",        "boiler_power_w_total",  "boiler/power_w/total",  "W",  "power",       "measurement", None),
+    ("sensor", "home_power_w",          "Spotřeba domu",               "home_power",            "home/power_w/total",     "W",  "power",       "measurement", None),
+    ("sensor", "battery_power_w",       "Baterie",                     "battery_power",         "battery/power_w",        "W",  "power",       "measurement", None),
+    ("sensor", "grid_surplus_kw",       "Síť",                         "grid_surplus_kw",       "grid/surplus_total_kw",  "kW", "power",       "measurement", None),
+    ("sensor", "pv_power_w",            "FVE",                         "pv_power",              "pv/power_w",             "W",  "power",       "measurement", None),
+    ("sensor", "battery_soc",           "Stav baterie",                "battery_soc",           "battery/soc",            "%",  "battery",     "measurement", None),
+    # -------- Health --------
+    ("sensor", "bridge_last_event_age_s", "Infigy doba od poslední události", "last_event_age", "bridge/last_event_age_s", "s", "duration", "measurement", None),
+    ("sensor", "bridge_buffer_depth",   "Infigy MQTT fronta",          "buffer_depth",          "bridge/buffer_depth",    None, None,          "measurement", None),
+    ("sensor", "bridge_buffer_dropped", "Infigy MQTT zahozené zprávy", "buffer_dropped",        "bridge/buffer_dropped",  None, None,          "total_increasing", None),
+    ("sensor", "bridge_ws_reconnects",  "Infigy WS reconnecty",        "ws_reconnects",         "bridge/ws_reconnects",   None, None,          "total_increasing", None),
+    ("sensor", "bridge_ws_downtime_s",  "Infigy WS výpadky celkem",    "ws_downtime_s",         "bridge/ws_downtime_s",   "s",  "duration",    "total_increasing", None),
+    ("sensor", "bridge_ws_ttfe_s",      "Infigy první událost po připojení", "ws_ttfe_s",       "bridge/ws_ttfe_s",       "s",  "duration",    "measurement", None),
+    ("binary_sensor", "bridge_online",  "Infigy bridge online",        "bridge_online",         "bridge/online",          None, None,          None, None),
+    ("binary_sensor", "ws_flow_ok",     "Infigy poskytuje data",       "ws_flow_ok",            "bridge/ws_flow_ok",      None, "connectivity", None, _AVAIL_LWT),
+    # -------- Integrované energie (kWh) --------
+    ("sensor", "energy_home_kwh",          "Home Energy",              "energy_home_kwh",          "energy/home_kwh",          "kWh", "energy", "total_increasing", None),
+    ("sensor", "energy_pv_kwh",            "PV Energy",                "energy_pv_kwh",            "energy/pv_kwh",            "kWh", "energy", "total_increasing", None),
+    ("sensor", "energy_grid_import_kwh",   "Grid Import Energy",       "energy_grid_import_kwh",   "energy/grid_import_kwh",   "kWh", "energy", "total_increasing", None),
+    ("sensor", "energy_grid_export_kwh",   "Grid Export Energy",       "energy_grid_export_kwh",   "energy/grid_export_kwh",   "kWh", "energy", "total_increasing", None),
+    ("sensor", "energy_bat_charge_kwh",    "Battery Charge Energy",    "energy_bat_charge_kwh",    "energy/bat_charge_kwh",    "kWh", "energy", "total_increasing", None),
+    ("sensor", "energy_bat_discharge_kwh", "Battery Discharge Energy", "energy_bat_discharge_kwh", "energy/bat_discharge_kwh", "kWh", "energy", "total_increasing", None),
+    # ------- Boiler Energy (kWh) integrated -------
+    ("sensor", "energy_boiler_kwh",        "Boiler Energy",            "energy_boiler_kwh",        "energy/boiler_kwh",        "kWh", "energy", "total_increasing", None),
+    # -------- Denní součty a KPI (energy_stats.py; nový den = reset čítače) --------
+    ("sensor", "day_home_kwh",             "Home Energy Today",        "day_home_kwh",             "stats/day/home_kwh",        "kWh", "energy", "total_increasing", None),
+    ("sensor", "day_pv_kwh",               "PV Energy Today",          "day_pv_kwh",               "stats/day/pv_kwh",          "kWh", "energy", "total_increasing", None),
+    ("sensor", "day_grid_import_kwh",      "Grid Import Today",        "day_grid_import_kwh",      "stats/day/grid_import_kwh", "kWh", "energy", "total_increasing", None),
+    ("sensor", "day_grid_export_kwh",      "Grid Export Today",        "day_grid_export_kwh",      "stats/day/grid_export_kwh", "kWh", "energy", "total_increasing", None),
+    ("sensor", "day_boiler_kwh",           "Boiler Energy Today",      "day_boiler_kwh",           "stats/day/boiler_kwh",      "kWh", "energy", "total_increasing", None),
+    ("sensor", "day_self_consumption_pct", "Vlastní spotřeba FVE dnes", "day_self_consumption_pct", "stats/day/self_consumption_pct",   "%", None, "measurement", None),
+    ("sensor", "day_autarky_pct",          "Soběstačnost dnes",        "day_autarky_pct",          "stats/day/autarky_pct",            "%", None, "measurement", None),
+    ("sensor", "day_battery_eff_pct",      "Účinnost baterie dnes",    "day_battery_eff_pct",      "stats/day/battery_efficiency_pct", "%", None, "measurement", None),
+    ("sensor", "month_self_consumption_pct", "Vlastní spotřeba FVE měsíc", "month_self_consumption_pct", "stats/month/self_consumption_pct",   "%", None, "measurement", None),
+    ("sensor", "month_autarky_pct",        "Soběstačnost měsíc",       "month_autarky_pct",        "stats/month/autarky_pct",          "%", None, "measurement", None),
+    ("sensor", "month_battery_eff_pct",    "Účinnost baterie měsíc",   "month_battery_eff_pct",    "stats/month/battery_efficiency_pct", "%", None, "measurement", None),
+]
+
+# --- mapování polí store:change -> MQTT topicy + kanály integrátoru ---
+# cesty: vnořené "HW_INFO.Consumption[0]" i plochý klíč "HW_INFO.Consumption.0" (Infigy posílá obojí)
+_BOILER_PHASES = ("HW_INFO.Consumption.0", "HW_INFO.Consumption.1", "HW_INFO.Consumption.2")
+_HOME_PHASES   = ("EM_INFO_Consumption.0", "EM_INFO_Consumption.1", "EM_INFO_Consumption.2")
+# politika throttle pro živé hodnoty: W, °C, kW
+_W  = {"min_interval_s": PUB_INTERVAL_S, "deadband": PUB_DEADBAND_W, "agg": PUB_AGG}
+_C  = {"min_interval_s": PUB_INTERVAL_S, "deadband": PUB_DEADBAND_C, "agg": PUB_AGG}
+_KW = {"min_interval_s": PUB_INTERVAL_S, "deadband": PUB_DEADBAND_W / 1000.0, "agg": PUB_AGG}
+FIELD_RULES = [
+    # Teplota bojleru (°C)
+    FieldRule("HW_TEMP", "boiler/temperature", digits=2, **_C),
+    # Příkon bojleru po fázích (kW -> W) + celkem
+    FieldRule(_BOILER_PHASES[0], "boiler/power_w/phase1", scale=1000.0, digits=1, **_W),
+    FieldRule(_BOILER_PHASES[1], "boiler/power_w/phase2", scale=1000.0, digits=1, **_W),
+    FieldRule(_BOILER_PHASES[2], "boiler/power_w/phase3", scale=1000.0, digits=1, **_W),
+    FieldRule(_BOILER_PHASES, "boiler/power_w/total", transform="sum", scale=1000.0, digits=1, integrate="boiler_total", **_W),
+    # Stavové příznaky – jen změny (jinak QoS1 retained s každou událostí)
+    FieldRule("HW_INFO.Status", "boiler/status", transform="str", qos=1, change_only=True),
+    FieldRule("HW_INFO.Surplus", "boiler/surplus_active", transform="bool01", qos=1, change_only=True),
+    FieldRule("HW_INFO.Err", "boiler/error", transform="bool01", qos=1, change_only=True),
+    # SOC battery
+    FieldRule("PV_ACTUAL_SOC", "battery/soc", digits=1, qos=1, min_interval_s=PUB_INTERVAL_S),
+    # FVE (kW -> W)
+    FieldRule("PV_ACTUAL_POWER", "pv/power_w", scale=1000.0, digits=1, integrate="pv", **_W),
+    # baterie kW (kladné = charge, záporné = discharge)
+    FieldRule("PV_ACTUAL_POWER_BATTERY", "battery/power_w", scale=1000.0, digits=1,
+              integrate=("bat_charge", "bat_discharge"), **_W),
+    # síť kW (+ export, - import)
+    FieldRule("SURPLUS_INFO_TOTAL", "grid/surplus_total_kw", digits=4,
+              integrate=("grid_export", "grid_import"), integrate_scale=1000.0, **_KW),
+    # Dům – po fázích (kW -> W) + celkem
+    FieldRule(_HOME_PHASES[0], "home/power_w/phase1", scale=1000.0, digits=1, **_W),
+    FieldRule(_HOME_PHASES[1], "home/power_w/phase2", scale=1000.0, digits=1, **_W),
+    FieldRule(_HOME_PHASES[2], "home/power_w/phase3", scale=1000.0, digits=1, **_W),
+    FieldRule(_HOME_PHASES, "home/power_w/total", transform="sum", scale=1000.0, digits=1, integrate="home", **_W),
+]
 
+# --- Socket.IO ---
+WS_CODEC, _codec_opts = ws_codec.client_options(WS_CODEC)
 
-def load_energy_state():
-    try:
-        with open(ENERGY_STATE_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                energy_totals.update({k: float(v) for k, v in data.items() if k in energy_totals})
-    except FileNotFoundError:
-        pass
-    except Exception as e:
-        print("ENERGY STATE load error:", e)
 
-def save_energy_state():
-    try:
-        tmp_path = ENERGY_STATE_PATH + ".tmp"
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(energy_totals, f, ensure_ascii=False)
-        os.replace(tmp_path, ENERGY_STATE_PATH)
-    except Exception as e:
-        print("ENERGY STATE save error:", e)
+def _dev_path(path, name):
+    """Stavový soubor pojmenovaného zařízení: energy_state.json -> energy_state_<name>.json."""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{name}{ext}"
 
-# ---------- MQTT Discovery ----------
-def _disc_topic(domain: str, object_id: str) -> str:
-    return f"{DISCOVERY_PREFIX}/{domain}/{DEVICE_ID}/{object_id}/config"
 
-def _disc_device():
-    return {
-        "identifiers": [DEVICE_ID],
-        "manufacturer": "PavlosDr",
-        "model": "Infigy WS>>MQTT Bridge",
-        "name": "Infigy",
-        "sw_version": SW_VERSION,
-    }
+class InfigyDevice:
+    """
+    Jeden Infigy box: vlastní Socket.IO session, namespace entit (DEVICE_ID,
+    ENTITY_PREFIX, topicy pod <MQTT_BASE>/<name>/), integrátor, žurnál,
+    statistiky a throttle živých hodnot. MQTT kanál, spool a discovery
+    registr jsou společné pro všechna zařízení procesu, stejně jako vlákna
+    watchdogu, heartbeatu a throttle – zařízení navíc stojí jen pár kB stavu
+    (a vlákna samotného socketio.Client; s INFIGY_RUNTIME=asyncio ani ta ne).
+    """
 
-def _oid(suffix: str) -> str:
-    # Build a stable, lowercase, underscore-only object_id
-    # Final entity_id becomes: <domain>.<object_id>
-    return f"{ENTITY_PREFIX}_{suffix}".lower()
-
-def publish_discovery():
-    dev = _disc_device()
-    # Home Assistant will create
-    # entities with deterministic entity_id based on `object_id` (domain.object_id),
-    # independent of the display `name`.
-    cfgs = [
-        # -------- Živé výkonové a teplotní senzory --------
-        ("sensor", _oid("boiler_temperature"), {
-            #"object_id": _oid("boiler_temperature"),
-            "default_entity_id": f"sensor.{_oid('boiler_temperature')}",
-            "name": "Boiler aktuální teplota",
-            "unique_id": f"{DEVICE_ID.lower()}_boiler_temperature",
-            "state_topic": f"{MQTT_BASE}/boiler/temperature",
-            "unit_of_measurement": "°C",
-            "device_class": "temperature",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        # ------- Boiler per-phase power (W) + total -------
-        ("sensor", _oid("boiler_power_w_phase1"), {
-            #"object_id": _oid("boiler_power_w_phase1"),
-            "default_entity_id": f"sensor.{_oid('boiler_power_w_phase1')}",
-            "name": "Boiler aktuální odběr fáze 1",
-            "unique_id": f"{DEVICE_ID.lower()}_boiler_power_w_phase1",
-            "state_topic": f"{MQTT_BASE}/boiler/power_w/phase1",
-            "unit_of_measurement": "W",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("boiler_power_w_phase2"), {
-            #"object_id": _oid("boiler_power_w_phase2"),
-            "default_entity_id": f"sensor.{_oid('boiler_power_w_phase2')}",
-            "name": "Boiler aktuální odběr fáze 2",
-            "unique_id": f"{DEVICE_ID.lower()}_boiler_power_w_phase2",
-            "state_topic": f"{MQTT_BASE}/boiler/power_w/phase2",
-            "unit_of_measurement": "W",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("boiler_power_w_phase3"), {
-            #"object_id": _oid("boiler_power_w_phase3"),
-            "default_entity_id": f"sensor.{_oid('boiler_power_w_phase3')}",
-            "name": "Boiler aktuální odběr fáze 3",
-            "unique_id": f"{DEVICE_ID.lower()}_boiler_power_w_phase3",
-            "state_topic": f"{MQTT_BASE}/boiler/power_w/phase3",
-            "unit_of_measurement": "W",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("boiler_power_w_total"), {
-            #"object_id": _oid("boiler_power_w_total"),
-            "default_entity_id": f"sensor.{_oid('boiler_power_w_total')}",
-            "name": "Boiler aktuální odběr",
-            "unique_id": f"{DEVICE_ID.lower()}_boiler_power_w_total",
-            "state_topic": f"{MQTT_BASE}/boiler/power_w/total",
-            "unit_of_measurement": "W",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("home_power_w"), {
-            #"object_id": _oid("home_power_w"),
-            "default_entity_id": f"sensor.{_oid('home_power_w')}",
-            "name": "Spotřeba domu",
-            "unique_id": f"{DEVICE_ID.lower()}_home_power",
-            "state_topic": f"{MQTT_BASE}/home/power_w/total",
-            "unit_of_measurement": "W",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("battery_power_w"), {
-            #"object_id": _oid("battery_power_w"),
-            "default_entity_id": f"sensor.{_oid('battery_power_w')}",
-            "name": "Baterie",
-            "unique_id": f"{DEVICE_ID.lower()}_battery_power",
-            "state_topic": f"{MQTT_BASE}/battery/power_w",
-            "unit_of_measurement": "W",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("grid_surplus_kw"), {
-            #"object_id": _oid("grid_surplus_kw"),
-            "default_entity_id": f"sensor.{_oid('grid_surplus_kw')}",
-            "name": "Síť",
-            "unique_id": f"{DEVICE_ID.lower()}_grid_surplus_kw",
-            "state_topic": f"{MQTT_BASE}/grid/surplus_total_kw",
-            "unit_of_measurement": "kW",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("pv_power_w"), {
-            #"object_id": _oid("pv_power_w"),
-            "default_entity_id": f"sensor.{_oid('pv_power_w')}",
-            "name": "FVE",
-            "unique_id": f"{DEVICE_ID.lower()}_pv_power",
-            "state_topic": f"{MQTT_BASE}/pv/power_w",
-            "unit_of_measurement": "W",
-            "device_class": "power",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("sensor", _oid("battery_soc"), {
-            #"object_id": _oid("battery_soc"),
-            "default_entity_id": f"sensor.{_oid('battery_soc')}",
-            "name": "Stav baterie",
-            "unique_id": f"{DEVICE_ID.lower()}_battery_soc",
-            "state_topic": f"{MQTT_BASE}/battery/soc",
-            "unit_of_measurement": "%",
-            "device_class": "battery",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-
-        # -------- Health --------
-        ("sensor", _oid("bridge_last_event_age_s"), {
-            #"object_id": _oid("bridge_last_event_age_s"),
-            "default_entity_id": f"sensor.{_oid('bridge_last_event_age_s')}",
-            "name": "Infigy doba od poslední události",
-            "unique_id": f"{DEVICE_ID.lower()}_last_event_age",
-            "state_topic": f"{MQTT_BASE}/bridge/last_event_age_s",
-            "unit_of_measurement": "s",
-            "device_class": "duration",
-            "state_class": "measurement",
-            "device": dev,
-        }),
-        ("binary_sensor", _oid("bridge_online"), {
-            #"object_id": _oid("bridge_online"),
-            "default_entity_id": f"sensor.{_oid('bridge_online')}",
-            "name": "Infigy bridge online",
-            "unique_id": f"{DEVICE_ID.lower()}_bridge_online",
-            "state_topic": f"{MQTT_BASE}/bridge/online",
-            "payload_on": "1",
-            "payload_off": "0",
-            "device": dev,
-        }),
-        ("binary_sensor", _oid("ws_flow_ok"), {
-            #"object_id": _oid("ws_flow_ok"),
-            "default_entity_id": f"sensor.{_oid('ws_flow_ok')}",
-            "name": "Infigy poskytuje data",
-            "unique_id": f"{DEVICE_ID.lower()}_ws_flow_ok",
-            "state_topic": f"{MQTT_BASE}/bridge/ws_flow_ok",
-            "payload_on": "1",
-            "payload_off": "0",
-            "device_class": "connectivity",
-            # (volitelné) dostupnost podle LWT
-            "availability_topic": f"{MQTT_BASE}/bridge/online",
-            "payload_available": "1",
-            "payload_not_available": "0",
-            "device": dev,
-        }),
-
-        # -------- Integrované energie (kWh) --------
-        ("sensor", _oid("energy_home_kwh"), {
-            #"object_id": _oid("energy_home_kwh"),
-            "default_entity_id": f"sensor.{_oid('energy_home_kwh')}",
-            "name": "Home Energy",
-            "unique_id": f"{DEVICE_ID.lower()}_energy_home_kwh",
-            "state_topic": f"{MQTT_BASE}/energy/home_kwh",
-            "unit_of_measurement": "kWh",
-            "device_class": "energy",
-            "state_class": "total_increasing",
-            "device": dev,
-        }),
-            ("sensor", _oid("energy_pv_kwh"), {
-            #"object_id": _oid("energy_pv_kwh"),
-            "default_entity_id": f"sensor.{_oid('energy_pv_kwh')}",
-            "name": "PV Energy",
-            "unique_id": f"{DEVICE_ID.lower()}_energy_pv_kwh",
-            "state_topic": f"{MQTT_BASE}/energy/pv_kwh",
-            "unit_of_measurement": "kWh",
-            "device_class": "energy",
-            "state_class": "total_increasing",
-            "device": dev,
-        }),
-        ("sensor", _oid("energy_grid_import_kwh"), {
-            #"object_id": _oid("energy_grid_import_kwh"),
-            "default_entity_id": f"sensor.{_oid('energy_grid_import_kwh')}",
-            "name": "Grid Import Energy",
-            "unique_id": f"{DEVICE_ID.lower()}_energy_grid_import_kwh",
-            "state_topic": f"{MQTT_BASE}/energy/grid_import_kwh",
-            "unit_of_measurement": "kWh",
-            "device_class": "energy",
-            "state_class": "total_increasing",
-            "device": dev,
-        }),
-        ("sensor", _oid("energy_grid_export_kwh"), {
-            #"object_id": _oid("energy_grid_export_kwh"),
-            "default_entity_id": f"sensor.{_oid('energy_grid_export_kwh')}",
-            "name": "Grid Export Energy",
-            "unique_id": f"{DEVICE_ID.lower()}_energy_grid_export_kwh",
-            "state_topic": f"{MQTT_BASE}/energy/grid_export_kwh",
-            "unit_of_measurement": "kWh",
-            "device_class": "energy",
-            "state_class": "total_increasing",
-            "device": dev,
-        }),
-        ("sensor", _oid("energy_bat_charge_kwh"), {
-            #"object_id": _oid("energy_bat_charge_kwh"),
-            "default_entity_id": f"sensor.{_oid('energy_bat_charge_kwh')}",
-            "name": "Battery Charge Energy",
-            "unique_id": f"{DEVICE_ID.lower()}_energy_bat_charge_kwh",
-            "state_topic": f"{MQTT_BASE}/energy/bat_charge_kwh",
-            "unit_of_measurement": "kWh",
-            "device_class": "energy",
-            "state_class": "total_increasing",
-            "device": dev,
-        }),
-        ("sensor", _oid("energy_bat_discharge_kwh"), {
-            #"object_id": _oid("energy_bat_discharge_kwh"),
-            "default_entity_id": f"sensor.{_oid('energy_bat_discharge_kwh')}",
-            "name": "Battery Discharge Energy",
-            "unique_id": f"{DEVICE_ID.lower()}_energy_bat_discharge_kwh",
-            "state_topic": f"{MQTT_BASE}/energy/bat_discharge_kwh",
-            "unit_of_measurement": "kWh",
-            "device_class": "energy",
-            "state_class": "total_increasing",
-            "device": dev,
-        }),
-        # ------- Boiler Energy (kWh) integrated -------
-        ("sensor", _oid("energy_boiler_kwh"), {
-            #"object_id": _oid("energy_boiler_kwh"),
-            "default_entity_id": f"sensor.{_oid('energy_boiler_kwh')}",
-            "name": "Boiler Energy",
-            "unique_id": f"{DEVICE_ID.lower()}_energy_boiler_kwh",
-            "state_topic": f"{MQTT_BASE}/energy/boiler_kwh",
-            "unit_of_measurement": "kWh",
-            "device_class": "energy",
-            "state_class": "total_increasing",
-            "device": dev,
-        }),
-    ]
-
-    for domain, object_id, payload in cfgs:
-        topic = _disc_topic(domain, object_id)
-        mqttc.publish(topic, json.dumps(payload, ensure_ascii=False), qos=1, retain=True)
-
-    # Notes:
-    # - entity_id will be stable: e.g. sensor.infigy_boiler_temperature, binary_sensor.infigy_bridge_online, ...
-    # - You can change ENTITY_PREFIX via .env to namespace multiple bridges.
-
-# --- MQTT callbacks ---
-# v2 i v1 kompatibilní on_connect - zamezí error v rozdílném počtu parametrů
-def _normalize_code(raw):
-    code = getattr(raw, "value", raw)
-    try: return int(code)
-    except: return 0
-
-def on_connect(client, userdata, *args, **kwargs):
-    # v2: (flags, reason_code, properties) / v1: (flags, rc)
-    raw = kwargs.get("reason_code", kwargs.get("rc",0))
-    # properties = args[2] if len(args) > 2 else kwargs.get("properties")
-    if len(args) > 1:
-        raw = args[1]
-    code = _normalize_code(raw)
-    print(f"MQTT connected rc={code}")
-    if code == 0:
-        publish("bridge/online", "1", retain=True, qos=1)
+    def __init__(self, name):
+        self.name = name
+        legacy = name == "default"
+
+        def env(key, default):
+            return default if legacy else os.getenv(f"INFIGY_{name.upper()}_{key}", default)
+
+        def path(p):
+            return p if legacy else _dev_path(p, name)
+
+        self.prefix = "" if legacy else f"{name}/"
+        self.tag = "infigy_ws_to_mqtt" if legacy else f"infigy_ws_to_mqtt[{name}]"
+        self.host = env("HOST", INFIGY_HOST)
+        self.socket_path = env("SOCKET_PATH", SOCKET_PATH)
+        self.device_id = env("DEVICE_ID", DEVICE_ID if legacy else f"{DEVICE_ID}_{name}")
+        self.entity_prefix = env("ENTITY_PREFIX", ENTITY_PREFIX if legacy else f"{ENTITY_PREFIX}_{name}")
+        self.record_path = env("RECORD_PATH", RECORD_PATH if legacy else "")
+        # --- connect options for Socket.IO ---
+        self.headers = {}
+        cookie = env("AUTH_COOKIE", AUTH_COOKIE).strip()
+        bearer = env("AUTH_BEARER", AUTH_BEARER).strip()
+        if cookie:
+            self.headers["Cookie"] = cookie
+        if bearer:
+            self.headers["Authorization"] = f"Bearer {bearer}"
+
+        self.last_event_ts = time.monotonic()   # heartbeat for WS payloads
+        self.current_power = dict.fromkeys(CHANNELS, 0.0)   # aktuální výkony (W)
+        self.energy_totals = dict.fromkeys(CHANNELS, 0.0)   # integrované energie (kWh)
+        self.journal = EnergyJournal(path(ENERGY_STATE_PATH), path(ENERGY_JOURNAL_PATH), CHANNELS,
+                                     fsync_interval_s=ENERGY_FSYNC_INTERVAL_S,
+                                     max_bytes=ENERGY_JOURNAL_MAX_KB * 1024)
+        self.stats = EnergyStats(CHANNELS, path(ENERGY_STATS_PATH))
+        # integrátor energií (přesně mezi časy událostí, viz energy_acc.py)
+        self.energy = EnergyAccumulator(self.current_power, self.energy_totals, method=ENERGY_INTEGRATION,
+                                        gap_mode=ENERGY_GAP_MODE, max_hold_s=ENERGY_MAX_HOLD_S)
+        self._event_power = {}   # výkony z právě zpracovávané události
+        self._lock = threading.Lock()   # událost vs. ruční změna čítače (příkaz z MQTT) vs. close()
+        self.closed = False   # po close() se události zahazují (žurnál je uzavřený)
+        self._energy_pub_ts = self._energy_save_ts = self._stats_save_ts = time.monotonic()
+        self._energy_sent = {}   # topic -> naposledy publikovaná hodnota energií/statistik (retained)
+        self.mapper = FieldMapper(FIELD_RULES, lambda topic, v, qos, retain: self.publish(topic, v, retain=retain, qos=qos),
+                                  self._set_power)
+        self.backoff = Backoff(WS_BACKOFF_BASE_S, WS_BACKOFF_MAX_S)
+        self.health = StallDetector(k=WS_STALL_K, min_s=WS_STALL_MIN_S, max_s=HEARTBEAT_MAX_AGE_S,
+                                    alpha=WS_EWMA_ALPHA, backoff=self.backoff)
+        self.recorder = None   # EventRecorder, zapne start() podle INFIGY_RECORD_PATH
+        self.sio = None        # socketio.Client / AsyncClient podle runtime
+
+    # --- helpers ---
+    def touch(self):
+        self.last_event_ts = time.monotonic()
+        self.health.on_event(self.last_event_ts)
+
+    def publish(self, topic_suffix, payload, retain=True, qos=None):
+        # Bezpecny publish s odchytem vyjimek; offline jde zprava do bufferu (dostupnost jen zive)
+        cls = "availability" if topic_suffix == "bridge/online" else "state"
+        chan.publish(self.prefix + topic_suffix, payload, retain=retain, qos=qos, cls=cls)
+
+    def load_energy_state(self):
+        # snapshot + přehrání konce žurnálu (poslední záznam s platným CRC)
         try:
-            publish_discovery() # auto discovery po připojení
+            self.energy_totals.update(self.journal.load())
         except Exception as e:
-            print(f"publish_discovery() failed: {e}")
-        connected.set()
-
-def on_disconnect(client, userdata, *args, **kwargs):
-    # v2: (reason_code, properties) / v1: (rc)
-    raw = kwargs.get("reason_code", kwargs.get("rc", -1))
-    if len(args) > 0:
-        raw = args[0]
-    code = _normalize_code(raw)
-    print(f"MQTT disconnected rc={code}")
-    connected.clear()
+            print(f"ENERGY STATE load error ({self.name}):", e)
+        self.stats.load()
+        self.stats.update(self.energy_totals)   # energie z doby výpadku -> aktuální perioda
 
-mqttc.on_connect = on_connect
-mqttc.on_disconnect = on_disconnect
+    def save_energy_state(self, final=False):
+        # append záznamu do žurnálu; při ukončení kompakce do snapshotu
+        try:
+            if final:
+                self.journal.close(self.energy.snapshot())
+                self.stats.save()
+            else:
+                self.journal.append(self.energy.snapshot())
+        except Exception as e:
+            print(f"ENERGY STATE save error ({self.name}):", e)
+
+    def set_energy(self, values):
+        """
+        Ruční nastavení čítačů {kanál: kWh} (oprava po výměně boxu apod.):
+        integrátor, výchozí bod statistik i snapshot žurnálu najednou pod
+        zámkem událostí, takže rozdíl nespadne do hodinových/denních součtů.
+        """
+        values = {k: float(v) for k, v in values.items()}
+        for k, v in values.items():
+            if k not in CHANNELS:
+                raise KeyError(f"unknown channel {k!r} ({', '.join(CHANNELS)})")
+            if v < 0:
+                raise ValueError(f"{k}: energy counter must be >= 0")
+        with self._lock:
+            old = {k: self.energy.set_total(k, v) for k, v in values.items()}
+            totals = self.energy.snapshot()
+            self.stats.rebase(totals)
+            self.journal.compact(totals)   # i snížení musí přežít restart (load bere maximum)
+        print(f"{self.tag}: energy counters set {values} (was {old})")
+        self.publish_energy()
+        return {"old": old, "new": values}
+
+    def stats_doc(self):
+        """Interní čítače pro příkaz cmd/stats."""
+        return {
+            "host": self.host,
+            "last_event_age_s": round(time.monotonic() - self.last_event_ts, 1),
+            "power_w": dict(self.current_power),
+            "energy_kwh": self.energy.snapshot(),
+            "integrator": dict(self.energy.counters),
+            "journal": dict(self.journal.counters),
+            "mapper": dict(self.mapper.counters),
+            "throttle": dict(self.mapper.throttle.counters),
+            "ws": self.health.stats(),
+            "recorded_events": self.recorder.events if self.recorder else None,
+        }
+
+    # ---------- MQTT Discovery ----------
+    def _disc_topic(self, domain: str, object_id: str) -> str:
+        return f"{DISCOVERY_PREFIX}/{domain}/{self.device_id}/{object_id}/config"
+
+    def _disc_device(self):
+        return {
+            "identifiers": [self.device_id],
+            "manufacturer": "PavlosDr",
+            "model": "Infigy WS>>MQTT Bridge",
+            "name": "Infigy" if not self.prefix else f"Infigy {self.name}",
+            "sw_version": SW_VERSION,
+        }
+
+    def _oid(self, suffix: str) -> str:
+        # Build a stable, lowercase, underscore-only object_id
+        # Final entity_id becomes: <domain>.<object_id>
+        return f"{self.entity_prefix}_{suffix}".lower()
+
+    def discovery_entities(self):
+        """
+        (config topic, payload) pro každou entitu tabulky. Home Assistant založí
+        entity s deterministickým entity_id podle `default_entity_id`
+        (např. sensor.infigy_boiler_temperature), nezávisle na zobrazovaném názvu.
+        Každé zařízení má vlastní DEVICE_ID a ENTITY_PREFIX.
+        """
+        dev = self._disc_device()
+        for domain, suffix, name, uid, topic, unit, dev_cla, stat_cla, extra in DISCOVERY_ENTITIES:
+            cfg = {
+                "default_entity_id": f"{domain}.{self._oid(suffix)}",
+                "name": name,
+                "unique_id": f"{self.device_id.lower()}_{uid}",
+                "state_topic": f"{MQTT_BASE}/{self.prefix}{topic}",
+            }
+            if unit:     cfg["unit_of_measurement"] = unit
+            if dev_cla:  cfg["device_class"] = dev_cla
+            if stat_cla: cfg["state_class"] = stat_cla
+            if domain == "binary_sensor":
+                cfg["payload_on"] = "1"
+                cfg["payload_off"] = "0"
+            if extra:    cfg.update(extra)
+            cfg["device"] = dev
+            yield self._disc_topic(domain, self._oid(suffix)), cfg
+
+    # --- MQTT callback ---
+    def on_connect(self):
+        self.mapper.reset()   # po reconnectu poslat aktuální hodnoty i v deadbandu
+        self._energy_sent.clear()
+        if self.prefix:       # "bridge/online" výchozího zařízení je LWT kanálu
+            self.publish("bridge/online", "1", retain=True, qos=1)
+
+    # --- Socket.IO handlery ---
+    def on_ws_connect(self):
+        print(f"{self.tag}: connected")
+        self.health.on_connect(time.monotonic())
+        if self.recorder:
+            self.recorder.write("connect")
+
+    def on_ws_disconnect(self, *args):
+        print(f"{self.tag}: disconnected")
+        self.health.on_disconnect(time.monotonic())
+        if self.recorder:
+            self.recorder.write("disconnect")
+        self.energy.gap()
+
+    def on_ws_connect_error(self, msg):
+        print(f"{self.tag} connect_error:", msg)
+
+    def on_store_change(self, data):
+        if self.recorder:
+            self.recorder.write("store:change", data)
+        self.touch()
+        self.handle_store_change(data)
+
+    def bind(self, client):
+        for event, handler in (("connect", self.on_ws_connect), ("disconnect", self.on_ws_disconnect),
+                               ("connect_error", self.on_ws_connect_error), ("store:change", self.on_store_change)):
+            client.on(event, handler)
+        self.sio = client
+        return client
+
+    # --- mapování a energie ---
+    def _set_power(self, channel, watts):
+        self._event_power[channel] = float(watts)
+
+    def _publish_changed(self, topic_suffix, value):
+        # retained hodnota se znovu neposílá, dokud se (po zaokrouhlení) nezmění
+        if self._energy_sent.get(topic_suffix) == value:
+            return
+        self._energy_sent[topic_suffix] = value
+        self.publish(topic_suffix, value, retain=True, qos=1)
+
+    def publish_energy(self):
+        """Čítače a aktuální periody statistik – jen změněné hodnoty (uzavřené periody viz publish_stats)."""
+        totals = self.energy.snapshot()
+        for key, name in ENERGY_TOPICS.items():
+            self._publish_changed(f"energy/{name}", round(totals[key], 6))
+        for g in GRANULARITIES:
+            self.publish_stats(g)
+
+    def publish_stats(self, granularity, back=0):
+        """Aktuální perioda po hodnotách; uzavřená (back=1) jako jeden JSON stats/<g>/last."""
+        key, kwh, kpi = self.stats.period(granularity, back)
+        if not key:
+            return
+        if back:
+            doc = {"period": key,
+                   "kwh": {ENERGY_TOPICS.get(k, k): round(v, 4) for k, v in kwh.items()},
+                   "kpi": {k: (round(v, 1) if v is not None else None) for k, v in kpi.items()}}
+            self.publish(f"stats/{granularity}/last", json.dumps(doc, separators=(",", ":")), retain=True, qos=1)
+            return
+        self._publish_changed(f"stats/{granularity}/period", key)
+        for k, v in kwh.items():
+            self._publish_changed(f"stats/{granularity}/{ENERGY_TOPICS.get(k, k)}", round(v, 4))
+        for k, v in kpi.items():
+            if v is not None:
+                self._publish_changed(f"stats/{granularity}/{k}_pct", round(v, 1))
+
+    def handle_store_change(self, data, ts=None, wall=None):
+        """Zpracování jedné události; ts (monotonic) a wall (unix) dodá replay ze záznamu."""
+        ts = time.monotonic() if ts is None else ts
+        try:
+            with self._lock:
+                if self.closed:
+                    return
+                self._event_power.clear()
+                self.mapper.handle(data.get("payload", {}) or {}, ts)
+                # i událost bez výkonů posune integraci (a potvrdí, že stream žije)
+                self.energy.apply(self._event_power, ts)
+                closed = self.stats.update(self.energy.snapshot(), wall)
+                for g, _ in closed:
+                    self.publish_stats(g, back=1)
+                if closed or ts - self._stats_save_ts >= ENERGY_STATS_SAVE_S:
+                    self._stats_save_ts = ts
+                    self.stats.save()
+                if ts - self._energy_save_ts >= ENERGY_JOURNAL_INTERVAL_S:
+                    self._energy_save_ts = ts
+                    self.save_energy_state()
+                if ts - self._energy_pub_ts >= ENERGY_PUBLISH_INTERVAL_S:
+                    self._energy_pub_ts = ts
+                    self.publish_energy()
+
+        #   diagnostické poslání vstupních dat osekaný na délku 800 znaků
+        #   publish("debug/last_payload", json.dumps(payload)[:800])  # omezíme délku
 
-# --- Socket.IO ---
-sio = socketio.Client(
-    reconnection=True, 
-    reconnection_attempts=0, 
-    logger=False, 
-    engineio_logger=False
-)
-
-@sio.event
-def connect():
-    print("infigy_ws_to_mqtt: connected")
-
-@sio.event
-def disconnect():
-    print("infigy_ws_to_mqtt: disconnected")
-
-@sio.event
-def connect_error(msg):
-    print("infigy_ws_to_mqtt connect_error:", msg)
-
-@sio.on("store:change")
-def on_store_change(data):
-    touch()
-    try:
-        payload = data.get("payload", {})
-        # Teplota bojleru (°C)
-        if "HW_TEMP" in payload:
-            publish("boiler/temperature", round(float(payload["HW_TEMP"]), 2), qos=0)
-
-        # Příkon bojleru po fázích (kW -> W) + celkem
-        p1 = p2 = p3 = None
-        hw_info = payload.get("HW_INFO") or {}
-        cons = hw_info.get("Consumption")
-        if isinstance(cons, (list, tuple)) and len(cons) >= 3:
-            p1, p2, p3 = (kw_to_w(cons[0]), kw_to_w(cons[1]), kw_to_w(cons[2]))
+        except Exception as e:
+            print(f"{self.tag} parse error:", e)
+            traceback.print_exc()
+
+    # --- watchdog + heartbeat ---
+    def ws_stalled(self):
+        # Reconnect WS, pokud store:change nepřišel déle než adaptivní práh (k × běžný interval)
+        now = time.monotonic()
+        if self.health.check(now):
+            print(f"WATCHDOG: no store:change for {now - self.last_event_ts:.0f}s "
+                  f"(threshold {self.health.threshold():.0f}s) >>> reconnect {self.tag}")
+            return True
+        return False
+
+    def heartbeat_tick(self):
+        # Publish last_event age in seconds for HA monitoring
+        age = int(time.monotonic() - self.last_event_ts)
+        self.publish("bridge/last_event_age_s", age, retain=True, qos=0)
+        # binární stav toku z infigy podle prahu HEARTBEAT_MAX_AGE_S
+        ws_ok = "1" if age < HEARTBEAT_MAX_AGE_S else "0"
+        self.publish("bridge/ws_flow_ok", ws_ok, retain=True, qos=0)
+        bs = chan.buffer.stats()   # fronta je společná všem zařízením
+        self.publish("bridge/buffer_depth", bs["depth"], retain=True, qos=0)
+        self.publish("bridge/buffer_dropped", bs["dropped"], retain=True, qos=0)
+        ws = self.health.stats()
+        self.publish("bridge/ws_reconnects", ws["reconnects"], retain=True, qos=0)
+        self.publish("bridge/ws_stalls", ws["stalls"], retain=True, qos=0)
+        self.publish("bridge/ws_downtime_s", round(ws["downtime_s"], 1), retain=True, qos=0)
+        if ws["ttfe_s"] is not None:
+            self.publish("bridge/ws_ttfe_s", ws["ttfe_s"], retain=True, qos=0)
+        if ws["interval_s"] is not None:
+            self.publish("bridge/ws_interval_ms", round(ws["interval_s"] * 1000.0, 1), retain=True, qos=0)
+        self.publish("bridge/ws_stall_threshold_s", round(ws["threshold_s"], 1), retain=True, qos=0)
+
+    # --- životní cyklus ---
+    def start(self):
+        print(f"CFG [{self.name}] INFIGY_HOST={self.host} SOCKET_PATH={self.socket_path} "
+              f"DEVICE_ID={self.device_id} TOPICS={MQTT_BASE}/{self.prefix}")
+        self.load_energy_state()
+        if self.record_path:
+            self.recorder = EventRecorder(self.record_path, RECORD_MAX_MB * 1024 * 1024)
+
+    def close(self):
+        # pod zámkem událostí: WS vlákno může být ještě uvnitř handle_store_change (mqtt_bridge_main)
+        with self._lock:
+            self.closed = True
+            self.save_energy_state(final=True)
+        if self.recorder:
+            self.recorder.close()
+
+    # reconnect řídí výhradně smyčka níž (Backoff s jitterem); vlastní reconnect socketio má
+    # pevné zpoždění bez jitteru, proto reconnection=False – wait() se pak vrátí po každém odpojení
+    def ws_loop(self):
+        client = self.bind(socketio.Client(reconnection=False, logger=False,
+                                           engineio_logger=False, **_codec_opts))
+        # WS loop – prefer pure websocket (more robust long-term)
+        while True:
+            try:
+                client.connect(self.host, socketio_path=self.socket_path, headers=self.headers,
+                               transports=["websocket"], wait_timeout=10)
+                client.wait()
+            except Exception as e:
+                print(f"{self.tag} connect error:", e)
+                traceback.print_exc()
+            # jitter + exponenciální růst; první událost po reconnectu backoff vynuluje
+            delay = self.backoff.next_delay()
+            print(f"{self.tag}: reconnect in {delay:.1f}s")
+            time.sleep(delay)
+
+    async def ws_loop_async(self):
+        client = self.bind(socketio.AsyncClient(reconnection=False, logger=False,
+                                                engineio_logger=False, handle_sigint=False, **_codec_opts))
+        while True:
+            try:
+                await client.connect(self.host, socketio_path=self.socket_path, headers=self.headers,
+                                     transports=["websocket"], wait_timeout=10)
+                await client.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{self.tag} connect error:", e)
+            delay = self.backoff.next_delay()
+            print(f"{self.tag}: reconnect in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def ws_watchdog_async(self):
+        while True:
+            await asyncio.sleep(self.health.poll_interval())
+            if self.ws_stalled() and self.sio is not None:
+                try:
+                    await self.sio.disconnect()
+                except Exception:
+                    pass
+
+
+devices = [InfigyDevice(name) for name in dict.fromkeys(INFIGY_DEVICES)]
+
+# hashe odeslaných konfigurací -> po reconnectu se posílají jen změny (viz ha_discovery.py)
+discovery = DiscoveryRegistry(DISCOVERY_STATE_PATH)
+
+def publish_discovery(force=False):
+    return discovery.sync(chan.publish_raw, force=force)
+
+# --- příkazy na <MQTT_BASE>/cmd/# (odpověď na <MQTT_BASE>/cmd_result/...) ---
+commands = CommandRouter(CMD_ACL, name="infigy CMD")
+
+def _device(args):
+    name = args.pop("device", None)
+    for dev in devices:
+        if name is None or dev.name == name:
+            return dev
+    raise KeyError(f"unknown device {name!r}")
+
+def _channel(name):
+    # kanál integrátoru nebo jméno topicu (pv_kwh, energy/pv_kwh)
+    name = name.rsplit("/", 1)[-1]
+    for key, topic in ENERGY_TOPICS.items():
+        if name in (key, topic):
+            return key
+    raise KeyError(f"unknown channel {name!r}")
+
+def cmd_energy_set(sub, args):
+    # cmd/energy/set/pv  "1234.5"  |  cmd/energy/set  {"pv": 1234.5, "home": 800}
+    dev = _device(args)
+    if sub:
+        values = {_channel(sub): args["value"]}
+    else:
+        values = {_channel(k): v for k, v in args.items()}
+    if not values:
+        raise ValueError("no channel given")
+    return dev.set_energy(values)
+
+def cmd_energy_reset(sub, args):
+    # cmd/energy/reset/pv  |  cmd/energy/reset/all
+    dev = _device(args)
+    target = sub or args.get("value", "")
+    keys = CHANNELS if target == "all" else (_channel(target),)
+    return dev.set_energy(dict.fromkeys(keys, 0.0))
+
+def cmd_discovery(sub, args):
+    return {"sent": publish_discovery(force=True), "counters": dict(discovery.counters)}
+
+def cmd_throttle(sub, args):
+    # cmd/throttle/pv/power_w {"interval_s": 10, "deadband": 20, "agg": "mean"}; "*" = všechny topicy s politikou
+    dev = _device(args)
+    throttle = dev.mapper.throttle
+    topic = sub or args.pop("topic", "*")
+    topics = [r.topic for r in FIELD_RULES if throttle.policy(r.topic)] if topic == "*" else [topic]
+    if topic != "*" and topic not in {r.topic for r in FIELD_RULES}:
+        raise KeyError(f"unknown topic {topic!r}")
+    interval = args.get("interval_s")
+    deadband = args.get("deadband")
+    agg = args.get("agg")
+    out = {}
+    for t in topics:
+        if interval is None and deadband is None and agg is None:
+            pol = throttle.policy(t)   # jen dotaz
         else:
-            # fallback na ploché klíče
-            if "HW_INFO.Consumption.0" in payload:
-                p1 = kw_to_w(payload.get("HW_INFO.Consumption.0", 0))
-                p2 = kw_to_w(payload.get("HW_INFO.Consumption.1", 0))
-                p3 = kw_to_w(payload.get("HW_INFO.Consumption.2", 0))
-
-        if all(v is not None for v in (p1, p2, p3)):
-            publish("boiler/power_w/phase1", round(p1, 1), qos=0)
-            publish("boiler/power_w/phase2", round(p2, 1), qos=0)
-            publish("boiler/power_w/phase3", round(p3, 1), qos=0)
-            total_w = round(p1 + p2 + p3, 1)
-            publish("boiler/power_w/total", total_w, qos=0)
-            current_power["boiler_total"] = float(total_w)
-
-        # Stavové příznaky
-        if "Status" in hw_info:
-            publish("boiler/status", str(hw_info["Status"]), qos=1)
-        if "Surplus" in hw_info:
-            publish("boiler/surplus_active", "1" if hw_info["Surplus"] else "0", qos=1)
-        if "Err" in hw_info:
-            publish("boiler/error", "1" if hw_info["Err"] else "0", qos=1)
-
-        # SOC battery
-        if "PV_ACTUAL_SOC" in payload:
-            publish("battery/soc", round(float(payload["PV_ACTUAL_SOC"]), 1), qos=1)
-
-        # Bonus metriky
-        if "PV_ACTUAL_POWER" in payload:           # kW
-            pv_w = round(kw_to_w(payload["PV_ACTUAL_POWER"]), 1)
-            publish("pv/power_w", pv_w, qos=0)
-            current_power["pv"] = float(pv_w)
-        if "PV_ACTUAL_POWER_BATTERY" in payload:   # kW (kladné = charge, záporné = discharge)
-            bat_w = round(kw_to_w(payload["PV_ACTUAL_POWER_BATTERY"]), 1)
-            publish("battery/power_w", bat_w, qos=0)
-            # rozdělení na charge/discharge
-            current_power["bat_charge"] = max(0.0, float(bat_w))
-            current_power["bat_discharge"] = max(0.0, -float(bat_w))
-        if "SURPLUS_INFO_TOTAL" in payload:        # kW (+ export, - import)
-            s_kw = round(float(payload["SURPLUS_INFO_TOTAL"]), 4)
-            publish("grid/surplus_total_kw", s_kw, qos=0)
-            # odvoď import/export ve W
-            if s_kw >= 0:
-                current_power["grid_export"] = float(s_kw) * 1000.0
-                current_power["grid_import"] = 0.0
-            else:
-                current_power["grid_import"] = float(-s_kw) * 1000.0
-                current_power["grid_export"] = 0.0
-
-        # Dům – po fázích (pokud Infigy posílá) (kW -> W)
-        if "EM_INFO_Consumption" in payload:
-            em = payload["EM_INFO_Consumption"]
-            if isinstance(em, (list, tuple)) and len(em) >= 3:
-                tot = em[0] + em[1] + em[2]
-                tot_w = round(kw_to_w(tot), 1)
-                publish("home/power_w/phase1", round(kw_to_w(em[0]), 1), qos=0)
-                publish("home/power_w/phase2", round(kw_to_w(em[1]), 1), qos=0)
-                publish("home/power_w/phase3", round(kw_to_w(em[2]), 1), qos=0)
-                publish("home/power_w/total", tot_w, qos=0)
-                current_power["home"] = float(tot_w)
-
-    #   diagnostické poslání vstupních dat osekaný na délku 800 znaků
-    #   publish(mqttc, "debug/last_payload", json.dumps(payload)[:800])  # omezíme délku
-    #   diagnostické poslání "1" bez prefixu MQTT_BASE pro lepší ladění
-    #   mqttc.publish("zzz_stream", "1", qos=0, retain=False)  # každá zpráva = tichý impulz
+            pol = throttle.tune(t, interval, deadband, agg)
+        out[t] = None if pol is None else {"interval_s": pol[0], "deadband": pol[1], "agg": pol[2]}
+    return out
 
+def cmd_stats(sub, args):
+    return {
+        "devices": {dev.name: dev.stats_doc() for dev in devices},
+        "buffer": chan.buffer.stats(),
+        "discovery": dict(discovery.counters),
+        "commands": dict(commands.counters),
+    }
+
+commands.register("energy/set", cmd_energy_set, "nastavit čítač kWh: energy/set/<kanál> <kWh> nebo {kanál: kWh}")
+commands.register("energy/reset", cmd_energy_reset, "vynulovat čítač: energy/reset/<kanál>|all")
+commands.register("discovery", cmd_discovery, "poslat znovu všechny discovery konfigurace")
+commands.register("throttle", cmd_throttle, "throttle/<topic> {interval_s, deadband, agg}; bez argumentů dotaz")
+commands.register("stats", cmd_stats, "interní čítače (integrátor, žurnál, throttle, WS, fronta)")
+
+# --- MQTT callback (kódy a v1/v2 kompatibilitu řeší mqtt_bridge) ---
+def on_connect(ch):
+    ch.publish("bridge/online", "1", retain=True, qos=1)
+    for dev in devices:
+        dev.on_connect()
+    try:
+        publish_discovery() # auto discovery po připojení
     except Exception as e:
-        print("infigy_ws_to_mqtt parse error:", e)
-        traceback.print_exc()
+        print(f"publish_discovery() failed: {e}")
+    connected.set()
+
+def on_disconnect(ch):
+    connected.clear()
 
-# --- background watchdogs + heartbeat ---
+# --- background watchdogs + heartbeat (jedno vlákno na úlohu pro všechna zařízení) ---
 def watchdog_ws():
-    # Reconnect WS if no payload for > 180 s
     while True:
-        try:
-            age = time.monotonic() - last_event_ts
-            if age > 180:
-                print("WATCHDOG: no store:change >180s >>> reconnect infigy_ws_to_mqtt")
-                try:
-                    sio.disconnect()
-                except Exception:
-                    pass
-            time.sleep(15)
-        except Exception as e:
-            print("WATCHDOG error:", e)
-            time.sleep(15)
+        for dev in devices:
+            try:
+                if dev.ws_stalled() and dev.sio is not None:
+                    try:
+                        dev.sio.disconnect()
+                    except Exception:
+                        pass
+            except Exception as e:
+                print("WATCHDOG error:", e)
+        time.sleep(min(d.health.poll_interval() for d in devices))
+
+def heartbeat_tick():
+    for dev in devices:
+        dev.heartbeat_tick()
 
 def publish_heartbeat():
-    # Publish last_event age in seconds for HA monitoring
     while True:
         try:
-            age = int(time.monotonic() - last_event_ts)
-            publish("bridge/last_event_age_s", age, retain=True, qos=0)
-            # binární stav toku z infigy podle prahu HEARTBEAT_MAX_AGE_S
-            ws_ok = "1" if age < HEARTBEAT_MAX_AGE_S else "0"
-            publish("bridge/ws_flow_ok", ws_ok, retain=True, qos=0)
+            heartbeat_tick()
         except Exception:
             pass
         time.sleep(30)
 
-#  Watchdog vlákno MQTT (automatický reconnect + obnova loopu)
-def _mqtt_watchdog_loop(stop_evt: threading.Event):
-    """
-    - Každých MQTT_WATCHDOG_INTERVAL_S ověří připojení.
-    - Pokud není připojeno, zkusí reconnect s exponenciálním backoffem (2..MAX s).
-    - Pokud by z nějakého důvodu neběželo loop_start() vlákno, znovu ho spustí.
-    """
-    backoff = 2
-    while not stop_evt.is_set():
-        try:
-            # 1) Když není připojeno → reconnect
-            if not mqttc.is_connected():
-                print(f"[MQTT-WD] Not connected >> reconnect() (backoff={backoff}s)")
-                try:
-                    mqttc.reconnect()
-                except Exception as e:
-                    print(f"[MQTT-WD] reconnect() failed: {e}")
-                else:
-                    backoff = 2  # po úspěchu reset backoffu
-
-            # 2) Pokud neběží vnitřní loop thread, znovu ho nastartuj
-            t = getattr(mqttc, "_thread", None)
-            if t is None or not getattr(t, "is_alive", lambda: False)():
-                # Pozn.: Paho bez problémů snese opakované volání loop_start()
-                try:
-                    mqttc.loop_start()
-                    print("[MQTT-WD] loop_start() ensured")
-                except Exception as e:
-                    print(f"[MQTT-WD] loop_start() failed: {e}")
-
-            # 3) Jemný backoff, pokud stále odpojeno
-            if not mqttc.is_connected():
-                stop_evt.wait(min(backoff, MQTT_RECONNECT_BACKOFF_MAX_S))
-                backoff = min(backoff * 2, MQTT_RECONNECT_BACKOFF_MAX_S)
-            else:
-                stop_evt.wait(MQTT_WATCHDOG_INTERVAL_S)
-        except Exception as e:
-            print(f"[MQTT-WD] Unexpected error: {e}")
-            stop_evt.wait(MQTT_WATCHDOG_INTERVAL_S)
-
-# --- integrátor energií (trapézová aproximace) ---
+def flush_throttles(now=None):
+    # trailing edge / konec agregačního okna throttle živých hodnot
+    for dev in devices:
+        dev.mapper.throttle.flush_due(now)
 
-def energy_integrator():
-    load_energy_state()
-    last_t = time.monotonic()
-    last_p = current_power.copy() # W
-    pub_timer = 0.0
-    while True:
+def run_throttle(stop_evt, tick_s=0.25):
+    while not stop_evt.wait(tick_s):
         try:
-            time.sleep(INTEGRATOR_TICK_S)
-            now = time.monotonic()
-            dt = now - last_t # s
-            if dt <= 0:
-                last_t = now
-                continue
-
-            # trapézová integrace pro každý kanál
-            for key, p_curr in current_power.items():
-                p_prev = float(last_p.get(key, 0.0))
-                # Wh = (P_prev + P_curr)/2 * dt[h]
-                wh = (p_prev + float(p_curr)) / 2.0 * (dt / 3600.0)
-                kwh = wh / 1000.0
-                if kwh > 0:
-                    energy_totals[key] = float(energy_totals.get(key, 0.0)) + kwh
-            # posun stavů
-            last_p = current_power.copy()
-            last_t = now
-
-            # periodické publikování a persist
-            pub_timer += dt
-            if pub_timer >= ENERGY_PUBLISH_INTERVAL_S:
-                pub_timer = 0.0
-                publish("energy/home_kwh", round(energy_totals["home"], 6), retain=True, qos=1)
-                publish("energy/pv_kwh", round(energy_totals["pv"], 6), retain=True, qos=1)
-                publish("energy/grid_import_kwh", round(energy_totals["grid_import"], 6), retain=True, qos=1)
-                publish("energy/grid_export_kwh", round(energy_totals["grid_export"], 6), retain=True, qos=1)
-                publish("energy/bat_charge_kwh", round(energy_totals["bat_charge"], 6), retain=True, qos=1)
-                publish("energy/bat_discharge_kwh", round(energy_totals["bat_discharge"], 6), retain=True, qos=1)
-                publish("energy/boiler_kwh", round(energy_totals["boiler_total"], 6), retain=True, qos=1)
-                save_energy_state()
+            flush_throttles()
         except Exception as e:
-            print("ENERGY integrator error:", e)
-            time.sleep(2)
+            print("THROTTLE flush error:", e)
 
-# --- connect options for Socket.IO ---
-EXTRA_HEADERS = {}
-if AUTH_COOKIE:
-    EXTRA_HEADERS["Cookie"] = AUTH_COOKIE
-if AUTH_BEARER:
-    EXTRA_HEADERS["Authorization"] = f"Bearer {AUTH_BEARER}"
+def close_devices():
+    for dev in devices:
+        dev.close()
 
-print(f"CFG INFIGY_HOST={INFIGY_HOST} SOCKET_PATH={SOCKET_PATH}")
-print(f"CFG MQTT_HOST={MQTT_HOST}:{MQTT_PORT} USER={'set' if MQTT_USER else 'none'}")
-print(f"CFG MQTT_BASE={MQTT_BASE} DEVICE_ID={DEVICE_ID}")
+def publish_offline():
+    # řádné ukončení: dostupnost "0" (LWT kanálu platí jen při pádu spojení); před bridge.stop()
+    if chan is None:
+        return
+    try:
+        chan.publish("bridge/online", "0", retain=True, qos=1)
+        for dev in devices:
+            if dev.prefix:
+                dev.publish("bridge/online", "0", retain=True, qos=1)
+    except Exception as e:
+        print("publish offline failed:", e)
 
 
-def main():
-    # MQTT connect
-    mqttc.connect(MQTT_HOST, MQTT_PORT, keepalive=60)
-    mqttc.loop_start()
+def attach(bridge):
+    """Zaregistruje bridge na sdíleném MQTT klientovi (samostatně i v mqtt_bridge_main.py)."""
+    global chan
+    chan = bridge.channel(MQTT_BASE, MQTT_SPOOL_PATH, on_connect=on_connect, on_disconnect=on_disconnect)
+    discovery.set_entities(e for dev in devices for e in dev.discovery_entities())
+    # restart HA (birth "online") -> poslat všechny konfigurace znovu
+    chan.subscribe(HA_STATUS_TOPIC, discovery.on_ha_status(chan.publish_raw))
+    commands.attach(chan)
+    return chan
+
+def run():
+    print(f"CFG MQTT_BASE={MQTT_BASE} WS_CODEC={WS_CODEC} DEVICES={','.join(d.name for d in devices)}")
 
     # Počkej max 5 s na připojení (jinak to zkusíme dál – WS poběží a MQTT se připojí později)
     if not connected.wait(5):
        print("MQTT not connected yet; will publish after connect() callback.")
-    
-    # Start MQTT watchdogu
-    stop_evt = threading.Event()
-    threading.Thread(target=_mqtt_watchdog_loop, args=(stop_evt,), daemon=True).start()
+
+    for dev in devices:
+        dev.start()
 
     # start background vlákna
     threading.Thread(target=watchdog_ws, daemon=True).start()
     threading.Thread(target=publish_heartbeat, daemon=True).start()
-    threading.Thread(target=energy_integrator, daemon=True).start()
+    threading.Thread(target=run_throttle, args=(threading.Event(),), name="pub-throttle", daemon=True).start()
+
+    # WS smyčka prvního zařízení v tomto vlákně, ostatní ve vlastních
+    for dev in devices[1:]:
+        threading.Thread(target=dev.ws_loop, name=f"infigy-{dev.name}", daemon=True).start()
+    devices[0].ws_loop()
+
 
-    # WS loop – prefer pure websocket (more robust long-term)
+# --- asyncio runtime (INFIGY_RUNTIME=asyncio) ---
+async def _every(interval_s, fn, name):
     while True:
         try:
-            sio.connect(
-                INFIGY_HOST,
-                socketio_path=SOCKET_PATH,
-                headers=EXTRA_HEADERS,
-                transports=["websocket"],
-                wait_timeout=10
-            )
-            sio.wait()
+            fn()
         except Exception as e:
-            print("infigy_ws_to_mqtt connect error:", e)
-            traceback.print_exc()
-            time.sleep(5)
+            print(f"{name} error:", e)
+        await asyncio.sleep(interval_s)
+
+async def run_async(bridge):
+    """
+    Jedna smyčka místo vláken: socketio.AsyncClient pro každé zařízení, síť
+    paho přes add_reader/add_writer (mqtt_bridge), WS watchdog, heartbeat
+    a throttle jako tasky. Handlery událostí jsou tytéž jako u vláknové
+    varianty, jen všechny běží ve vlákně smyčky – výkony, last_event_ts ani
+    stav throttle nesdílí víc vláken. SIGINT/SIGTERM ukončí tasky a uloží energie.
+    """
+    try:
+        import aiohttp  # noqa: F401  (transport socketio.AsyncClient; bez něj se nikdy nepřipojí)
+    except ImportError:
+        print("INFIGY_RUNTIME=asyncio requires aiohttp: pip install 'python-socketio[asyncio_client]'")
+        sys.exit(1)
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"CFG MQTT_BASE={MQTT_BASE} WS_CODEC={WS_CODEC} DEVICES={','.join(d.name for d in devices)} RUNTIME=asyncio")
+
+    await bridge.start_async()
+    for dev in devices:
+        dev.start()
+
+    coros = [_every(30, heartbeat_tick, "HEARTBEAT"), _every(0.25, flush_throttles, "THROTTLE flush")]
+    for dev in devices:
+        coros += [dev.ws_loop_async(), dev.ws_watchdog_async()]
+    tasks = [loop.create_task(c) for c in coros]
+    try:
+        await stop.wait()
+    finally:
+        print("infigy_ws_to_mqtt: shutting down")
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for dev in devices:
+            if dev.sio is None:
+                continue
+            try:
+                await dev.sio.disconnect()
+            except Exception:
+                pass
+        close_devices()
+        publish_offline()
+        await bridge.stop_async()
+
+
+def main():
+    print("__file__ running from:", __file__)
+    print("PYTHON:", sys.executable)
+    print("PAHO_VERSION:", getattr(mqtt, "__version__", "unknown"))
+    acquire_singleton("infigy_ws_to_mqtt")
+
+    bridge = MqttBridge(CLIENT_ID)
+    attach(bridge)
+    if RUNTIME == "asyncio":
+        asyncio.run(run_async(bridge))
+        return
+    # systemd zastavuje SIGTERM – přes SystemExit doběhne finally (journal, offline, spool na disk)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    bridge.start()
+    try:
+        run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_devices()
+        publish_offline()
+        # neodeslané zprávy na disk, přehrají se po dalším startu
+        bridge.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+# jobs.py — fronta dlouhých síťových testů (iperf, ping) mimo request
+import os
+import time
+import queue
+import itertools
+import threading
+from collections import OrderedDict
+
+JOBS_HISTORY    = int(os.getenv("JOBS_HISTORY", "20"))      # kolik dokončených úloh držet
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", "3"))    # max. čekajících úloh na druh
+
+
+class JobRejected(Exception):
+    pass
+
+
+class JobManager:
+    """
+    Každý druh úlohy má vlastní frontu a pevný počet workerů (concurrency cap).
+    iperf běží s jedním workerem (single-flight), takže testy nikdy nesaturují
+    Wi-Fi souběžně; stejná čekající/běžící úloha se nezakládá podruhé.
+    Request jen vloží úlohu a vrátí její id, stav se zjišťuje pollingem.
+    """
+
+    def __init__(self, history=JOBS_HISTORY, max_queued=JOBS_MAX_QUEUED):
+        self.history = history
+        self.max_queued = max_queued
+        self._jobs = OrderedDict()      # id -> job
+        self._kinds = {}                # kind -> (func, workers, queue)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def register(self, kind, func, workers=1):
+        q = queue.Queue()
+        self._kinds[kind] = (func, workers, q)
+        for n in range(workers):
+            threading.Thread(target=self._worker, args=(kind,), name=f"job-{kind}-{n}", daemon=True).start()
+
+    def submit(self, kind, params, expected_s=None):
+        """Vloží úlohu do fronty; vrací id (u duplicitní aktivní úlohy id té existující)."""
+        func, workers, q = self._kinds[kind]
+        with self._lock:
+            active = [j for j in self._jobs.values() if j["kind"] == kind and j["status"] in ("queued", "running")]
+            for j in active:
+                if j["params"] == params:
+                    return j["id"]
+            queued = sum(1 for j in active if j["status"] == "queued")
+            if queued >= self.max_queued:
+                raise JobRejected(f"Fronta '{kind}' je plná ({queued} čekajících úloh), zkus to později.")
+            job_id = f"{kind}-{next(self._ids)}"
+            self._jobs[job_id] = {
+                "id": job_id, "kind": kind, "params": dict(params), "status": "queued",
+                "created": time.time(), "started": None, "finished": None,
+                "expected_s": expected_s, "result": None, "error": None,
+            }
+            self._prune()
+        q.put(job_id)
+        return job_id
+
+    def _worker(self, kind):
+        func, _, q = self._kinds[kind]
+        while True:
+            job_id = q.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if not job:
+                    continue
+                job["status"] = "running"
+                job["started"] = time.time()
+            try:
+                result = func(**job["params"])
+                err = result.get("error") if isinstance(result, dict) else None
+            except Exception as e:
+                result, err = None, str(e)
+            with self._lock:
+                job["result"] = result
+                job["error"] = err
+                job["status"] = "error" if err else "done"
+                job["finished"] = time.time()
+
+    def _prune(self):
+        # zahodí nejstarší dokončené úlohy nad limit historie
+        done = [k for k, j in self._jobs.items() if j["status"] in ("done", "error")]
+        for k in done[:max(0, len(done) - self.history)]:
+            del self._jobs[k]
+
+    def _view(self, job):
+        v = dict(job)
+        now = time.time()
+        if job["status"] == "running" and job["expected_s"]:
+            v["progress"] = min(0.99, (now - job["started"]) / job["expected_s"])
+        else:
+            v["progress"] = 1.0 if job["status"] in ("done", "error") else 0.0
+        if job["status"] == "queued":
+            v["position"] = sum(1 for j in self._jobs.values()
+                                if j["kind"] == job["kind"] and j["status"] == "queued"
+                                and j["created"] <= job["created"])
+        return v
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+
+    def list(self, kind=None):
+        """Úlohy od nejnovější."""
+        with self._lock:
+            return [self._view(j) for j in reversed(self._jobs.values()) if kind is None or j["kind"] == kind]
+
+    def latest_result(self, kind):
+        for j in self.list(kind):
+            if j["status"] in ("done", "error"):
+                return j
+        return None
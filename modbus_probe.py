@@ -0,0 +1,114 @@
+# modbus_probe.py — end-to-end Modbus TCP sonda (FC3/FC4) přímo na střídač i přes lokální proxy
+import os
+import time
+import random
+import struct
+import asyncio
+
+from netprobe import RttWindow
+
+MODBUS_UNIT_ID = int(os.getenv("MODBUS_PROBE_UNIT_ID", "247"))    # GoodWe výchozí UID 0xF7
+MODBUS_FUNC    = int(os.getenv("MODBUS_PROBE_FUNC", "3"))         # 3 = holding, 4 = input registers
+MODBUS_ADDR    = int(os.getenv("MODBUS_PROBE_ADDR", "35100"))
+MODBUS_COUNT   = int(os.getenv("MODBUS_PROBE_COUNT", "1"))
+MODBUS_WINDOW  = int(os.getenv("MODBUS_PROBE_WINDOW", "60"))
+
+
+async def modbus_read(host, port, unit_id=MODBUS_UNIT_ID, func=MODBUS_FUNC,
+                      addr=MODBUS_ADDR, count=MODBUS_COUNT, timeout_s=2.0):
+    """
+    Jeden požadavek na čtení registrů přes nové TCP spojení.
+    Vrací dict: ok, rtt_ms (požadavek -> kompletní odpověď), connect_ms,
+    tid_ok, exception (kód Modbus výjimky nebo None), error.
+    """
+    res = {"ok": False, "rtt_ms": None, "connect_ms": None, "tid_ok": None,
+           "exception": None, "error": None}
+    writer = None
+    tid = random.randint(1, 0xFFFF)
+    try:
+        t0 = time.perf_counter()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout_s)
+        t1 = time.perf_counter()
+        res["connect_ms"] = round((t1 - t0) * 1000.0, 1)
+
+        # MBAP: TID, PID=0, LEN, UID | PDU: FUNC, ADDR, COUNT
+        req = struct.pack(">HHHBBHH", tid, 0, 6, unit_id, func, addr, count)
+        writer.write(req)
+        await writer.drain()
+        t2 = time.perf_counter()
+
+        remaining = max(0.1, timeout_s - (t2 - t0))
+        hdr = await asyncio.wait_for(reader.readexactly(7), timeout=remaining)
+        r_tid, r_pid, r_len, r_uid = struct.unpack(">HHHB", hdr)
+        if r_len < 2 or r_len > 260:
+            res["error"] = f"bad length {r_len}"
+            return res
+        pdu = await asyncio.wait_for(reader.readexactly(r_len - 1), timeout=remaining)
+        res["rtt_ms"] = round((time.perf_counter() - t2) * 1000.0, 1)
+        res["tid_ok"] = (r_tid == tid)
+
+        r_func = pdu[0]
+        if r_func == (func | 0x80):
+            res["exception"] = pdu[1] if len(pdu) > 1 else -1
+        elif r_func != func:
+            res["error"] = f"unexpected function {r_func}"
+            return res
+        elif len(pdu) < 2 or pdu[1] != 2 * count:
+            res["error"] = "short response"
+            return res
+        res["ok"] = res["tid_ok"] and res["exception"] is None
+        if not res["tid_ok"]:
+            res["error"] = f"tid mismatch {r_tid} != {tid}"
+        return res
+    except asyncio.TimeoutError:
+        res["error"] = "timeout"
+        return res
+    except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+        res["error"] = str(e) or e.__class__.__name__
+        return res
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+class ModbusProbe:
+    """
+    Drží klouzavá okna RTT pro cíle (např. "backend" = přímo střídač,
+    "proxy" = přes modbus_tcp_proxy) a počítadla chyb/výjimek/TID nesouladů.
+    Odpověď s Modbus výjimkou je platná aplikační odpověď (RTT se počítá),
+    ale zvlášť se počítá; timeout nebo nesmyslná odpověď jde do okna jako ztráta.
+    """
+
+    def __init__(self, targets, window=MODBUS_WINDOW):
+        self.targets = dict(targets)     # name -> (host, port)
+        self.windows = {n: RttWindow(window) for n in self.targets}
+        self.counters = {n: {"ok": 0, "errors": 0, "exceptions": 0, "tid_mismatch": 0} for n in self.targets}
+        self.last = {}
+
+    async def probe(self, name, timeout_s=2.0):
+        host, port = self.targets[name]
+        r = await modbus_read(host, port, timeout_s=timeout_s)
+        c = self.counters[name]
+        if r["tid_ok"] is False:
+            c["tid_mismatch"] += 1
+        if r["exception"] is not None:
+            c["exceptions"] += 1
+        if r["ok"]:
+            c["ok"] += 1
+        elif r["exception"] is None:
+            c["errors"] += 1
+        self.windows[name].add(r["rtt_ms"] if r["rtt_ms"] is not None and r["tid_ok"] else None)
+        self.last[name] = r
+        return r
+
+    async def probe_all(self, timeout_s=2.0):
+        """Cíle postupně – dongle střídače špatně snáší souběžná spojení."""
+        out = {}
+        for name in self.targets:
+            out[name] = await self.probe(name, timeout_s)
+        return out
+
+    def stats(self, name):
+        st = self.windows[name].stats()
+        st.update(self.counters[name])
+        return st
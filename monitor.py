@@ -1,7 +1,14 @@
 import subprocess
 import shutil
 import os
-import re
+import json
+import socket
+import asyncio
+import threading
+import sysmetrics
+from netprobe import NetProber
+from systemd_status import ServiceStatus
+from netstat_sampler import InterfaceSampler
 
 SERVICES = {
     "modbus_tcp_proxy": "modbus_tcp_proxy.service",
@@ -16,7 +23,10 @@ def run(cmd):
         return "N/A"
 
 def get_wifi_signal():
-    # iwconfig je na raspbianu, pokud ne – vrátí N/A
+    # primárně /proc/net/wireless (bez forku), iwconfig jen jako záloha
+    out = sysmetrics.wifi_signal_text()
+    if out != "N/A":
+        return out
     if shutil.which("iwconfig"):
         out = run("iwconfig wlan0 2>/dev/null | grep -i --color=never 'signal level'")
         return out if out != "" else "N/A"
@@ -29,23 +39,34 @@ def get_tailscale_status():
 
 def get_system_info():
     return {
-        "hostname": run("hostname"),
-        "ip_address": run("hostname -I"),
-        "uptime": run("uptime -p"),
-        "loadavg": run("cat /proc/loadavg | awk '{print $1, $2, $3}'"),
-        "cpu_temp": run("vcgencmd measure_temp 2>/dev/null | cut -d= -f2") if shutil.which("vcgencmd") else "N/A",
+        # čteno přímo z /proc a /sys (sysmetrics) – žádný fork shellu
+        "hostname": sysmetrics.hostname(),
+        "ip_address": sysmetrics.ip_addresses(),
+        "uptime": sysmetrics.uptime_pretty(),
+        "loadavg": sysmetrics.loadavg_text(),
+        "cpu_temp": sysmetrics.cpu_temp_text(),
         "wifi_strength": get_wifi_signal(),
         "tailscale_status": get_tailscale_status()
     }
 
+# stav všech jednotek najednou (D-Bus / jeden `systemctl show`), viz systemd_status.py
+_service_status = ServiceStatus(SERVICES.values())
+
 def get_services_status():
+    """{pretty: {"active", "sub", "restarts", "memory_mb", "cpu_s"}} pro dashboard."""
+    snap = _service_status.snapshot()
     status = {}
     for pretty, unit in SERVICES.items():
-        try:
-            out = subprocess.check_output(["systemctl", "is-active", unit], text=True).strip()
-        except subprocess.CalledProcessError:
-            out = "unknown"
-        status[pretty] = out
+        st = snap.get(unit, {})
+        mem = st.get("memory_bytes")
+        cpu = st.get("cpu_ns")
+        status[pretty] = {
+            "active": st.get("active", "unknown"),
+            "sub": st.get("sub", "unknown"),
+            "restarts": st.get("restarts"),
+            "memory_mb": round(mem / 1048576.0, 1) if mem is not None else None,
+            "cpu_s": round(cpu / 1e9, 1) if cpu is not None else None,
+        }
     return status
 
 def restart_service_safe(pretty_name: str):
@@ -58,25 +79,94 @@ def restart_service_safe(pretty_name: str):
     except subprocess.CalledProcessError as e:
         return False, f"Restart selhal: {e}"
 
-def get_ping_stats(target="8.8.8.8", count=4):
-    try:
-        result = subprocess.run([
-            "ping", "-c", str(count), target
-        ], capture_output=True, text=True)
-
-        loss_match = re.search(r"(\d+)% packet loss", result.stdout)
-        time_match = re.search(r"= [^/]+/([^/]+)/", result.stdout)
+# --- Ping: sonda netprobe (ICMP datagram socket), bez něj fping, nakonec TCP connect; globální deadline ---
+PING_INTERVAL_S  = float(os.getenv("PING_INTERVAL_S", "0.2"))   # rozestup echo v rámci jednoho cíle
+PING_TIMEOUT_S   = float(os.getenv("PING_TIMEOUT_S", "1"))      # timeout jedné odpovědi
+PING_TCP_PORT    = int(os.getenv("PING_TCP_PORT", "53"))        # port pro TCP fallback bez ICMP i fping (RST = živý host)
+
+# ICMP socket je vázaný na jednu asyncio smyčku; kolektor i joby volají z různých vláken
+# (každé volání = vlastní asyncio.run), proto prober na vlákno – nikdo nečeká na cizí deadline
+_probers = threading.local()
+
+
+def _thread_prober():
+    prober = getattr(_probers, "prober", None)
+    if prober is None:
+        prober = _probers.prober = NetProber(spacing_s=PING_INTERVAL_S)
+    return prober
+
+
+def _ping_deadline(count):
+    """Horní mez pro celou sadu cílů – neroste s počtem cílů."""
+    return count * PING_INTERVAL_S + PING_TIMEOUT_S + 2.0
+
+
+def _ping_result(target, samples=None, sent=0, loss=None, error=None):
+    """
+    Jednotný tvar výsledku: loss (%), min/avg/max/mdev (ms).
+    samples = seznam RTT (ms) přijatých odpovědí; mdev jako u iputils ping.
+    """
+    res = {"target": target, "loss": loss, "min_ms": None, "avg_time_ms": None,
+           "max_ms": None, "mdev_ms": None, "error": error}
+    if samples is not None and sent > 0:
+        res["loss"] = int(round((sent - len(samples)) * 100.0 / sent))
+        if samples:
+            n = len(samples)
+            avg = sum(samples) / n
+            res["min_ms"] = round(min(samples), 3)
+            res["avg_time_ms"] = round(avg, 3)
+            res["max_ms"] = round(max(samples), 3)
+            res["mdev_ms"] = round((sum(x * x for x in samples) / n - avg * avg) ** 0.5, 3)
+    return res
+
+
+def _fping_multi(targets, count, deadline):
+    """Jedno volání fping pro všechny cíle (-C = per-echo RTT, '-' = ztráta)."""
+    cmd = ["fping", "-q", "-C", str(count),
+           "-p", str(max(10, int(PING_INTERVAL_S * 1000))),
+           "-t", str(int(PING_TIMEOUT_S * 1000))] + list(targets)
+    r = subprocess.run(cmd, capture_output=True, text=True, timeout=deadline)
+    parsed = {}
+    # fping píše souhrn na stderr: "8.8.8.8 : 12.1 11.9 - 12.4"
+    for line in r.stderr.splitlines():
+        host, sep, rest = line.partition(" : ")
+        if not sep:
+            continue
+        vals = rest.split()
+        samples = [float(v) for v in vals if v != "-"]
+        parsed[host.strip()] = (samples, len(vals))
+    out = []
+    for t in targets:
+        if t in parsed:
+            samples, sent = parsed[t]
+            out.append(_ping_result(t, samples, sent))
+        else:
+            out.append(_ping_result(t, error="Neznámý nebo nedostupný cíl"))
+    return out
+
+
+async def _ping_all(prober, targets, count, deadline):
+    async def one(t):
+        try:
+            rtts = await asyncio.wait_for(prober.echoes(t, PING_TCP_PORT, PING_TIMEOUT_S, count), deadline)
+        except asyncio.TimeoutError:
+            return _ping_result(t, error="Překročen časový limit")
+        except socket.gaierror:
+            return _ping_result(t, error="Neznámý nebo nedostupný cíl")
+        except Exception as e:
+            return _ping_result(t, error=str(e))
+        return _ping_result(t, [r for r in rtts if r is not None], len(rtts))
 
-        return {
-            "target": target,
-            "loss": int(loss_match.group(1)) if loss_match else None,
-            "avg_time_ms": float(time_match.group(1)) if time_match else None
-        }
-    except Exception as e:
-        return {"target": target, "error": str(e)}
+    return list(await asyncio.gather(*(one(t) for t in targets)))
 
 
 def get_multi_ping_stats(targets=None, count=4):
+    """
+    Pingne všechny cíle souběžně. Celková doba je omezena nejpomalejším cílem
+    (globální deadline), ne součtem. ICMP datagram socket přes netprobe; když ho
+    jádro nepovolí (net.ipv4.ping_group_range), jedno volání fping a teprve bez
+    něj TCP connect na PING_TCP_PORT (filtrovaný port = ztráta i u živého hostu).
+    """
     if targets is None:
         targets = [
             "8.8.8.8",           # Google DNS
@@ -85,43 +175,45 @@ def get_multi_ping_stats(targets=None, count=4):
             "192.168.1.10",     # ASUS AP 2
             "192.168.1.20"      # Home Assistant
         ]
-    return [get_ping_stats(target, count) for target in targets]
-
-
-def get_vnstat_interface_stats(interface="eth0"):
-    try:
-        result = subprocess.run(["vnstat", "--oneline", "-i", interface], capture_output=True, text=True)
-        if not result.stdout.strip():
-            subprocess.run(["vnstat", "--create", "-i", interface], capture_output=True)
-            subprocess.run(["systemctl", "restart", "vnstat"], capture_output=True)
-            return {"interface": interface, "error": "Databáze vnstat byla vytvořena. Čeká se na sběr dat."}
-
-        parts = result.stdout.strip().split(";")
-        if len(parts) < 15:
-            return {"interface": interface, "error": "Nedostatečná data (vnstat výstup má méně než 15 částí)."}
-
-        return {
-            "interface": interface,
-            "rx_today": parts[3],
-            "tx_today": parts[4],
-            "total_today": parts[5],
-            "rate_today": parts[6],
-            "rx_month": parts[8],
-            "tx_month": parts[9],
-            "total_month": parts[10],
-            "rate_month": parts[11],
-            "rx_total": parts[12],
-            "tx_total": parts[13],
-            "total_total": parts[14]
-        }
-    except Exception as e:
-        return {"interface": interface, "error": str(e)}
+    targets = list(targets)
+    if not targets:
+        return []
+    deadline = _ping_deadline(count)
+    prober = _thread_prober()
+    if not prober.icmp_available() and shutil.which("fping"):
+        try:
+            return _fping_multi(targets, count, deadline)
+        except Exception as e:
+            print(f"[PING] fping selhal, fallback na TCP connect: {e}")
+    return asyncio.run(_ping_all(prober, targets, count, deadline))
 
 
+# vlastní sampler /proc/net/dev (bez vnstat subprocessu a restartů služby z requestu)
+_net_sampler = InterfaceSampler()
 
 def get_all_vnstat_stats():
-    interfaces = ["eth0", "wlan0"]
-    return [get_vnstat_interface_stats(i) for i in interfaces]
+    return _net_sampler.start().stats()
+
+
+def _parse_iperf_json(raw):
+    """Souhrn z `iperf3 --json`: propustnost sender/receiver (Mbit/s) a retransmise."""
+    data = json.loads(raw)
+    if data.get("error"):
+        return {"error": data["error"]}
+    end = data.get("end", {})
+    sent = end.get("sum_sent", {})
+    recv = end.get("sum_received", {})
+    res = {
+        "sent_mbps": round(sent.get("bits_per_second", 0) / 1e6, 2) if sent else None,
+        "received_mbps": round(recv.get("bits_per_second", 0) / 1e6, 2) if recv else None,
+        "retransmits": sent.get("retransmits"),
+        "duration_s": round(sent.get("seconds", 0) or recv.get("seconds", 0), 1),
+        "intervals_mbps": [round(i.get("sum", {}).get("bits_per_second", 0) / 1e6, 2)
+                           for i in data.get("intervals", [])],
+    }
+    res["summary"] = (f"sender {res['sent_mbps']} Mbit/s, receiver {res['received_mbps']} Mbit/s"
+                      + (f", retransmits {res['retransmits']}" if res["retransmits"] is not None else ""))
+    return res
 
 
 def get_iperf_test(server_ip="127.0.0.1", duration=10):
@@ -129,17 +221,21 @@ def get_iperf_test(server_ip="127.0.0.1", duration=10):
         return {"server": server_ip, "error": "iperf3 není nainstalován. Spusť: sudo apt install iperf3"}
     try:
         result = subprocess.run([
-            "iperf3", "-c", server_ip, "--bind", "127.0.0.1", "-t", str(duration)
-        ], capture_output=True, text=True)
+            "iperf3", "-c", server_ip, "--bind", "127.0.0.1", "-t", str(duration), "--json"
+        ], capture_output=True, text=True, timeout=duration + 30)
 
-        if result.returncode != 0:
-            return {"server": server_ip, "error": result.stderr.strip() or "iperf3 test selhal"}
+        try:
+            parsed = _parse_iperf_json(result.stdout)
+        except ValueError:
+            parsed = None
 
-        lines = result.stdout.splitlines()
-        summary_line = next((l for l in lines if "sender" in l or "receiver" in l), None)
-        summary = summary_line.strip() if summary_line else result.stdout.strip() or "Žádný výstup ze serveru"
+        if parsed is None or (result.returncode != 0 and not parsed.get("error")):
+            return {"server": server_ip, "error": result.stderr.strip() or "iperf3 test selhal"}
+        if parsed.get("error"):
+            return {"server": server_ip, "error": parsed["error"]}
 
-        return {"server": server_ip, "summary": summary}
+        parsed["server"] = server_ip
+        return parsed
     except Exception as e:
         return {"server": server_ip, "error": str(e)}
 
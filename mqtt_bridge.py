@@ -0,0 +1,367 @@
+# mqtt_bridge.py — sdílené jádro MQTT pro mqtt_report a infigy_ws_to_mqtt (jeden klient, jedna publish pipeline)
+import os
+import sys
+import socket
+import asyncio
+import threading
+
+import paho.mqtt.client as mqtt
+
+from mqtt_buffer import PublishBuffer
+
+MQTT_HOST   = os.getenv("MQTT_HOST", "localhost")
+MQTT_PORT   = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_USER   = os.getenv("MQTT_USER", "")
+MQTT_PASS   = os.getenv("MQTT_PASS", "")
+MQTT_KEEPALIVE_S             = int(os.getenv("MQTT_KEEPALIVE_S", "60"))
+MQTT_RECONNECT_BACKOFF_MAX_S = int(os.getenv("MQTT_RECONNECT_BACKOFF_MAX_S", "60"))
+MQTT_WATCHDOG_INTERVAL_S     = int(os.getenv("MQTT_WATCHDOG_INTERVAL_S", "15"))
+MQTT_MAX_INFLIGHT = int(os.getenv("MQTT_MAX_INFLIGHT", "20"))     # okno nepotvrzených QoS>0 zpráv
+MQTT_MAX_QUEUED   = int(os.getenv("MQTT_MAX_QUEUED", "1000"))     # strop fronty v paho, zbytek drží PublishBuffer
+MQTT_QOS_POLICY   = os.getenv("MQTT_QOS_POLICY", "")              # "telemetry=0,state=1,discovery=1"
+
+# výchozí QoS podle třídy topicu; explicitní qos volajícího má přednost
+QOS_POLICY = {
+    "availability": 1,   # <base>/bridge/online
+    "discovery":    1,   # homeassistant/.../config
+    "state":        1,   # retained stavové hodnoty
+    "telemetry":    0,   # rychlé živé hodnoty, ztráta jedné nevadí
+}
+
+
+def _parse_policy(spec):
+    out = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        cls, val = item.split("=", 1)
+        try:
+            out[cls.strip()] = max(0, min(2, int(val)))
+        except ValueError:
+            print(f"[MQTT] invalid MQTT_QOS_POLICY item: {item}")
+    return out
+
+QOS_POLICY.update(_parse_policy(MQTT_QOS_POLICY))
+
+
+# --- v2 i v1 kompatibilní návratové kódy callbacků ---
+def _normalize_code(raw):
+    code = getattr(raw, "value", raw)
+    try: return int(code)
+    except: return 0
+
+
+_singletons = []
+
+def acquire_singleton(name):
+    """Abstract unix socket jako zámek instance; druhá instance skončí."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        s.bind(f"\0{name}.singleton")
+    except OSError:
+        print(f"Another {name} instance is running. Exiting.")
+        sys.exit(1)
+    _singletons.append(s)
+    return s
+
+
+class Channel:
+    """
+    Pohled jednoho pluginu na sdílený klient: vlastní MQTT_BASE prefix,
+    vlastní store-and-forward buffer (spool soubor) a callbacky po (od)pojení.
+    """
+
+    def __init__(self, bridge, base, spool_path, on_connect=None, on_disconnect=None,
+                 availability="bridge/online"):
+        self.bridge = bridge
+        self.base = base
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.availability = availability
+        self.buffer = PublishBuffer(bridge.client, spool_path)
+
+    def topic(self, topic_suffix):
+        return f"{self.base}/{topic_suffix}"
+
+    def publish(self, topic_suffix, payload, retain=True, qos=None, cls="state"):
+        """Publikace pod <base>/; dostupnost se nespooluje (má smysl jen živě)."""
+        if topic_suffix == self.availability:
+            cls = "availability"
+        if qos is None:
+            qos = QOS_POLICY.get(cls, 1)
+        self.buffer.publish(self.topic(topic_suffix), payload, qos=qos, retain=retain,
+                            spool=cls != "availability")
+
+    def publish_raw(self, topic, payload, retain=True, qos=None, cls="discovery"):
+        """Plný topic mimo <base>/ (discovery); offline se zahodí, po connectu se pošle znovu."""
+        if qos is None:
+            qos = QOS_POLICY.get(cls, 1)
+        return self.buffer.publish(topic, payload, qos=qos, retain=retain, spool=False)
+
+    def subscribe(self, topic, callback, qos=1):
+        self.bridge.subscribe(topic, callback, qos)
+
+
+class _AsyncioLoopAdapter:
+    """
+    Síťová smyčka paho řízená asyncio (místo vlákna loop_start): čtení přes
+    add_reader, zápis přes add_writer, keepalive/retry v tasku loop_misc.
+    Blokující connect/reconnect (DNS, TCP handshake) běží v executoru, aby
+    nedostupný broker nezastavil smyčku – socket callbacky z jiného vlákna
+    proto jdou přes call_soon_threadsafe (pořadí close -> open zůstane
+    zachované), ve vlákně smyčky se provedou hned.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self._misc = None
+        self._loop_thread = threading.get_ident()
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_register_write
+        client.on_socket_unregister_write = self._on_unregister_write
+
+    def _call(self, fn, *args):
+        if threading.get_ident() == self._loop_thread:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    @staticmethod
+    def _quiet(fn, *args):
+        # fd zavřený dřív, než naplánovaná změna proběhla – registrace už nic neznamená
+        try:
+            fn(*args)
+        except OSError:
+            pass
+
+    # fd se bere hned – než callback proběhne ve smyčce, socket už může být zavřený
+    def _on_socket_open(self, client, userdata, sock):
+        self._call(self._opened, sock.fileno())
+
+    def _opened(self, fd):
+        self.loop.add_reader(fd, self.client.loop_read)
+        if self._misc is None or self._misc.done():
+            self._misc = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._call(self._closed, sock.fileno())
+
+    def _closed(self, fd):
+        self._quiet(self.loop.remove_writer, fd)
+        self._quiet(self.loop.remove_reader, fd)
+
+    def _on_register_write(self, client, userdata, sock):
+        self._call(self._quiet, self.loop.add_writer, sock.fileno(), client.loop_write)
+
+    def _on_unregister_write(self, client, userdata, sock):
+        self._call(self._quiet, self.loop.remove_writer, sock.fileno())
+
+    async def _misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    def close(self):
+        if self._misc is not None:
+            self._misc.cancel()
+
+
+class MqttBridge:
+    """
+    Jeden paho klient (jedno TCP spojení na broker) pro libovolný počet pluginů.
+    Inflight okno a strop fronty paho jsou konfigurovatelné, QoS se bere podle
+    třídy topicu (QOS_POLICY). LWT umí MQTT jen jeden na spojení: dostane ho
+    první kanál s dostupností, ostatní pluginy hlásí offline jen při řádném
+    ukončení.
+    """
+
+    def __init__(self, client_id, host=MQTT_HOST, port=MQTT_PORT, user=MQTT_USER, password=MQTT_PASS):
+        self.host = host
+        self.port = port
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=True)
+        if user:
+            self.client.username_pw_set(user, password)
+        self.client.reconnect_delay_set(min_delay=2, max_delay=MQTT_RECONNECT_BACKOFF_MAX_S)
+        self.client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
+        self.client.max_queued_messages_set(MQTT_MAX_QUEUED)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client_id = client_id
+        self.channels = []
+        self.connected = threading.Event()
+        self._stop = threading.Event()
+        self._will = None
+        self._subs = {}   # filtr -> (qos, [callback(topic, payload_str)])
+
+    def channel(self, base, spool_path, on_connect=None, on_disconnect=None,
+                availability="bridge/online", will_payload="0"):
+        ch = Channel(self, base, spool_path, on_connect, on_disconnect, availability)
+        if availability:
+            if self._will is None:
+                self._will = ch.topic(availability)
+                self.client.will_set(self._will, will_payload, qos=QOS_POLICY["availability"], retain=True)
+            else:
+                print(f"[BRIDGE] LWT already set on {self._will}; {ch.topic(availability)} "
+                      f"goes offline only on clean shutdown")
+        self.channels.append(ch)
+        return ch
+
+    def subscribe(self, topic, callback, qos=1):
+        """Odběr sdílený všemi kanály; po každém (re)connectu se obnoví."""
+        entry = self._subs.get(topic)
+        if entry is None:
+            entry = self._subs[topic] = (qos, [])
+            self.client.message_callback_add(topic, lambda c, u, msg, flt=topic: self._dispatch(flt, msg))
+            if self.client.is_connected():
+                self.client.subscribe(topic, qos)
+        entry[1].append(callback)
+
+    def _dispatch(self, flt, msg):
+        payload = msg.payload.decode("utf-8", "replace")
+        for cb in list(self._subs[flt][1]):
+            try:
+                cb(msg.topic, payload)
+            except Exception as e:
+                print(f"[BRIDGE] handler for {flt} failed: {e}")
+
+    # --- callbacks ---
+    def _on_connect(self, client, userdata, *args, **kwargs):
+        # v2: (flags, reason_code, properties) / v1: (flags, rc)
+        raw = kwargs.get("reason_code", kwargs.get("rc", 0))
+        if len(args) > 1:
+            raw = args[1]
+        code = _normalize_code(raw)
+        print(f"MQTT connected rc={code} client_id={self.client_id}")
+        if code != 0:
+            return
+        self.connected.set()
+        for flt, (qos, _) in self._subs.items():
+            client.subscribe(flt, qos)
+        for ch in self.channels:
+            ch.buffer.set_online(True)
+            if ch.on_connect:
+                try:
+                    ch.on_connect(ch)
+                except Exception as e:
+                    print(f"[BRIDGE] on_connect {ch.base} failed: {e}")
+
+    def _on_disconnect(self, client, userdata, *args, **kwargs):
+        # v2: (flags, reason_code, properties) / v1: (rc)
+        raw = kwargs.get("reason_code", kwargs.get("rc", -1))
+        if len(args) > 1:
+            raw = args[1]
+        elif len(args) > 0:
+            raw = args[0]
+        code = _normalize_code(raw)
+        print(f"MQTT disconnected rc={code}")
+        self.connected.clear()
+        for ch in self.channels:
+            ch.buffer.set_online(False)
+            if ch.on_disconnect:
+                try:
+                    ch.on_disconnect(ch)
+                except Exception as e:
+                    print(f"[BRIDGE] on_disconnect {ch.base} failed: {e}")
+
+    # --- životní cyklus ---
+    def start(self):
+        print("MQTT:", f"{self.host}:{self.port}", "CLIENT_ID:", self.client_id,
+              "BASES:", ",".join(ch.base for ch in self.channels))
+        for ch in self.channels:
+            ch.buffer.start()
+        # connect_async: nedostupný broker při startu neshodí proces, paho se připojí později
+        self.client.connect_async(self.host, self.port, keepalive=MQTT_KEEPALIVE_S)
+        self.client.loop_start()
+        threading.Thread(target=self._watchdog_loop, name="mqtt-watchdog", daemon=True).start()
+        return self
+
+    def _watchdog_loop(self):
+        """
+        - Každých MQTT_WATCHDOG_INTERVAL_S ověří připojení.
+        - Pokud není připojeno, zkusí reconnect s exponenciálním backoffem (2..MAX s).
+        - Pokud by z nějakého důvodu neběželo loop_start() vlákno, znovu ho spustí.
+        """
+        backoff = 2
+        while not self._stop.wait(MQTT_WATCHDOG_INTERVAL_S if self.client.is_connected() else
+                                  min(backoff, MQTT_RECONNECT_BACKOFF_MAX_S)):
+            try:
+                if not self.client.is_connected():
+                    print(f"[MQTT-WD] Not connected >> reconnect() (backoff={backoff}s)")
+                    try:
+                        self.client.reconnect()
+                        backoff = 2
+                    except Exception as e:
+                        print(f"[MQTT-WD] reconnect() failed: {e}")
+                        backoff = min(backoff * 2, MQTT_RECONNECT_BACKOFF_MAX_S)
+                t = getattr(self.client, "_thread", None)
+                if t is None or not t.is_alive():
+                    self.client.loop_start()
+                    print("[MQTT-WD] loop_start() ensured")
+            except Exception as e:
+                print(f"[MQTT-WD] Unexpected error: {e}")
+
+    # --- životní cyklus v asyncio (INFIGY_RUNTIME=asyncio) ---
+    async def start_async(self):
+        """
+        Jako start(), ale bez vláken paho/watchdogu/replay bufferu: síť, watchdog
+        i přehrávání spoolu běží v aktuální smyčce; jen samotné navázání TCP
+        spojení jde do executoru (viz _AsyncioLoopAdapter).
+        """
+        print("MQTT:", f"{self.host}:{self.port}", "CLIENT_ID:", self.client_id,
+              "BASES:", ",".join(ch.base for ch in self.channels), "(asyncio)")
+        loop = asyncio.get_running_loop()
+        self._adapter = _AsyncioLoopAdapter(loop, self.client)
+        self._replay_tasks = [loop.create_task(ch.buffer.run_async()) for ch in self.channels]
+        self.client.connect_async(self.host, self.port, keepalive=MQTT_KEEPALIVE_S)
+        try:
+            await loop.run_in_executor(None, self.client.reconnect)
+        except Exception as e:
+            print(f"[MQTT] connect failed: {e} (watchdog will retry)")
+        self._wd_task = loop.create_task(self._watchdog_async())
+        return self
+
+    async def _watchdog_async(self):
+        """Reconnect s exponenciálním backoffem (2..MAX s), stejně jako _watchdog_loop."""
+        backoff = 2
+        while True:
+            await asyncio.sleep(MQTT_WATCHDOG_INTERVAL_S if self.client.is_connected() else
+                                min(backoff, MQTT_RECONNECT_BACKOFF_MAX_S))
+            if self.client.is_connected():
+                backoff = 2
+                continue
+            print(f"[MQTT-WD] Not connected >> reconnect() (backoff={backoff}s)")
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.client.reconnect)
+            except Exception as e:
+                print(f"[MQTT-WD] reconnect() failed: {e}")
+                backoff = min(backoff * 2, MQTT_RECONNECT_BACKOFF_MAX_S)
+
+    async def stop_async(self):
+        """Spool na disk, DISCONNECT odeslaný smyčkou, pak zrušení tasků."""
+        self._stop.set()
+        self._wd_task.cancel()
+        for t in self._replay_tasks:
+            t.cancel()
+        for ch in self.channels:
+            ch.buffer.close()
+        try:
+            self.client.disconnect()
+            for _ in range(20):   # zápis DISCONNECT obslouží add_writer ve smyčce
+                if not self.client.is_connected():
+                    break
+                await asyncio.sleep(0.05)
+        except Exception:
+            pass
+        self._adapter.close()
+
+    def stop(self):
+        """Neodeslané zprávy do spoolu, pak čisté odpojení (LWT se nepošle)."""
+        self._stop.set()
+        for ch in self.channels:
+            ch.buffer.close()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        self.client.loop_stop()
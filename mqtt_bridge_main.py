@@ -0,0 +1,43 @@
+# mqtt_bridge_main.py — mqtt_report + infigy_ws_to_mqtt v jednom procesu nad jedním MQTT spojením
+import os
+import sys
+import threading
+from dotenv import load_dotenv
+import paho.mqtt.client as mqtt
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(dotenv_path=os.path.join(BASE_DIR, ".env"))
+
+from mqtt_bridge import MqttBridge, acquire_singleton
+import mqtt_report
+import infigy_ws_to_mqtt
+
+CLIENT_ID = os.getenv("CLIENT_ID_BRIDGE", "rpi-bridge-core")
+
+
+def main():
+    print("__file__ running from:", os.path.abspath(__file__))
+    print("PYTHON:", sys.executable)
+    print("PAHO_VERSION:", getattr(mqtt, "__version__", "unknown"))
+    # zámky obou samostatných služeb – nesmí běžet souběžně s tímto procesem
+    acquire_singleton("mqtt_report")
+    acquire_singleton("infigy_ws_to_mqtt")
+
+    bridge = MqttBridge(CLIENT_ID)
+    # LWT dostane první kanál (rpi reporter), viz MqttBridge
+    mqtt_report.attach(bridge)
+    infigy_ws_to_mqtt.attach(bridge)
+    bridge.start()
+
+    # infigy blokuje v sio.wait() -> vlastní vlákno; reporter v hlavním vlákně kvůli SIGTERM
+    threading.Thread(target=infigy_ws_to_mqtt.run, name="infigy", daemon=True).start()
+    try:
+        mqtt_report.run()
+    finally:
+        # energie do snapshotu, statistiky na disk a Infigy offline – dřív než se spojení zavře
+        infigy_ws_to_mqtt.close_devices()
+        infigy_ws_to_mqtt.publish_offline()
+        bridge.stop()
+
+if __name__ == "__main__":
+    main()
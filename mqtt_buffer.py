@@ -0,0 +1,248 @@
+# mqtt_buffer.py — store-and-forward vrstva pro MQTT publikace (výpadek brokeru / restart HA)
+import os
+import time
+import struct
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+import paho.mqtt.client as mqtt
+
+MQTT_BUFFER_MEM_MAX     = int(os.getenv("MQTT_BUFFER_MEM_MAX", "500"))        # zpráv v paměti, pak spill na disk
+MQTT_BUFFER_DISK_MAX_KB = int(os.getenv("MQTT_BUFFER_DISK_MAX_KB", "1024"))   # strop segmentu na disku
+MQTT_REPLAY_RATE        = float(os.getenv("MQTT_REPLAY_RATE", "20"))          # zpráv/s při dohánění po reconnectu
+
+# záznam v segmentu: ts, flags (qos | retain<<2), délka topicu, délka payloadu, pak topic a payload
+_REC = struct.Struct(">dBHI")
+
+
+def _coalesce_retained(topic, retain):
+    """Retained hodnoty jsou stavové (gauge) – stačí poslední hodnota na topic."""
+    return retain
+
+
+class PublishBuffer:
+    """
+    Online se zpráva posílá rovnou do klienta. Offline (nebo během dohánění)
+    jde do paměťové fronty, kde se stavové topicy slučují (drží se jen poslední
+    hodnota); nad MQTT_BUFFER_MEM_MAX se nejstarší zprávy přelévají do
+    append-only segmentu na disku, ten je omezen MQTT_BUFFER_DISK_MAX_KB
+    (nad limit se zahazuje a počítá do `dropped`). Po on_connect se fronta
+    přehraje rychlostí MQTT_REPLAY_RATE – nejdřív disk (starší), pak paměť.
+    Neodeslaný obsah se při close() uloží na disk a přehraje po dalším startu.
+    """
+
+    def __init__(self, client, path, mem_max=MQTT_BUFFER_MEM_MAX,
+                 disk_max_bytes=MQTT_BUFFER_DISK_MAX_KB * 1024,
+                 replay_rate=MQTT_REPLAY_RATE, coalesce=_coalesce_retained):
+        self.client = client
+        self.path = path
+        self.mem_max = mem_max
+        self.disk_max_bytes = disk_max_bytes
+        self.replay_rate = replay_rate
+        self.coalesce = coalesce
+        self.online = False
+        self._mem = OrderedDict()      # klíč (topic nebo (topic, seq)) -> (topic, payload, qos, retain, ts)
+        self._replay = deque()         # načtený obsah segmentu čekající na odeslání
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {"spilled": 0, "dropped": 0, "coalesced": 0, "replayed": 0}
+        try:
+            self._disk_bytes = os.path.getsize(path)
+        except OSError:
+            self._disk_bytes = 0
+
+    # --- vstup ---
+    def publish(self, topic, payload, qos=1, retain=True, spool=True):
+        """
+        spool=False: zprávy, které mají smysl jen živě (dostupnost) – offline se zahodí.
+        Vrací False, pokud zpráva nebyla předána klientovi ani uložena do fronty.
+        """
+        payload = str(payload)
+        with self._lock:
+            direct = self.online and not self._mem and not self._replay
+        if direct or not spool:
+            if not self.online:
+                return False
+            rc = self._send(topic, payload, qos, retain)
+            # qos>0 při NO_CONN si paho podrží samo
+            if rc == mqtt.MQTT_ERR_SUCCESS or (rc == mqtt.MQTT_ERR_NO_CONN and qos > 0):
+                return True
+            if not spool:
+                return False
+        self._enqueue(topic, payload, qos, retain, time.time())
+        return True
+
+    def _send(self, topic, payload, qos, retain):
+        try:
+            return self.client.publish(topic, payload, qos=qos, retain=retain).rc
+        except Exception as e:
+            print(f"[MQTT] publish failed {topic}: {e}")
+            return mqtt.MQTT_ERR_UNKNOWN
+
+    def _enqueue(self, topic, payload, qos, retain, ts):
+        with self._lock:
+            if self.coalesce(topic, retain):
+                key = topic
+                if key in self._mem:
+                    self.counters["coalesced"] += 1
+                    del self._mem[key]
+            else:
+                self._seq += 1
+                key = (topic, self._seq)
+            self._mem[key] = (topic, payload, qos, retain, ts)
+            while len(self._mem) > self.mem_max:
+                _, rec = self._mem.popitem(last=False)
+                self._spill([rec])
+
+    # --- disk segment ---
+    def _spill(self, recs):
+        blob = bytearray()
+        n = 0
+        for topic, payload, qos, retain, ts in recs:
+            t, p = topic.encode("utf-8"), payload.encode("utf-8")
+            rec = _REC.pack(ts, qos | (4 if retain else 0), len(t), len(p)) + t + p
+            if self._disk_bytes + len(blob) + len(rec) > self.disk_max_bytes:
+                self.counters["dropped"] += 1
+                continue
+            blob += rec
+            n += 1
+        if not blob:
+            return
+        try:
+            with open(self.path, "ab") as f:
+                f.write(blob)
+            self._disk_bytes += len(blob)
+            self.counters["spilled"] += n
+        except OSError as e:
+            self.counters["dropped"] += n
+            print(f"[MQTT] buffer spill failed: {e}")
+
+    def _load_segment(self):
+        """Načte segment do _replay (slučuje stavové topicy) a smaže ho."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        except OSError as e:
+            print(f"[MQTT] buffer segment read failed: {e}")
+            return
+        recs = []
+        off = 0
+        while off + _REC.size <= len(data):
+            ts, flags, tl, pl = _REC.unpack_from(data, off)
+            off += _REC.size
+            if off + tl + pl > len(data):
+                break   # useknutý poslední záznam (pád při zápisu)
+            topic = data[off:off + tl].decode("utf-8", "replace")
+            payload = data[off + tl:off + tl + pl].decode("utf-8", "replace")
+            off += tl + pl
+            recs.append((topic, payload, flags & 3, bool(flags & 4), ts))
+        # u stavových topicu jen poslední výskyt a jen pokud v paměti není novější
+        last = {}
+        for i, r in enumerate(recs):
+            if self.coalesce(r[0], r[3]):
+                last[r[0]] = i
+        for i, r in enumerate(recs):
+            if self.coalesce(r[0], r[3]) and (last[r[0]] != i or r[0] in self._mem):
+                self.counters["coalesced"] += 1
+                continue
+            self._replay.append(r)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._disk_bytes = 0
+
+    # --- přehrání po reconnectu ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._replay_loop, name="mqtt-replay", daemon=True)
+            self._thread.start()
+        return self
+
+    def set_online(self, online):
+        self.online = online
+        if online:
+            self._wake.set()
+
+    def _next(self):
+        with self._lock:
+            if self._disk_bytes and not self._replay:
+                self._load_segment()
+            if self._replay:
+                return self._replay.popleft(), True
+            if self._mem:
+                return self._mem.popitem(last=False)[1], False
+        return None, False
+
+    def _replay_one(self):
+        """Pošle jednu zprávu z fronty; False = fronta prázdná nebo spojení spadlo."""
+        rec, from_disk = self._next()
+        if rec is None:
+            return False
+        topic, payload, qos, retain, ts = rec
+        if self._send(topic, payload, qos, retain) != mqtt.MQTT_ERR_SUCCESS:
+            # spojení zase spadlo – vrátit na začátek a čekat na další on_connect
+            with self._lock:
+                if from_disk:
+                    self._replay.appendleft(rec)
+                elif self.coalesce(topic, retain) and topic in self._mem:
+                    pass   # mezitím přišla novější hodnota
+                else:
+                    if self.coalesce(topic, retain):
+                        key = topic
+                    else:
+                        self._seq += 1   # vlastní klíč – pevný by přepsal jinou vrácenou zprávu téhož topicu
+                        key = (topic, self._seq)
+                    self._mem[key] = rec
+                    self._mem.move_to_end(key, last=False)
+            return False
+        self.counters["replayed"] += 1
+        return True
+
+    def _replay_loop(self):
+        gap = 1.0 / self.replay_rate if self.replay_rate > 0 else 0.0
+        while not self._stop.is_set():
+            self._wake.wait(1.0)
+            self._wake.clear()
+            while self.online and not self._stop.is_set():
+                if not self._replay_one():
+                    break
+                if gap:
+                    self._stop.wait(gap)
+
+    async def run_async(self):
+        """Přehrávání jako task asyncio smyčky místo vlákna (MqttBridge.start_async)."""
+        gap = 1.0 / self.replay_rate if self.replay_rate > 0 else 0.0
+        while not self._stop.is_set():
+            for _ in range(4):   # jako _wake.wait(1.0), set_online volá paho ve stejné smyčce
+                if self._wake.is_set():
+                    break
+                await asyncio.sleep(0.25)
+            self._wake.clear()
+            while self.online and not self._stop.is_set():
+                if not self._replay_one():
+                    break
+                await asyncio.sleep(gap)
+
+    def close(self):
+        """Zastaví přehrávání a neodeslaný obsah uloží do segmentu."""
+        self._stop.set()
+        with self._lock:
+            pending = list(self._replay) + list(self._mem.values())
+            self._replay.clear()
+            self._mem.clear()
+            if pending:
+                self._spill(pending)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out["depth"] = len(self._mem) + len(self._replay)
+            out["disk_bytes"] = self._disk_bytes
+            return out
@@ -0,0 +1,124 @@
+# mqtt_cmd.py — příkazový kanál <base>/cmd/# pro běžící bridge (ACL podle topicu, odpověď do <base>/cmd_result/...)
+import json
+import fnmatch
+import threading
+
+CMD_TOPIC = "cmd"
+CMD_RESULT_TOPIC = "cmd_result"   # mimo cmd/#, aby odpověď nepřišla zpět jako příkaz
+CMD_MAX_PAYLOAD = 4096
+
+
+def parse_acl(spec):
+    """"stats,discovery,energy/*" -> seznam fnmatch vzorů; prázdné = příkazy vypnuté."""
+    return [p.strip() for p in (spec or "").split(",") if p.strip()]
+
+
+class CommandRouter:
+    """
+    Příkaz = zpráva na <base>/cmd/<jméno>[/<podcesta>], payload JSON objekt
+    (argumenty), holá hodnota ({"value": ...}) nebo prázdný. Volitelné "id"
+    se vrátí v odpovědi. Povolené jsou jen příkazy, jejichž cesta odpovídá
+    některému vzoru ACL – skutečné oprávnění (kdo smí do cmd/# psát) musí
+    hlídat ACL brokeru. Odpověď {"id", "ok", "result"|"error"} jde bez
+    retain na <base>/cmd_result/<cesta>.
+
+    Handler fn(sub, args) dostane podcestu (část za jménem příkazu, "" bez
+    ní) a dict argumentů; výsledek musí jít serializovat do JSON. KeyError,
+    ValueError a TypeError z handleru jsou chyby vstupu, ostatní se logují.
+    Handlery běží ve vlákně MQTT klienta (nebo v asyncio smyčce), musí být krátké.
+    """
+
+    def __init__(self, acl, name="CMD"):
+        self.acl = list(acl)
+        self.name = name
+        self._handlers = {}   # jméno -> (fn, popis)
+        self._lock = threading.Lock()   # příkazy se vykonávají po jednom
+        self.chan = None
+        self.counters = {"ok": 0, "error": 0, "denied": 0}
+        self.register("help", lambda sub, args: self.help(), "seznam příkazů povolených ACL")
+
+    def register(self, name, fn, doc=""):
+        self._handlers[name] = (fn, doc)
+
+    def allowed(self, path):
+        return any(fnmatch.fnmatchcase(path, p) for p in self.acl)
+
+    def help(self):
+        return {n: doc for n, (_, doc) in sorted(self._handlers.items())
+                if self.allowed(n) or any(p.startswith(n + "/") for p in self.acl)}
+
+    def attach(self, chan):
+        """Odběr <base>/cmd/# na kanálu; bez ACL se nic neodebírá."""
+        self.chan = chan
+        if not self.acl:
+            return False
+        chan.subscribe(chan.topic(f"{CMD_TOPIC}/#"), self._on_message)
+        print(f"[{self.name}] commands on {chan.topic(CMD_TOPIC)}/# allowed: {','.join(self.acl)}")
+        return True
+
+    def _resolve(self, path):
+        # nejdelší registrované jméno, které je prefixem cesty po celých segmentech
+        parts = path.split("/")
+        for i in range(len(parts), 0, -1):
+            entry = self._handlers.get("/".join(parts[:i]))
+            if entry:
+                return entry[0], "/".join(parts[i:])
+        return None, ""
+
+    def _on_message(self, topic, payload):
+        path = topic[len(self.chan.topic(CMD_TOPIC)) + 1:]
+        self.execute(path, payload)
+
+    def execute(self, path, payload=""):
+        """Vykoná příkaz a pošle odpověď; vrací dict odpovědi."""
+        req_id = None
+        try:
+            if len(payload) > CMD_MAX_PAYLOAD:
+                raise ValueError(f"payload over {CMD_MAX_PAYLOAD} B")
+            text = payload.strip()
+            try:
+                args = json.loads(text) if text else {}
+            except ValueError:
+                if text[:1] in ("{", "["):
+                    raise
+                args = text   # holý text, např. jméno kanálu
+            if not isinstance(args, dict):
+                args = {"value": args} if args not in ("", None) else {}
+            req_id = args.pop("id", None)
+        except ValueError as e:
+            return self._reply(path, req_id, error=f"bad payload: {e}")
+        if not self.allowed(path):
+            self.counters["denied"] += 1
+            print(f"[{self.name}] denied: {path}")
+            return self._reply(path, req_id, error="denied by ACL", counted=True)
+        fn, sub = self._resolve(path)
+        if fn is None:
+            return self._reply(path, req_id, error="unknown command")
+        try:
+            with self._lock:
+                result = fn(sub, args)
+        except (KeyError, ValueError, TypeError) as e:
+            return self._reply(path, req_id, error=f"{type(e).__name__}: {e}")
+        except Exception as e:
+            print(f"[{self.name}] {path} failed: {e}")
+            return self._reply(path, req_id, error=f"failed: {e}")
+        print(f"[{self.name}] {path} ok")
+        return self._reply(path, req_id, result=result)
+
+    def _reply(self, path, req_id, result=None, error=None, counted=False):
+        doc = {"id": req_id, "ok": error is None}
+        if error is None:
+            doc["result"] = result
+            self.counters["ok"] += 1
+        else:
+            doc["error"] = error
+            if not counted:
+                self.counters["error"] += 1
+        if self.chan is not None:
+            try:
+                self.chan.publish_raw(self.chan.topic(f"{CMD_RESULT_TOPIC}/{path}"),
+                                      json.dumps(doc, ensure_ascii=False, separators=(",", ":"), default=str),
+                                      retain=False, qos=1, cls="state")
+            except Exception as e:
+                print(f"[{self.name}] reply failed: {e}")
+        return doc
@@ -1,117 +1,227 @@
 import os
 import time
 import json
+import random
+import signal
+import asyncio
 import threading
 import sys
-import socket
-import shutil
-import subprocess
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import paho.mqtt.client as mqtt
 
-# --- connection latches ---
-connected = threading.Event()
-last_any_publish_ts = time.monotonic() # heartbeat for published payloads
-
-# --- log runtime ---
-print("__file__ running from:", __file__)
-print("PYTHON:", sys.executable)
-print("PAHO_VERSION:", getattr(mqtt, "__version__", "unknown"))
-print("HAS_V2:", hasattr(mqtt, "CallbackAPIVersion"))
-
-# --- .env ---
+# --- .env ---  (před importem vlastních modulů – ty čtou os.getenv už při importu)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ENV_PATH = os.path.join(BASE_DIR, ".env")
 load_dotenv(dotenv_path=ENV_PATH)
 
+from sysmetrics import read_cpu_temp, load_1m, mem_used_pct, disk_root_used_pct, uptime_s
+from systemd_status import ServiceStatus
+from netprobe import NetProber
+from modbus_probe import ModbusProbe
+from mqtt_bridge import MqttBridge, acquire_singleton
+from ha_discovery import DiscoveryRegistry, HA_STATUS_TOPIC
+from mqtt_cmd import CommandRouter, parse_acl
+
+# --- connection latches ---
+connected = threading.Event()
+last_any_publish_ts = time.monotonic() # heartbeat for published payloads
+
 # --- Konfig z .env ---
-# --- MQTT ---
-MQTT_HOST   = os.getenv("MQTT_HOST","localhost")
-MQTT_PORT   = int(os.getenv("MQTT_PORT","1883"))
-MQTT_USER   = os.getenv("MQTT_USER","")
-MQTT_PASS   = os.getenv("MQTT_PASS","")
+# --- MQTT (připojení k brokeru, QoS politika a inflight okno viz mqtt_bridge.py) ---
 MQTT_BASE   = os.getenv("MQTT_BASE_RPI","rpi-bridge")
 CLIENT_ID   = os.getenv("CLIENT_ID_RPI","rpi-monitor")
-MQTT_RECONNECT_BACKOFF_MAX_S = int(os.getenv("MQTT_RECONNECT_BACKOFF_MAX_S", "60"))
 DISCOVERY_PREFIX = os.getenv("DISCOVERY_PREFIX", "homeassistant")
+MQTT_SPOOL_PATH  = os.getenv("MQTT_SPOOL_PATH_RPI", os.path.join(BASE_DIR, "mqtt_spool_rpi.bin"))
+DISCOVERY_STATE_PATH = os.getenv("DISCOVERY_STATE_PATH_RPI", os.path.join(BASE_DIR, "discovery_state_rpi.json"))
 # --- Inverter a další ---
 INVERTER_HOST = os.getenv("INVERTER_HOST","10.10.100.253")
 INVERTER_PORT = int(os.getenv("INVERTER_PORT","502"))
 PING_HA_HOST  = os.getenv("PING_HA_HOST","192.168.1.20")
 PING_INV_HOST = os.getenv("PING_INVERTER_HOST", INVERTER_HOST)
+# TCP port pro fallback sondu, když jádro nepovolí neprivilegovaný ICMP
+PING_HA_TCP_PORT  = int(os.getenv("PING_HA_TCP_PORT","8123"))
+PING_INV_TCP_PORT = int(os.getenv("PING_INVERTER_TCP_PORT", str(INVERTER_PORT)))
 PROXY_UNIT    = os.getenv("PROXY_SYSTEMD_UNIT","modbus_tcp_proxy.service")
+# Modbus sonda (FC3/FC4) přes lokální proxy a volitelně přímo na střídač
+PROXY_PROBE_HOST    = os.getenv("PROXY_PROBE_HOST","127.0.0.1")
+PROXY_PROBE_PORT    = int(os.getenv("LISTEN_PORT","502"))
+MODBUS_PROBE_S      = int(os.getenv("MODBUS_PROBE_S","30"))             # 0 = vypnuto
+MODBUS_PROBE_DIRECT = os.getenv("MODBUS_PROBE_DIRECT","1") in ("1","true","True")
 
 POLL_SYS_S    = int(os.getenv("POLL_SYS_S","10"))
 POLL_NET_S    = int(os.getenv("POLL_NET_S","10"))
 POLL_PROXY_S  = int(os.getenv("POLL_PROXY_S","10"))
 HEARTBEAT_S   = int(os.getenv("HEARTBEAT_S","5"))
 MAX_AGE_OK_S  = int(os.getenv("MAX_AGE_OK_S","60"))
+TASK_NAMES    = ("sys", "net", "proxy", "heartbeat") + (("modbus",) if MODBUS_PROBE_S > 0 else ())   # úlohy plánovače (metriky doby běhu / zpoždění)
+# --- Publikace jen při změně ---
+PUB_MAX_SILENCE_S = int(os.getenv("PUB_MAX_SILENCE_S","300"))   # nejpozději po této době se hodnota pošle znovu
+PUB_DEADBANDS     = os.getenv("PUB_DEADBANDS","")                # "sys/cpu_temp_c=0.5,net/ping_ha_ms=2:0.2"
+# --- Agregovaný režim: jeden JSON dokument <MQTT_BASE>/state místo topicu na metriku ---
+MQTT_AGGREGATE    = os.getenv("MQTT_AGGREGATE","0") in ("1","true","True")
+STATE_TOPIC       = "state"
+# příkazy na <MQTT_BASE>/cmd/# (viz mqtt_cmd.py): fnmatch vzory povolených příkazů, "" = vypnuto
+# celý seznam: help,stats,discovery,deadband/*,interval/*
+CMD_ACL           = parse_acl(os.getenv("MQTT_CMD_ACL_RPI","help,stats,discovery"))
 
 DEVICE_ID   = os.getenv("DEVICE_ID","RPi-Monitor")
 DEVICE_NAME = os.getenv("DEVICE_NAME","RPi Monitor")
 DEVICE_MODEL= os.getenv("DEVICE_MODEL","RPi Bridge Utils")
 DEVICE_MF   = os.getenv("DEVICE_MF","RPi")
 
-# --- Singleton lock: zabran spusteni 2. instance ---
-_singleton = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
-try:
-    _singleton.bind("\0mqtt_report.singleton")
-except OSError:
-    print("Another mqtt-report instance is running. Exiting.")
-    sys.exit(1)
-
-# --- MQTT klient ---
-mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,client_id=CLIENT_ID,clean_session=True)
-if MQTT_USER:
-    mqttc.username_pw_set(MQTT_USER, MQTT_PASS)
+# --- MQTT kanál na sdíleném klientovi (LWT, store-and-forward buffer), nastaví attach() ---
+chan = None
+
+# --- Publish vrstva: cache poslední hodnoty, deadband, max. ticho ---
+# topic_suffix -> (absolutní deadband, relativní deadband); změna <= max(abs, rel*|last|) se neposílá
+DEADBANDS = {
+    "sys/cpu_temp_c":              (0.5, 0.0),
+    "sys/load_1m":                 (0.05, 0.1),
+    "sys/mem_used_pct":            (0.5, 0.0),
+    "sys/disk_root_used_pct":      (0.1, 0.0),
+    "sys/uptime_s":                (600, 0.0),
+    "net/ping_ha_ms":              (2.0, 0.2),
+    "net/ping_inverter_ms":        (2.0, 0.2),
+    "net/tcp_inverter_latency_ms": (2.0, 0.2),
+    "proxy/memory_mb":             (1.0, 0.0),
+    "bridge/last_poll_age_s":      (15, 0.0),
+    "bridge/pub_sent":             (100, 0.0),
+    "bridge/pub_suppressed":       (100, 0.0),
+    "bridge/buffer_depth":         (10, 0.0),
+    "bridge/buffer_disk_kb":       (16, 0.0),
+}
 
-# LWT: dostupnost zarizeni
-mqttc.will_set(f"{MQTT_BASE}/bridge/online", "0", qos=1, retain=True)
-# Auto-reconnect backoff
-mqttc.reconnect_delay_set(min_delay=2, max_delay=MQTT_RECONNECT_BACKOFF_MAX_S)
+def _parse_deadbands(spec):
+    out = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        topic, val = item.split("=", 1)
+        a, _, r = val.partition(":")
+        try:
+            out[topic.strip()] = (float(a or 0), float(r or 0))
+        except ValueError:
+            print(f"[MQTT] invalid PUB_DEADBANDS item: {item}")
+    return out
+
+for _host in ("ping_ha", "ping_inverter"):
+    DEADBANDS[f"net/{_host}_loss_pct"] = (1.0, 0.0)
+    DEADBANDS[f"net/{_host}_jitter_ms"] = (1.0, 0.2)
+    DEADBANDS[f"net/{_host}_p95_ms"] = (2.0, 0.2)
+for _t in ("proxy", "backend"):
+    DEADBANDS[f"net/modbus_{_t}_ms"] = (5.0, 0.2)
+    DEADBANDS[f"net/modbus_{_t}_p50_ms"] = (5.0, 0.2)
+    DEADBANDS[f"net/modbus_{_t}_p95_ms"] = (5.0, 0.2)
+    DEADBANDS[f"net/modbus_{_t}_loss_pct"] = (1.0, 0.0)
+DEADBANDS["net/modbus_proxy_overhead_ms"] = (2.0, 0.2)
+for _name in TASK_NAMES:
+    DEADBANDS[f"bridge/task_{_name}_ms"] = (50, 0.5)
+    DEADBANDS[f"bridge/task_{_name}_lag_ms"] = (50, 0.5)
+DEADBANDS.update(_parse_deadbands(PUB_DEADBANDS))
+
+
+class ChangeFilter:
+    """Rozhodne, zda hodnotu poslat: změna mimo deadband nebo překročené max. ticho."""
+
+    def __init__(self, deadbands, max_silence_s):
+        self.deadbands = deadbands
+        self.max_silence_s = max_silence_s
+        self._last = {}          # topic -> (payload, ts)
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.suppressed = 0
+
+    def _changed(self, topic, old, new):
+        if old == new:
+            return False
+        db = self.deadbands.get(topic)
+        if db is None:
+            return True
+        try:
+            o, n = float(old), float(new)
+        except (TypeError, ValueError):
+            return True
+        # chybové hodnoty (-1) a návrat z nich vždy propustit
+        if (o < 0) != (n < 0):
+            return True
+        return abs(n - o) > max(db[0], db[1] * abs(o))
+
+    def check(self, topic, payload, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last = self._last.get(topic)
+            if last is None or now - last[1] >= self.max_silence_s or self._changed(topic, last[0], payload):
+                self._last[topic] = (payload, now)
+                self.sent += 1
+                return True
+            self.suppressed += 1
+            return False
+
+    def reset(self):
+        """Po (re)connectu pošli vše znovu (broker mohl ztratit retained hodnoty)."""
+        with self._lock:
+            self._last.clear()
+
+
+pub_filter = ChangeFilter(DEADBANDS, PUB_MAX_SILENCE_S)
+
+# agregovaný stav: klíč = poslední část topicu (sys/cpu_temp_c -> cpu_temp_c)
+state_doc = {}
+state_dirty = False
+state_lock = threading.Lock()
+NOT_AGGREGATED = {"bridge/online"}   # dostupnost (LWT) zůstává samostatně
+
+def _state_key(topic_suffix):
+    return topic_suffix.rsplit("/", 1)[-1]
+
+def _stage(topic_suffix, payload, force):
+    """Agregovaný režim: zapiš hodnotu do dokumentu, odeslání až ve flush_state()."""
+    global state_dirty
+    changed = force or pub_filter.check(topic_suffix, payload)
+    with state_lock:
+        state_doc[_state_key(topic_suffix)] = payload
+        if changed:
+            state_dirty = True
+
+def flush_state():
+    """Na konci cyklu workeru pošle celý dokument, pokud se něco změnilo."""
+    global state_dirty
+    if not MQTT_AGGREGATE:
+        return
+    with state_lock:
+        if not state_dirty:
+            return
+        doc = json.dumps(state_doc, ensure_ascii=False, separators=(",", ":"))
+        state_dirty = False
+    _send(STATE_TOPIC, doc, retain=True)
 
 # --- helpers ---
-def publish(topic_suffix, payload, retain=True, qos=1):
-    """Bezpecny publish s odchytem vyjimek + update TS."""
+def publish(topic_suffix, payload, retain=True, qos=None, force=False):
+    """Bezpecny publish s odchytem vyjimek + update TS; nezmenene hodnoty se zahodi."""
+    if MQTT_AGGREGATE and topic_suffix not in NOT_AGGREGATED:
+        _stage(topic_suffix, payload, force)
+        return
+    if not force and not pub_filter.check(topic_suffix, payload):
+        return
+    _send(topic_suffix, payload, retain=retain, qos=qos)
+
+def _send(topic_suffix, payload, retain=True, qos=None):
     global last_any_publish_ts
-    topic = f"{MQTT_BASE}/{topic_suffix}"
+    # dostupnost jde jen živě, vše ostatní přes store-and-forward buffer kanálu
+    chan.publish(topic_suffix, payload, retain=retain, qos=qos)
+    last_any_publish_ts = time.monotonic()
+
+# --- MQTT callback (kódy a v1/v2 kompatibilitu řeší mqtt_bridge) ---
+def on_connect(ch):
+    pub_filter.reset()
+    publish("bridge/online", "online", retain=True, force=True)
     try:
-        mqttc.publish(topic, str(payload), qos=qos, retain=retain)
-        last_any_publish_ts = time.monotonic()
+        publish_discovery()
     except Exception as e:
-        print(f"[MQTT] publish failed {topic}: {e}")
-
-# --- MQTT callbacks (v1/v2 kompatibilita) ---
-def _normalize_code(raw):
-    code = getattr(raw, "value", raw)
-    try: return int(code)
-    except: return 0
-
-def on_connect(client, userdata, *args, **kwargs):
-    raw = kwargs.get("reason_code", kwargs.get("rc", 0))
-    if len(args) > 1:
-        raw = args[1]
-    code = _normalize_code(raw)
-    print(f"MQTT connected rc={code}")
-    if code == 0:
-        publish("bridge/online", "online", retain=True, qos=1)
-        try:
-            publish_discovery()
-        except Exception as e:
-            print(f"publish_discovery failed: {e}")
-        connected.set()
-
-def on_disconnect(client, userdata, *args, **kwargs):
-    raw = kwargs.get("reason_code", kwargs.get("rc", -1))
-    if len(args) > 0:
-        raw = args[0]
-    code = _normalize_code(raw)
-    print(f"MQTT disconnected rc={code}")
-    # NEPOSILAT "offline" – spolehni se na LWT pri necis. padu
-
-mqttc.on_connect = on_connect
-mqttc.on_disconnect = on_disconnect
+        print(f"publish_discovery failed: {e}")
+    connected.set()
+    # při odpojení NEPOSILAT "offline" – spolehni se na LWT pri necis. padu
 
 # --- Discovery helper ---
 DEVICE_BLOCK = {
@@ -126,29 +236,72 @@ AVAIL = [{
     "payload_not_available": "0"
 }]
 
-def _disc_pub(kind, obj, key, cfg):
-    topic = f"{DISCOVERY_PREFIX}/{kind}/{obj}/{key}/config"
-    mqttc.publish(topic, json.dumps(cfg), qos=1, retain=True)
-
-def publish_discovery():
-    # Sensors
-    sensors = [
-        ("cpu_temp_c",      "Teplota CPU",            "temperature", "measurement", "°C"),
-        ("load_1m",         "Zátěž 1m",               None,          "measurement", None),
-        ("mem_used_pct",    "RAM použito",            "battery",     "measurement", "%"),
-        ("disk_root_used_pct","Disk / využití",       "battery",     "measurement", "%"),
-        ("uptime_s",        "Uptime",                 "duration",    "measurement", "s"),
-        ("ping_ha_ms",      "Ping HA (ms)",           None,          "measurement", "ms"),
-        ("ping_inverter_ms","Ping Inverter (ms)",     None,          "measurement", "ms"),
-        ("tcp_inverter_latency_ms","TCP Inverter latency (ms)", None, "measurement","ms"),
-        ("last_poll_age_s", "Doba od poslední publikace (s)", None, "measurement","s"),
-    ]
-    for key, name, dev_cla, stat_cla, unit in sensors:
+def _disc_state(cfg, key):
+    """V agregovaném režimu přesměruje entitu na <MQTT_BASE>/state + value_template."""
+    if MQTT_AGGREGATE:
+        cfg["stat_t"] = f"{MQTT_BASE}/{STATE_TOPIC}"
+        cfg["val_tpl"] = f"{{{{ value_json.{key} }}}}"
+    return cfg
+
+# deklarativní tabulka entit: (klíč, název, device_class, state_class, jednotka)
+SENSORS = [
+    ("cpu_temp_c",      "Teplota CPU",            "temperature", "measurement", "°C"),
+    ("load_1m",         "Zátěž 1m",               None,          "measurement", None),
+    ("mem_used_pct",    "RAM použito",            "battery",     "measurement", "%"),
+    ("disk_root_used_pct","Disk / využití",       "battery",     "measurement", "%"),
+    ("uptime_s",        "Uptime",                 "duration",    "measurement", "s"),
+    ("ping_ha_ms",      "Ping HA (ms)",           None,          "measurement", "ms"),
+    ("ping_inverter_ms","Ping Inverter (ms)",     None,          "measurement", "ms"),
+    ("ping_ha_loss_pct",       "Ping HA ztráty",          None, "measurement", "%"),
+    ("ping_ha_jitter_ms",      "Ping HA jitter (ms)",     None, "measurement", "ms"),
+    ("ping_ha_p95_ms",         "Ping HA p95 (ms)",        None, "measurement", "ms"),
+    ("ping_inverter_loss_pct", "Ping Inverter ztráty",    None, "measurement", "%"),
+    ("ping_inverter_jitter_ms","Ping Inverter jitter (ms)", None, "measurement", "ms"),
+    ("ping_inverter_p95_ms",   "Ping Inverter p95 (ms)",  None, "measurement", "ms"),
+    ("tcp_inverter_latency_ms","TCP Inverter latency (ms)", None, "measurement","ms"),
+    ("modbus_proxy_ms",        "Modbus přes proxy (ms)",       None, "measurement", "ms"),
+    ("modbus_proxy_p50_ms",    "Modbus přes proxy p50 (ms)",   None, "measurement", "ms"),
+    ("modbus_proxy_p95_ms",    "Modbus přes proxy p95 (ms)",   None, "measurement", "ms"),
+    ("modbus_proxy_loss_pct",  "Modbus přes proxy chyby",      None, "measurement", "%"),
+    ("modbus_proxy_exceptions","Modbus přes proxy výjimky",    None, "total_increasing", None),
+    ("modbus_proxy_tid_mismatch","Modbus přes proxy TID nesoulad", None, "total_increasing", None),
+    ("modbus_backend_ms",      "Modbus přímo (ms)",            None, "measurement", "ms"),
+    ("modbus_backend_p50_ms",  "Modbus přímo p50 (ms)",        None, "measurement", "ms"),
+    ("modbus_backend_p95_ms",  "Modbus přímo p95 (ms)",        None, "measurement", "ms"),
+    ("modbus_backend_loss_pct","Modbus přímo chyby",           None, "measurement", "%"),
+    ("modbus_proxy_overhead_ms","Modbus režie proxy p50 (ms)", None, "measurement", "ms"),
+    ("last_poll_age_s", "Doba od poslední publikace (s)", None, "measurement","s"),
+    ("n_restarts",      "Proxy restarty",         None,          "total_increasing", None),
+    ("memory_mb",       "Proxy RAM (MiB)",        None,          "measurement", "MiB"),
+    ("pub_sent",        "MQTT odeslané zprávy",   None,          "total_increasing", None),
+    ("pub_suppressed",  "MQTT potlačené zprávy",  None,          "total_increasing", None),
+    ("buffer_depth",    "MQTT fronta (zpráv)",    None,          "measurement", None),
+    ("buffer_dropped",  "MQTT zahozené zprávy",   None,          "total_increasing", None),
+    ("buffer_disk_kb",  "MQTT fronta na disku",   "data_size",   "measurement", "kB"),
+]
+for _n in TASK_NAMES:
+    SENSORS.append((f"task_{_n}_ms",     f"Úloha {_n} doba běhu",      "duration", "measurement", "ms"))
+    SENSORS.append((f"task_{_n}_lag_ms", f"Úloha {_n} zpoždění startu", "duration", "measurement", "ms"))
+
+BIN_SENSORS = [
+    ("tcp_inverter_ok", "TCP inverter OK"),
+    ("modbus_proxy_ok", "Modbus přes proxy OK"),
+    ("flow_ok",         "Flow OK"),           # age < MAX_AGE_OK_S
+    ("systemd_active",  "Proxy aktivní"),
+]
+
+def _disc_topic(kind, obj, key):
+    return f"{DISCOVERY_PREFIX}/{kind}/{obj}/{key}/config"
+
+def discovery_entities():
+    """(config topic, cfg) pro všechny entity; serializuje se jednou v DiscoveryRegistry."""
+    for key, name, dev_cla, stat_cla, unit in SENSORS:
         cfg = {
             "name": f"{DEVICE_NAME} {name}",
             "uniq_id": f"{DEVICE_ID}_{key}",
             "stat_t": f"{MQTT_BASE}/sys/{key}" if key in ["cpu_temp_c","load_1m","mem_used_pct","disk_root_used_pct","uptime_s"] else (
-                      f"{MQTT_BASE}/net/{key}" if key.startswith(("ping_","tcp_")) else
+                      f"{MQTT_BASE}/net/{key}" if key.startswith(("ping_","tcp_","modbus_")) else
+                      f"{MQTT_BASE}/proxy/{key}" if key in ["n_restarts","memory_mb"] else
                       f"{MQTT_BASE}/bridge/{key}"),
             "avty": AVAIL,
             "dev": DEVICE_BLOCK,
@@ -156,19 +309,13 @@ def publish_discovery():
         if dev_cla:   cfg["dev_cla"]  = dev_cla
         if stat_cla:  cfg["stat_cla"] = stat_cla
         if unit:      cfg["unit_of_meas"] = unit
-        _disc_pub("sensor", "rpi", key, cfg)
+        yield _disc_topic("sensor", "rpi", key), _disc_state(cfg, key)
 
-    # Binary sensors
-    bin_sensors = [
-        ("tcp_inverter_ok", "TCP inverter OK"),
-        ("flow_ok",         "Flow OK"),           # age < MAX_AGE_OK_S
-        ("systemd_active",  "Proxy aktivní"),
-    ]
-    for key, name in bin_sensors:
+    for key, name in BIN_SENSORS:
         cfg = {
             "name": f"{DEVICE_NAME} {name}",
             "uniq_id": f"{DEVICE_ID}_{key}",
-            "stat_t": f"{MQTT_BASE}/net/{key}" if key.startswith("tcp_") else (
+            "stat_t": f"{MQTT_BASE}/net/{key}" if key.startswith(("tcp_","modbus_")) else (
                       f"{MQTT_BASE}/bridge/{key}" if key in ["flow_ok"] else
                       f"{MQTT_BASE}/proxy/{key}"),
             "pl_on": "1",
@@ -177,168 +324,320 @@ def publish_discovery():
             "avty": AVAIL,
             "dev": DEVICE_BLOCK,
         }
-        _disc_pub("binary_sensor", "rpi", key, cfg)
+        yield _disc_topic("binary_sensor", "rpi", key), _disc_state(cfg, key)
 
-# --- Helpers: system info / ping / tcp / service ---
-def read_cpu_temp():
-    try:
-        with open("/sys/class/thermal/thermal_zone0/temp","r") as f:
-            return round(int(f.read().strip())/1000.0, 1)
-    except: return None
+# hashe odeslaných konfigurací -> po reconnectu se posílají jen změny (viz ha_discovery.py)
+discovery = DiscoveryRegistry(DISCOVERY_STATE_PATH)
 
-def load_1m():
-    try: return round(os.getloadavg()[0], 2)
-    except: return None
+def publish_discovery(force=False):
+    return discovery.sync(chan.publish_raw, force=force)
 
-def mem_used_pct():
-    try:
-        with open("/proc/meminfo") as f:
-            kv = {}
-            for line in f:
-                parts = line.split(":")
-                if len(parts)>=2:
-                    kv[parts[0]] = int(parts[1].strip().split()[0])  # kB
-        total = kv.get("MemTotal",0)
-        free  = kv.get("MemFree",0) + kv.get("Buffers",0) + kv.get("Cached",0)
-        used  = max(0, total - free)
-        return round(used*100.0/total, 1) if total>0 else None
-    except: return None
-
-def disk_root_used_pct():
-    try:
-        total, used, free = shutil.disk_usage("/")
-        return round(used*100.0/total, 1)
-    except: return None
-
-def uptime_s():
-    try:
-        with open("/proc/uptime") as f:
-            return int(float(f.read().split()[0]))
-    except: return None
+# --- Helpers: system info / ping / tcp / service ---
+# systémové metriky (read_cpu_temp, load_1m, ...) čte sdílený modul sysmetrics
 
-def ping_once(host, timeout_s=1):
-    try:
-        # -c 1 (jedno echo), -W timeout v sekundách
-        r = subprocess.run(["/bin/ping","-c","1","-W",str(timeout_s),host],
-                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
-        if r.returncode != 0:
-            return -1
-        # najdi time=XX ms
-        for line in r.stdout.splitlines():
-            if "time=" in line:
-                try:
-                    ms = float(line.split("time=")[1].split()[0])
-                    return ms
-                except:
-                    pass
-        return -1
-    except:
-        return -1
+# ping přes ICMP datagram socket v procesu (fallback TCP connect), klouzavé okno RTT/ztrát, viz netprobe.py
+prober = NetProber()
 
-def tcp_latency_ms(host, port, timeout_s=1.0):
+async def tcp_latency_ms(host, port, timeout_s=1.0):
     t0 = time.perf_counter()
     try:
-        with socket.create_connection((host, port), timeout=timeout_s):
-            dt = (time.perf_counter()-t0)*1000.0
-            return True, round(dt,1)
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout_s)
+        dt = (time.perf_counter()-t0)*1000.0
+        writer.close()
+        return True, round(dt,1)
     except:
         return False, -1.0
 
+# end-to-end Modbus čtení: "proxy" = přes modbus_tcp_proxy, "backend" = přímo střídač (viz modbus_probe.py)
+_modbus_targets = {"proxy": (PROXY_PROBE_HOST, PROXY_PROBE_PORT)}
+if MODBUS_PROBE_DIRECT:
+    _modbus_targets["backend"] = (INVERTER_HOST, INVERTER_PORT)
+modbus_probe = ModbusProbe(_modbus_targets)
+
+# stav proxy jednotky: D-Bus push (PropertiesChanged) nebo jeden `systemctl show`, viz systemd_status.py
+proxy_wake = None   # asyncio.Event, vytvoří se v běžící smyčce
+
+def _on_proxy_change(unit, st):
+    # volá se z vlákna D-Bus watcheru -> předat do event loopu bezpečně
+    if proxy_wake is not None and loop_ref is not None:
+        loop_ref.call_soon_threadsafe(proxy_wake.set)
+
+proxy_status = ServiceStatus([PROXY_UNIT], on_change=_on_proxy_change)
+
 def systemd_is_active(unit):
     try:
-        r = subprocess.run(["/bin/systemctl","is-active", unit],
-                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
-        return 1 if r.stdout.strip()=="active" else 0
+        return proxy_status.is_active(unit)
     except:
         return 0
 
-# --- Workers ---
-stop_evt = threading.Event()
+# --- asyncio plánovač (jedna smyčka místo čtyř spících vláken) ---
+SCHED_JITTER_S  = float(os.getenv("SCHED_JITTER_S","0.5"))   # náhodný posun startu cyklu
+PROBE_TIMEOUT_S = float(os.getenv("PROBE_TIMEOUT_S","2"))    # strop pro jednu sondu
+
+stop_evt = None        # asyncio.Event
+loop_ref = None
 last_publish_ts = time.monotonic()
+task_stats = {}        # name -> {"duration_ms", "lag_ms", "overruns"}
+task_periods = {}      # name -> perioda (s); příkaz cmd/interval ji mění za běhu
 
-def worker_sys():
-    while not stop_evt.is_set():
-        if connected.is_set():
-            v = read_cpu_temp()
-            if v is not None: publish("sys/cpu_temp_c", v)
-            v = load_1m()
-            if v is not None: publish("sys/load_1m", v)
-            v = mem_used_pct()
-            if v is not None: publish("sys/mem_used_pct", v)
-            v = disk_root_used_pct()
-            if v is not None: publish("sys/disk_root_used_pct", v)
-            v = uptime_s()
-            if v is not None: publish("sys/uptime_s", v)
-            global last_publish_ts
-            last_publish_ts = time.monotonic()
-        time.sleep(POLL_SYS_S)
-
-def worker_net():
-    while not stop_evt.is_set():
-        if connected.is_set():
-            ms = ping_once(PING_HA_HOST, 1)
-            publish("net/ping_ha_ms", ms)
-            ms = ping_once(PING_INV_HOST, 1)
-            publish("net/ping_inverter_ms", ms)
-            ok, lat = tcp_latency_ms(INVERTER_HOST, INVERTER_PORT, 1.0)
-            publish("net/tcp_inverter_ok", "1" if ok else "0")
-            publish("net/tcp_inverter_latency_ms", lat)
-        time.sleep(POLL_NET_S)
-
-def worker_proxy():
-    last_state = None
-    while not stop_evt.is_set():
-        if connected.is_set():
-            st = systemd_is_active(PROXY_UNIT)  # 1|0
-            publish("proxy/systemd_active", st)
-            # zmena statu -> publ. timestamp
-            if st != last_state:
-                ts = datetime.now(timezone.utc).isoformat()
-                publish("proxy/last_status_change_ts", ts)
-                last_state = st
-        time.sleep(POLL_PROXY_S)
-
-def worker_heartbeat():
+async def _probe(coro, default):
+    """Sonda s vlastním timeoutem; pomalá sonda nezdrží ostatní."""
+    try:
+        return await asyncio.wait_for(coro, timeout=PROBE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        return default
+
+async def run_every(name, period_s, fn, wake=None):
+    """
+    Fixed-rate plán: cykly leží na mřížce start + k*period (bez driftu), každý
+    s náhodným jitterem. Zmeškané cykly se přeskočí. `wake` umožní cyklus
+    spustit dřív (push událost). Doba běhu a zpoždění startu jdou do task_stats.
+    Perioda se čte z task_periods každý cyklus (změna platí od dalšího cyklu).
+    """
+    loop = asyncio.get_running_loop()
+    grid = loop.time()
+    st = task_stats.setdefault(name, {"duration_ms": 0.0, "lag_ms": 0.0, "overruns": 0})
+    task_periods.setdefault(name, period_s)
     while not stop_evt.is_set():
+        period_s = task_periods[name]
+        target = grid + random.uniform(0, SCHED_JITTER_S)
+        delay = max(0.0, target - loop.time())
+        woke = False
+        if wake is not None:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=delay)
+                woke = True
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+        else:
+            await asyncio.sleep(delay)
+        if stop_evt.is_set():
+            break
+        st["lag_ms"] = 0.0 if woke else round(max(0.0, loop.time() - target) * 1000.0, 1)
+        t0 = loop.time()
         if connected.is_set():
-            age = int(time.monotonic() - last_publish_ts)
-            publish("bridge/last_poll_age_s", age)
-            flow_ok = "1" if age < MAX_AGE_OK_S else "0"
-            publish("bridge/flow_ok", flow_ok)
-        time.sleep(HEARTBEAT_S)
-
-def main():
-    print("__file__ running from:", os.path.abspath(__file__))
-    print("MQTT:", f"{MQTT_HOST}:{MQTT_PORT}", "BASE:", MQTT_BASE, "CLIENT_ID:", CLIENT_ID)
-
-    mqttc.on_connect = on_connect
-    mqttc.on_disconnect = on_disconnect
-
-    mqttc.connect(MQTT_HOST, MQTT_PORT, 60)
-    mqttc.loop_start()
+            try:
+                await asyncio.wait_for(fn(), timeout=period_s)
+            except asyncio.TimeoutError:
+                st["overruns"] += 1
+                print(f"[SCHED] task {name} exceeded {period_s}s")
+            except Exception as e:
+                print(f"[SCHED] task {name} failed: {e}")
+        st["duration_ms"] = round((loop.time() - t0) * 1000.0, 1)
+        # další bod mřížky v budoucnosti
+        now = loop.time()
+        grid += period_s
+        if grid <= now:
+            grid += ((now - grid) // period_s + 1) * period_s
+
+async def task_sys():
+    global last_publish_ts
+    v = read_cpu_temp()
+    if v is not None: publish("sys/cpu_temp_c", v)
+    v = load_1m()
+    if v is not None: publish("sys/load_1m", v)
+    v = mem_used_pct()
+    if v is not None: publish("sys/mem_used_pct", v)
+    v = disk_root_used_pct()
+    if v is not None: publish("sys/disk_root_used_pct", v)
+    v = uptime_s()
+    if v is not None: publish("sys/uptime_s", v)
+    flush_state()
+    last_publish_ts = time.monotonic()
+
+def _publish_ping(prefix, res):
+    """last_ms zůstává v původním topicu (-1 = nedostupné), k tomu ztráty/jitter/p95 z okna."""
+    if res is None:
+        publish(f"net/{prefix}_ms", -1)
+        return
+    publish(f"net/{prefix}_ms", res["last_ms"])
+    for key in ("loss_pct", "jitter_ms", "p95_ms"):
+        if res[key] is not None:
+            publish(f"net/{prefix}_{key}", res[key])
+
+async def task_net():
+    # všechny sondy souběžně, každá s vlastním timeoutem
+    ha, inv, (ok, lat) = await asyncio.gather(
+        _probe(prober.probe("ha", PING_HA_HOST, PING_HA_TCP_PORT, 1.0), None),
+        _probe(prober.probe("inverter", PING_INV_HOST, PING_INV_TCP_PORT, 1.0), None),
+        _probe(tcp_latency_ms(INVERTER_HOST, INVERTER_PORT, 1.0), (False, -1.0)),
+    )
+    _publish_ping("ping_ha", ha)
+    _publish_ping("ping_inverter", inv)
+    publish("net/tcp_inverter_ok", "1" if ok else "0")
+    publish("net/tcp_inverter_latency_ms", lat)
+    flush_state()
+
+async def task_modbus():
+    # cíle postupně (dongle nesnese souběžná spojení), timeout na jedno čtení
+    res = await modbus_probe.probe_all(timeout_s=PROBE_TIMEOUT_S)
+    p50 = {}
+    for name, r in res.items():
+        st = modbus_probe.stats(name)
+        publish(f"net/modbus_{name}_ms", r["rtt_ms"] if r["rtt_ms"] is not None and r["tid_ok"] else -1)
+        for key in ("p50_ms", "p95_ms", "loss_pct"):
+            if st[key] is not None:
+                publish(f"net/modbus_{name}_{key}", st[key])
+        publish(f"net/modbus_{name}_exceptions", st["exceptions"])
+        publish(f"net/modbus_{name}_tid_mismatch", st["tid_mismatch"])
+        p50[name] = st["p50_ms"]
+        if r["error"] or r["exception"] is not None:
+            print(f"[MODBUS] {name}: error={r['error']} exception={r['exception']}")
+    publish("net/modbus_proxy_ok", "1" if res["proxy"]["ok"] else "0")
+    # režie proxy = rozdíl mediánů (odolné vůči jednotlivým špičkám)
+    if p50.get("proxy") is not None and p50.get("backend") is not None:
+        publish("net/modbus_proxy_overhead_ms", round(p50["proxy"] - p50["backend"], 2))
+    flush_state()
+
+_proxy_last_state = None
+
+async def task_proxy():
+    global _proxy_last_state
+    # bez D-Bus push může snapshot volat `systemctl show` -> mimo event loop
+    st = await asyncio.to_thread(systemd_is_active, PROXY_UNIT)  # 1|0
+    publish("proxy/systemd_active", st)
+    detail = proxy_status.get(PROXY_UNIT)
+    if detail["restarts"] is not None:
+        publish("proxy/n_restarts", detail["restarts"])
+    if detail["memory_bytes"] is not None:
+        publish("proxy/memory_mb", round(detail["memory_bytes"] / 1048576.0, 1))
+    # zmena statu -> publ. timestamp
+    if st != _proxy_last_state:
+        ts = datetime.now(timezone.utc).isoformat()
+        publish("proxy/last_status_change_ts", ts)
+        _proxy_last_state = st
+    flush_state()
+
+async def task_heartbeat():
+    age = int(time.monotonic() - last_publish_ts)
+    publish("bridge/last_poll_age_s", age)
+    flow_ok = "1" if age < MAX_AGE_OK_S else "0"
+    publish("bridge/flow_ok", flow_ok)
+    # počitadla publish vrstvy (odeslané vs. potlačené)
+    publish("bridge/pub_sent", pub_filter.sent)
+    publish("bridge/pub_suppressed", pub_filter.suppressed)
+    # store-and-forward fronta (hloubka, zahozené, velikost segmentu)
+    bs = chan.buffer.stats()
+    publish("bridge/buffer_depth", bs["depth"])
+    publish("bridge/buffer_dropped", bs["dropped"])
+    publish("bridge/buffer_disk_kb", round(bs["disk_bytes"] / 1024.0, 1))
+    # doba běhu úloh a zpoždění plánovače
+    for name, st in task_stats.items():
+        publish(f"bridge/task_{name}_ms", st["duration_ms"])
+        publish(f"bridge/task_{name}_lag_ms", st["lag_ms"])
+    flush_state()
+
+async def scheduler():
+    global stop_evt, loop_ref, proxy_wake
+    loop_ref = asyncio.get_running_loop()
+    stop_evt = asyncio.Event()
+    proxy_wake = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop_ref.add_signal_handler(sig, stop_evt.set)
+        except (NotImplementedError, RuntimeError):
+            pass
 
-    threads = [
-        threading.Thread(target=worker_sys, daemon=True),
-        threading.Thread(target=worker_net, daemon=True),
-        threading.Thread(target=worker_proxy, daemon=True),
-        threading.Thread(target=worker_heartbeat, daemon=True),
+    await asyncio.to_thread(proxy_status.start)
+    tasks = [
+        asyncio.create_task(run_every("sys", POLL_SYS_S, task_sys)),
+        asyncio.create_task(run_every("net", POLL_NET_S, task_net)),
+        asyncio.create_task(run_every("proxy", POLL_PROXY_S, task_proxy, wake=proxy_wake)),
+        asyncio.create_task(run_every("heartbeat", HEARTBEAT_S, task_heartbeat)),
     ]
-    for t in threads: t.start()
-
+    if MODBUS_PROBE_S > 0:
+        tasks.append(asyncio.create_task(run_every("modbus", MODBUS_PROBE_S, task_modbus)))
+    await stop_evt.wait()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    proxy_status.stop()
+
+# --- příkazy na <MQTT_BASE>/cmd/# (odpověď na <MQTT_BASE>/cmd_result/...) ---
+commands = CommandRouter(CMD_ACL, name="rpi CMD")
+
+def cmd_discovery(sub, args):
+    return {"sent": publish_discovery(force=True), "counters": dict(discovery.counters)}
+
+def cmd_deadband(sub, args):
+    # cmd/deadband/sys/cpu_temp_c "1.0"  |  {"abs": 2, "rel": 0.2}  |  {} = dotaz
+    if not sub:
+        return {t: list(db) for t, db in sorted(DEADBANDS.items())}
+    cur = DEADBANDS.get(sub, (0.0, 0.0))
+    if "value" in args:
+        args = {"abs": args["value"]}
+    if args:
+        new = (float(args.get("abs", cur[0])), float(args.get("rel", cur[1])))
+        if new[0] < 0 or new[1] < 0:
+            raise ValueError("deadband must be >= 0")
+        DEADBANDS[sub] = new   # ChangeFilter čte stejný slovník
+        cur = new
+    return {sub: list(cur)}
+
+def cmd_interval(sub, args):
+    # cmd/interval/net "30" – perioda úlohy plánovače (s), platí od dalšího cyklu
+    if not sub:
+        return dict(task_periods)
+    if sub not in task_periods:
+        raise KeyError(f"unknown task {sub!r} ({', '.join(task_periods)})")
+    if "value" in args:
+        period = float(args["value"])
+        if period < 1:
+            raise ValueError("interval must be >= 1 s")
+        task_periods[sub] = period
+    return {sub: task_periods[sub]}
+
+def cmd_stats(sub, args):
+    return {
+        "pub_sent": pub_filter.sent,
+        "pub_suppressed": pub_filter.suppressed,
+        "tasks": {n: dict(st, period_s=task_periods.get(n)) for n, st in task_stats.items()},
+        "buffer": chan.buffer.stats(),
+        "discovery": dict(discovery.counters),
+        "commands": dict(commands.counters),
+    }
+
+commands.register("discovery", cmd_discovery, "poslat znovu všechny discovery konfigurace")
+commands.register("deadband", cmd_deadband, "deadband/<topic> {abs, rel}; bez topicu výpis")
+commands.register("interval", cmd_interval, "interval/<úloha> <s>; bez úlohy výpis period")
+commands.register("stats", cmd_stats, "čítače publikací, úloh plánovače a fronty")
+
+def attach(bridge):
+    """Zaregistruje reporter na sdíleném MQTT klientovi (samostatně i v mqtt_bridge_main.py)."""
+    global chan
+    chan = bridge.channel(MQTT_BASE, MQTT_SPOOL_PATH, on_connect=on_connect)
+    discovery.set_entities(discovery_entities())
+    # restart HA (birth "online") -> poslat všechny konfigurace znovu
+    chan.subscribe(HA_STATUS_TOPIC, discovery.on_ha_status(chan.publish_raw))
+    commands.attach(chan)
+    return chan
+
+def run():
+    """Běží do SIGINT/SIGTERM (v hlavním vlákně) nebo do stop_evt.set()."""
     try:
-        while True:
-            time.sleep(1)
+        asyncio.run(scheduler())
     except KeyboardInterrupt:
         pass
     finally:
-        stop_evt.set()
-        time.sleep(0.5)
         try:
-            publish("bridge/online", "offline", retain=True)  # korektni vypnuti
+            publish("bridge/online", "offline", retain=True, force=True)  # korektni vypnuti
         except Exception:
             pass
-        mqttc.loop_stop()
-        mqttc.disconnect()
+
+def main():
+    print("__file__ running from:", os.path.abspath(__file__))
+    print("PYTHON:", sys.executable)
+    print("PAHO_VERSION:", getattr(mqtt, "__version__", "unknown"))
+    acquire_singleton("mqtt_report")
+
+    bridge = MqttBridge(CLIENT_ID)
+    attach(bridge)
+    bridge.start()
+    try:
+        run()
+    finally:
+        bridge.stop()
 
 if __name__ == "__main__":
     main()
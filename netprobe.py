@@ -0,0 +1,184 @@
+# netprobe.py — ICMP/TCP sondy v procesu (asyncio), klouzavé okno RTT a ztrát na host
+import os
+import time
+import socket
+import struct
+import asyncio
+import itertools
+from collections import deque
+
+PROBE_COUNT     = int(os.getenv("PROBE_COUNT", "3"))          # počet ech na host v jednom cyklu
+PROBE_SPACING_S = float(os.getenv("PROBE_SPACING_S", "0.2"))  # rozestup ech
+PROBE_WINDOW    = int(os.getenv("PROBE_WINDOW", "60"))        # vzorků v klouzavém okně
+
+
+def _percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class RttWindow:
+    """Klouzavé okno posledních vzorků; None = ztracený paket."""
+
+    def __init__(self, size=PROBE_WINDOW):
+        self.samples = deque(maxlen=size)
+
+    def add(self, rtt_ms):
+        self.samples.append(rtt_ms)
+
+    def stats(self):
+        n = len(self.samples)
+        ok = [s for s in self.samples if s is not None]
+        out = {"samples": n, "loss_pct": None, "avg_ms": None, "p50_ms": None,
+               "p95_ms": None, "jitter_ms": None}
+        if not n:
+            return out
+        out["loss_pct"] = round((n - len(ok)) * 100.0 / n, 1)
+        if ok:
+            srt = sorted(ok)
+            out["avg_ms"] = round(sum(ok) / len(ok), 2)
+            out["p50_ms"] = round(_percentile(srt, 0.50), 2)
+            out["p95_ms"] = round(_percentile(srt, 0.95), 2)
+            # jitter = průměrná absolutní změna mezi po sobě jdoucími RTT (RFC 3550 styl)
+            if len(ok) > 1:
+                out["jitter_ms"] = round(sum(abs(b - a) for a, b in zip(ok, ok[1:])) / (len(ok) - 1), 2)
+            else:
+                out["jitter_ms"] = 0.0
+        return out
+
+
+class IcmpSocket:
+    """
+    Neprivilegovaný ICMP echo přes SOCK_DGRAM/IPPROTO_ICMP (Linux, net.ipv4.ping_group_range).
+    Jeden socket pro všechny hosty, odpovědi se párují podle sekvenčního čísla.
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        self.sock.setblocking(False)
+        self._loop = None
+        self._seq = itertools.count(1)
+        self._pending = {}   # seq -> (future, t0)
+
+    def _attach(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None:
+                try:
+                    self._loop.remove_reader(self.sock.fileno())
+                except Exception:
+                    pass
+            self._loop = loop
+            loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            t1 = time.perf_counter()
+            # ICMP hlavička bez IP hlavičky: type, code, csum, id, seq
+            if len(data) < 8 or data[0] != 0:
+                continue
+            seq = struct.unpack("!H", data[6:8])[0]
+            entry = self._pending.pop(seq, None)
+            if entry and not entry[0].done():
+                entry[0].set_result((t1 - entry[1]) * 1000.0)
+
+    async def echo(self, ip, timeout_s):
+        """RTT v ms nebo None při timeoutu."""
+        self._attach()
+        seq = next(self._seq) & 0xFFFF
+        fut = self._loop.create_future()
+        # identifikátor přepíše jádro (port ping socketu), checksum dopočítá také jádro
+        pkt = struct.pack("!BBHHH", 8, 0, 0, 0, seq) + b"rpi-probe"
+        self._pending[seq] = (fut, time.perf_counter())
+        try:
+            self.sock.sendto(pkt, (ip, 0))
+            return await asyncio.wait_for(fut, timeout=timeout_s)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self._pending.pop(seq, None)
+
+
+async def tcp_connect_rtt(host, port, timeout_s):
+    """RTT TCP handshake v ms; odmítnuté spojení (RST) také znamená živý host."""
+    t0 = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout_s)
+        writer.close()
+    except ConnectionRefusedError:
+        pass
+    except Exception:
+        return None
+    return (time.perf_counter() - t0) * 1000.0
+
+
+class NetProber:
+    """
+    Sonda pro pojmenované hosty: ICMP datagram socket, fallback na TCP connect,
+    pokud jádro neprivilegovaný ICMP nepovolí. Každý cyklus pošle `count` ech
+    a výsledky přidá do klouzavého okna daného hostu.
+    """
+
+    def __init__(self, count=PROBE_COUNT, spacing_s=PROBE_SPACING_S, window=PROBE_WINDOW):
+        self.count = count
+        self.spacing_s = spacing_s
+        self.window = window
+        self.windows = {}
+        self.mode = None   # "icmp" | "tcp"
+        self._icmp = None
+
+    def _ensure_mode(self):
+        if self.mode is None:
+            try:
+                self._icmp = IcmpSocket()
+                self.mode = "icmp"
+            except OSError as e:
+                print(f"[PROBE] ICMP datagram socket unavailable ({e}), using TCP connect fallback")
+                self.mode = "tcp"
+
+    def icmp_available(self):
+        """Povolí jádro neprivilegovaný ICMP? (jinak by echoes() šlo přes TCP connect)"""
+        self._ensure_mode()
+        return self.mode == "icmp"
+
+    async def echoes(self, host, tcp_port, timeout_s=1.0, count=None):
+        """
+        Jeden cyklus `count` ech (None = self.count) bez zápisu do okna: seznam
+        RTT (ms), None = ztráta. Nepřeložitelný host vyhodí socket.gaierror (OSError).
+        """
+        self._ensure_mode()
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, family=socket.AF_INET)
+        ip = infos[0][4][0]
+
+        async def one(i):
+            await asyncio.sleep(i * self.spacing_s)
+            if self.mode == "icmp":
+                return await self._icmp.echo(ip, timeout_s)
+            return await tcp_connect_rtt(ip, tcp_port, timeout_s)
+
+        return list(await asyncio.gather(*(one(i) for i in range(count or self.count))))
+
+    async def probe(self, name, host, tcp_port, timeout_s=1.0):
+        """Vrátí dict s výsledkem cyklu (last_ms = průměr úspěšných ech, -1 = vše ztraceno) a stats okna."""
+        win = self.windows.setdefault(name, RttWindow(self.window))
+        try:
+            rtts = await self.echoes(host, tcp_port, timeout_s)
+        except OSError:
+            rtts = [None] * self.count   # nepřeložitelný host = ztráta celého cyklu
+        for r in rtts:
+            win.add(r)
+        ok = [r for r in rtts if r is not None]
+        res = win.stats()
+        res["last_ms"] = round(sum(ok) / len(ok), 2) if ok else -1
+        res["mode"] = self.mode
+        return res
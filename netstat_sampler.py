@@ -0,0 +1,211 @@
+# netstat_sampler.py — vlastní vzorkování provozu rozhraní (/proc/net/dev) místo vnstat
+import os
+import json
+import atexit
+import time
+import threading
+from array import array
+from datetime import datetime
+
+import sysmetrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NETSTAT_INTERFACES      = [i.strip() for i in os.getenv("NETSTAT_INTERFACES", "eth0,wlan0").split(",") if i.strip()]
+NETSTAT_SAMPLE_S        = float(os.getenv("NETSTAT_SAMPLE_S", "5"))
+NETSTAT_HISTORY         = int(os.getenv("NETSTAT_HISTORY", "720"))        # vzorků v ring bufferu (1 h při 5 s)
+NETSTAT_SAVE_INTERVAL_S = float(os.getenv("NETSTAT_SAVE_INTERVAL_S", "300"))
+NETSTAT_STATE_PATH      = os.getenv("NETSTAT_STATE_PATH", os.path.join(BASE_DIR, "netstat_state.json"))
+NETSTAT_KEEP_DAYS       = 62
+NETSTAT_KEEP_MONTHS     = 24
+
+MIB = 1048576.0
+
+
+class _Ring:
+    """Kompaktní kruhový buffer vzorků (čas, rx, tx) v polích array."""
+
+    def __init__(self, size):
+        self.size = size
+        self.ts = array("d", [0.0] * size)
+        self.rx = array("Q", [0] * size)
+        self.tx = array("Q", [0] * size)
+        self.count = 0
+        self.head = 0   # index příštího zápisu
+
+    def push(self, ts, rx, tx):
+        i = self.head
+        self.ts[i], self.rx[i], self.tx[i] = ts, rx, tx
+        self.head = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def last(self, back=0):
+        """back=0 -> poslední vzorek, back=1 -> předposlední..."""
+        if back >= self.count:
+            return None
+        i = (self.head - 1 - back) % self.size
+        return self.ts[i], self.rx[i], self.tx[i]
+
+
+def _fmt_mib(b):
+    return f"{b / MIB:.2f} MiB"
+
+def _fmt_rate(bytes_per_s):
+    kbit = bytes_per_s * 8 / 1000.0
+    return f"{kbit / 1000.0:.2f} Mbit/s" if kbit >= 1000 else f"{kbit:.2f} kbit/s"
+
+
+class InterfaceSampler:
+    """
+    Periodicky čte čítače rozhraní, drží krátkou historii v ring bufferu
+    (okamžité rychlosti) a sčítá denní/měsíční/celkové objemy. Stav se ukládá
+    do JSON (tmp + replace); po restartu (jiné boot_id nebo menší čítač) se
+    delta bere od nuly, takže se nic nezapočítá dvakrát.
+    """
+
+    def __init__(self, interfaces=NETSTAT_INTERFACES, sample_s=NETSTAT_SAMPLE_S,
+                 state_path=NETSTAT_STATE_PATH, history=NETSTAT_HISTORY):
+        self.interfaces = list(interfaces)
+        self.sample_s = sample_s
+        self.state_path = state_path
+        self._rings = {i: _Ring(history) for i in self.interfaces}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = False
+        # persistovaný stav
+        self.state = {"boot_id": "", "last": {}, "days": {}, "months": {}, "total": {}}
+        self._load()
+
+    # --- persistence ---
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                for k in self.state:
+                    if k in data:
+                        self.state[k] = data[k]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("NETSTAT state load error:", e)
+
+    def save(self):
+        try:
+            with self._lock:
+                blob = json.dumps(self.state, ensure_ascii=False)
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(blob)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            print("NETSTAT state save error:", e)
+
+    # --- vzorkování ---
+    def start(self):
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        self.sample()
+        threading.Thread(target=self._loop, name="netstat-sampler", daemon=True).start()
+        # vlákno je daemon – bez uložení při ukončení by se ztratilo až NETSTAT_SAVE_INTERVAL_S provozu
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Zastaví vzorkování a hned uloží stav (volá se i z atexit)."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self.save()
+
+    def _loop(self):
+        last_save = time.monotonic()
+        while not self._stop.wait(self.sample_s):
+            self.sample()
+            if time.monotonic() - last_save >= NETSTAT_SAVE_INTERVAL_S:
+                self.save()
+                last_save = time.monotonic()
+
+    def sample(self):
+        counters = sysmetrics.net_dev_counters()
+        boot = sysmetrics.boot_id()
+        now = time.time()
+        d = datetime.fromtimestamp(now)
+        day, month = d.strftime("%Y-%m-%d"), d.strftime("%Y-%m")
+        with self._lock:
+            rebooted = boot != self.state.get("boot_id")
+            self.state["boot_id"] = boot
+            for iface in self.interfaces:
+                if iface not in counters:
+                    continue
+                rx, tx = counters[iface]
+                self._rings[iface].push(now, rx, tx)
+                prev = self.state["last"].get(iface)
+                if prev is None:
+                    # první vzorek rozhraní vůbec – jen zapamatovat
+                    drx = dtx = 0
+                elif rebooted or rx < prev[0] or tx < prev[1]:
+                    # čítače se vynulovaly (reboot / reset ovladače)
+                    drx, dtx = rx, tx
+                else:
+                    drx, dtx = rx - prev[0], tx - prev[1]
+                self.state["last"][iface] = [rx, tx]
+                for bucket, key in ((self.state["days"], day), (self.state["months"], month)):
+                    per = bucket.setdefault(iface, {})
+                    acc = per.setdefault(key, [0, 0])
+                    acc[0] += drx
+                    acc[1] += dtx
+                tot = self.state["total"].setdefault(iface, [0, 0])
+                tot[0] += drx
+                tot[1] += dtx
+            self._prune()
+
+    def _prune(self):
+        for bucket, keep in ((self.state["days"], NETSTAT_KEEP_DAYS), (self.state["months"], NETSTAT_KEEP_MONTHS)):
+            for per in bucket.values():
+                for k in sorted(per)[:-keep]:
+                    del per[k]
+
+    # --- výstup pro dashboard ---
+    def rates(self, iface):
+        """Okamžitá rychlost (B/s) z posledních dvou vzorků ring bufferu."""
+        ring = self._rings.get(iface)
+        a, b = (ring.last(0), ring.last(1)) if ring else (None, None)
+        if not a or not b or a[0] <= b[0] or a[1] < b[1] or a[2] < b[2]:
+            return None, None
+        dt = a[0] - b[0]
+        return (a[1] - b[1]) / dt, (a[2] - b[2]) / dt
+
+    def stats(self):
+        now = datetime.now()
+        day, month = now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+        since_day = (now - now.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+        since_month = (now - now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+        out = []
+        with self._lock:
+            for iface in self.interfaces:
+                if iface not in self.state["last"]:
+                    out.append({"interface": iface, "error": "Rozhraní nenalezeno nebo zatím bez dat."})
+                    continue
+                rxd, txd = self.state["days"].get(iface, {}).get(day, [0, 0])
+                rxm, txm = self.state["months"].get(iface, {}).get(month, [0, 0])
+                rxt, txt = self.state["total"].get(iface, [0, 0])
+                rx_rate, tx_rate = self.rates(iface)
+                out.append({
+                    "interface": iface,
+                    "rx_today": _fmt_mib(rxd),
+                    "tx_today": _fmt_mib(txd),
+                    "total_today": _fmt_mib(rxd + txd),
+                    "rate_today": _fmt_rate((rxd + txd) / max(1.0, since_day)),
+                    "rx_month": _fmt_mib(rxm),
+                    "tx_month": _fmt_mib(txm),
+                    "total_month": _fmt_mib(rxm + txm),
+                    "rate_month": _fmt_rate((rxm + txm) / max(1.0, since_month)),
+                    "rx_total": _fmt_mib(rxt),
+                    "tx_total": _fmt_mib(txt),
+                    "total_total": _fmt_mib(rxt + txt),
+                    "rx_rate": _fmt_rate(rx_rate) if rx_rate is not None else "N/A",
+                    "tx_rate": _fmt_rate(tx_rate) if tx_rate is not None else "N/A",
+                })
+        return out
@@ -0,0 +1,191 @@
+# sysmetrics.py — systémové metriky bez forku (/proc a /sys), sdílené monitor.py a mqtt_report.py
+import os
+import socket
+import shutil
+import threading
+
+THERMAL_PATH = os.getenv("THERMAL_PATH", "/sys/class/thermal/thermal_zone0/temp")
+WIFI_IFACE   = os.getenv("WIFI_IFACE", "wlan0")
+
+
+class _ProcFile:
+    """
+    Jednou otevřený soubor z /proc nebo /sys; každé čtení jen přetočí offset na 0.
+    Ušetří open()/close() při každém dotazu a hlavně fork+exec shellu.
+    """
+
+    def __init__(self, path, bufsize=8192):
+        self.path = path
+        self.bufsize = bufsize
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def read(self):
+        with self._lock:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDONLY)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                chunks = []
+                while True:
+                    b = os.read(self._fd, self.bufsize)
+                    if not b:
+                        break
+                    chunks.append(b)
+                return b"".join(chunks).decode("utf-8", errors="replace")
+            except OSError:
+                # soubor mohl zmizet (např. hotplug wlan) -> příště otevřít znovu
+                self._close_locked()
+                raise
+
+    def _close_locked(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+
+_loadavg  = _ProcFile("/proc/loadavg", 256)
+_uptime   = _ProcFile("/proc/uptime", 256)
+_meminfo  = _ProcFile("/proc/meminfo")
+_thermal  = _ProcFile(THERMAL_PATH, 64)
+_fib_trie = _ProcFile("/proc/net/fib_trie", 65536)
+_if_inet6 = _ProcFile("/proc/net/if_inet6")
+_wireless = _ProcFile("/proc/net/wireless", 1024)
+_net_dev  = _ProcFile("/proc/net/dev", 4096)
+_boot_id  = _ProcFile("/proc/sys/kernel/random/boot_id", 64)
+
+
+# --- čísla (mqtt_report) ---
+def read_cpu_temp():
+    try:
+        return round(int(_thermal.read().strip()) / 1000.0, 1)
+    except Exception:
+        return None
+
+def load_1m():
+    v = loadavg()
+    return round(v[0], 2) if v else None
+
+def loadavg():
+    try:
+        return tuple(float(x) for x in _loadavg.read().split()[:3])
+    except Exception:
+        return None
+
+def mem_used_pct():
+    try:
+        kv = {}
+        for line in _meminfo.read().splitlines():
+            parts = line.split(":")
+            if len(parts) >= 2:
+                kv[parts[0]] = int(parts[1].strip().split()[0])  # kB
+        total = kv.get("MemTotal", 0)
+        free  = kv.get("MemFree", 0) + kv.get("Buffers", 0) + kv.get("Cached", 0)
+        used  = max(0, total - free)
+        return round(used * 100.0 / total, 1) if total > 0 else None
+    except Exception:
+        return None
+
+def disk_root_used_pct():
+    try:
+        total, used, free = shutil.disk_usage("/")
+        return round(used * 100.0 / total, 1)
+    except Exception:
+        return None
+
+def uptime_s():
+    try:
+        return int(float(_uptime.read().split()[0]))
+    except Exception:
+        return None
+
+
+# --- texty ve stejném tvaru jako dřívější shell příkazy (monitor.get_system_info) ---
+def hostname():
+    return socket.gethostname()
+
+def ip_addresses():
+    """Ekvivalent `hostname -I`: lokální IPv4 (bez loopbacku) + globální IPv6."""
+    addrs = []
+    try:
+        # fib_trie: řádek "|-- 192.168.1.42" následovaný "/32 host LOCAL"
+        prev = None
+        for line in _fib_trie.read().splitlines():
+            line = line.strip()
+            if line.startswith("|--"):
+                prev = line[3:].strip()
+            elif "/32 host LOCAL" in line and prev:
+                if not prev.startswith("127.") and prev not in addrs:
+                    addrs.append(prev)
+    except Exception:
+        pass
+    try:
+        # if_inet6: addr ifindex prefix scope flags name; scope 00 = global
+        for line in _if_inet6.read().splitlines():
+            parts = line.split()
+            if len(parts) >= 6 and parts[3] == "00":
+                a = socket.inet_ntop(socket.AF_INET6, bytes.fromhex(parts[0]))
+                if a not in addrs:
+                    addrs.append(a)
+    except Exception:
+        pass
+    return " ".join(addrs) if addrs else "N/A"
+
+def uptime_pretty():
+    """Ekvivalent `uptime -p` (procps): 'up 2 days, 3 hours, 4 minutes'."""
+    secs = uptime_s()
+    if secs is None:
+        return "N/A"
+    mins = secs // 60
+    parts = []
+    for unit, size in (("year", 525600), ("week", 10080), ("day", 1440), ("hour", 60), ("minute", 1)):
+        n, mins = divmod(mins, size)
+        if n:
+            parts.append(f"{n} {unit}{'' if n == 1 else 's'}")
+    return "up " + (", ".join(parts) if parts else "0 minutes")
+
+def loadavg_text():
+    v = loadavg()
+    return " ".join(f"{x:.2f}" for x in v) if v else "N/A"
+
+def cpu_temp_text():
+    """Ve tvaru výstupu `vcgencmd measure_temp | cut -d= -f2` (např. 48.3'C)."""
+    t = read_cpu_temp()
+    return f"{t:.1f}'C" if t is not None else "N/A"
+
+def wifi_signal_text(iface=WIFI_IFACE):
+    """Kvalita a úroveň signálu z /proc/net/wireless (místo iwconfig)."""
+    try:
+        for line in _wireless.read().splitlines()[2:]:
+            name, _, rest = line.partition(":")
+            if name.strip() != iface:
+                continue
+            f = rest.split()
+            link = int(float(f[1]))
+            level = int(float(f[2]))
+            return f"Link Quality={link}/70  Signal level={level} dBm"
+    except Exception:
+        pass
+    return "N/A"
+
+def net_dev_counters():
+    """{iface: (rx_bytes, tx_bytes)} z /proc/net/dev."""
+    out = {}
+    try:
+        for line in _net_dev.read().splitlines()[2:]:
+            name, _, rest = line.partition(":")
+            f = rest.split()
+            if len(f) >= 9:
+                out[name.strip()] = (int(f[0]), int(f[8]))
+    except Exception:
+        pass
+    return out
+
+def boot_id():
+    try:
+        return _boot_id.read().strip()
+    except Exception:
+        return ""
@@ -0,0 +1,304 @@
+# systemd_status.py — hromadný stav systemd jednotek (D-Bus s push notifikacemi, fallback systemctl show)
+import os
+import sys
+import time
+import threading
+import subprocess
+
+SYSTEMD_BACKEND = os.getenv("SYSTEMD_BACKEND", "auto")   # auto|dbus|systemctl|mock
+SYSTEMD_MAX_AGE_S = float(os.getenv("SYSTEMD_MAX_AGE_S", "30"))  # max. stáří accounting dat v cache
+
+# vlastnosti, které sledujeme u každé jednotky
+PROPS = ("ActiveState", "SubState", "NRestarts", "MemoryCurrent", "CPUUsageNSec")
+
+_UNSET = 2 ** 64 - 1   # systemd: "[not set]" u accountingu
+
+
+def _to_int(v):
+    try:
+        v = int(v)
+    except (TypeError, ValueError):
+        return None
+    return None if v == _UNSET else v
+
+
+def _empty(unit):
+    return {"unit": unit, "active": "unknown", "sub": "unknown",
+            "restarts": None, "memory_bytes": None, "cpu_ns": None}
+
+
+def _normalize(unit, props):
+    out = _empty(unit)
+    out["active"] = props.get("ActiveState") or "unknown"
+    out["sub"] = props.get("SubState") or "unknown"
+    out["restarts"] = _to_int(props.get("NRestarts"))
+    out["memory_bytes"] = _to_int(props.get("MemoryCurrent"))
+    out["cpu_ns"] = _to_int(props.get("CPUUsageNSec"))
+    return out
+
+
+# ---------- Backend: jeden `systemctl show` pro všechny jednotky ----------
+class SystemctlBackend:
+    push = False
+
+    def query(self, units):
+        cmd = ["systemctl", "show", "--property=Id," + ",".join(PROPS)] + list(units)
+        r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=10)
+        # bloky KEY=VALUE oddělené prázdným řádkem, ve stejném pořadí jako jednotky
+        out = {}
+        blocks = [b for b in r.stdout.strip().split("\n\n") if b.strip()]
+        for unit, block in zip(units, blocks):
+            props = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+            out[unit] = _normalize(unit, props)
+        return out
+
+    def subscribe(self, units, callback, stop_evt):
+        return False
+
+
+# ---------- Backend: D-Bus (jeepney, bez GLib) ----------
+class JeepneyBus:
+    """Tenká vrstva nad system bus; MockBus níže má stejné rozhraní."""
+
+    def __init__(self):
+        from jeepney.io.blocking import open_dbus_connection
+        self._open = open_dbus_connection
+        self._conn = open_dbus_connection(bus="SYSTEM")
+        self._lock = threading.Lock()
+
+    def _call(self, path, interface, method, signature=None, body=()):
+        from jeepney import DBusAddress, new_method_call
+        addr = DBusAddress(path, bus_name="org.freedesktop.systemd1", interface=interface)
+        with self._lock:
+            reply = self._conn.send_and_get_reply(new_method_call(addr, method, signature, body), timeout=5)
+        return reply.body
+
+    def list_units_by_names(self, names):
+        """Jedno volání pro všechny jednotky: [(name, ..., active, sub, ..., path, ...)]."""
+        body = self._call("/org/freedesktop/systemd1", "org.freedesktop.systemd1.Manager",
+                          "ListUnitsByNames", "as", (list(names),))
+        return [(u[0], u[3], u[4], u[6]) for u in body[0]]
+
+    def get_service_props(self, path):
+        body = self._call(path, "org.freedesktop.DBus.Properties", "GetAll", "s",
+                          ("org.freedesktop.systemd1.Service",))
+        return {k: v[1] for k, v in body[0].items()}
+
+    def watch(self, callback, stop_evt):
+        """PropertiesChanged na /org/freedesktop/systemd1/unit/* -> callback(path, changed)."""
+        from jeepney import MatchRule, message_bus, HeaderFields
+        self._call("/org/freedesktop/systemd1", "org.freedesktop.systemd1.Manager", "Subscribe")
+        conn = self._open(bus="SYSTEM")
+        rule = MatchRule(type="signal", interface="org.freedesktop.DBus.Properties",
+                         member="PropertiesChanged", path_namespace="/org/freedesktop/systemd1/unit")
+        conn.send_and_get_reply(message_bus.AddMatch(rule))
+        with conn.filter(rule) as queue:
+            while not stop_evt.is_set():
+                try:
+                    msg = conn.recv_until_filtered(queue, timeout=1.0)
+                except TimeoutError:
+                    continue
+                iface, changed, _ = msg.body
+                if iface != "org.freedesktop.systemd1.Unit":
+                    continue
+                path = msg.header.fields.get(HeaderFields.path)
+                callback(path, {k: v[1] for k, v in changed.items()})
+
+
+class MockBus:
+    """
+    Lokální náhrada sběrnice pro testy a vývoj bez systemd.
+    set_state() simuluje změnu jednotky včetně PropertiesChanged signálu.
+    """
+
+    def __init__(self, units=()):
+        self.units = {u: {"ActiveState": "active", "SubState": "running", "NRestarts": 0,
+                          "MemoryCurrent": 0, "CPUUsageNSec": 0} for u in units}
+        self.calls = 0
+        self._watchers = []
+
+    @staticmethod
+    def path_of(unit):
+        return "/org/freedesktop/systemd1/unit/" + unit.replace(".", "_2e").replace("-", "_2d")
+
+    def list_units_by_names(self, names):
+        self.calls += 1
+        out = []
+        for n in names:
+            p = self.units.get(n)
+            if p is None:
+                out.append((n, "inactive", "dead", self.path_of(n)))
+            else:
+                out.append((n, p["ActiveState"], p["SubState"], self.path_of(n)))
+        return out
+
+    def get_service_props(self, path):
+        self.calls += 1
+        for u, p in self.units.items():
+            if self.path_of(u) == path:
+                return dict(p)
+        return {}
+
+    def watch(self, callback, stop_evt):
+        self._watchers.append(callback)
+        stop_evt.wait()
+
+    def set_state(self, unit, active, sub, **extra):
+        p = self.units.setdefault(unit, {"NRestarts": 0, "MemoryCurrent": 0, "CPUUsageNSec": 0})
+        p.update({"ActiveState": active, "SubState": sub}, **extra)
+        for cb in list(self._watchers):
+            cb(self.path_of(unit), {"ActiveState": active, "SubState": sub})
+
+
+class DbusBackend:
+    push = True
+
+    def __init__(self, bus=None):
+        self.bus = bus if bus is not None else JeepneyBus()
+        self._paths = {}   # path -> unit
+        self.watching = False
+
+    def query(self, units):
+        out = {}
+        for name, active, sub, path in self.bus.list_units_by_names(units):
+            self._paths[path] = name
+            props = {"ActiveState": active, "SubState": sub}
+            if active != "inactive" or sub != "dead":
+                try:
+                    props.update(self.bus.get_service_props(path))
+                except Exception:
+                    pass
+            out[name] = _normalize(name, props)
+        return out
+
+    def subscribe(self, units, callback, stop_evt):
+        def _on_signal(path, changed):
+            unit = self._paths.get(path)
+            if unit and ("ActiveState" in changed or "SubState" in changed):
+                callback(unit, changed)
+
+        def _watch():
+            self.watching = True
+            try:
+                self.bus.watch(_on_signal, stop_evt)
+            except Exception as e:
+                print(f"[SYSTEMD] signal watch ended: {e}")
+            finally:
+                # bez signálů se ServiceStatus vrátí k dotazování
+                self.watching = False
+
+        threading.Thread(target=_watch, name="systemd-watch", daemon=True).start()
+        return True
+
+
+def make_backend(kind=SYSTEMD_BACKEND, units=()):
+    if kind == "systemctl":
+        return SystemctlBackend()
+    if kind == "mock":
+        return DbusBackend(MockBus(units))
+    try:
+        return DbusBackend()
+    except Exception as e:
+        if kind == "dbus":
+            raise
+        print(f"[SYSTEMD] D-Bus nedostupný ({e}), fallback na systemctl show")
+        return SystemctlBackend()
+
+
+class ServiceStatus:
+    """
+    Cache stavu sledovaných jednotek. S D-Bus backendem se ActiveState/SubState
+    aktualizují push notifikací (PropertiesChanged) a on_change se volá hned;
+    accounting (restarty, paměť, CPU) se dočítá nejvýše jednou za max_age_s.
+    """
+
+    def __init__(self, units, backend=None, on_change=None, max_age_s=SYSTEMD_MAX_AGE_S):
+        self.units = list(units)
+        self.backend = backend
+        self.on_change = on_change
+        self.max_age_s = max_age_s
+        self._lock = threading.Lock()
+        self._cache = {u: _empty(u) for u in self.units}
+        self._ts = 0.0
+        self._stop = threading.Event()
+        self._subscribed = None   # None = ještě nezkoušeno
+
+    def _ensure_backend(self):
+        if self.backend is None:
+            self.backend = make_backend(units=self.units)
+        if self._subscribed is None:
+            self._subscribed = False
+            if self.backend.push:
+                try:
+                    self._subscribed = self.backend.subscribe(self.units, self._on_signal, self._stop)
+                except Exception as e:
+                    print(f"[SYSTEMD] subscribe failed: {e}")
+
+    def start(self):
+        self._ensure_backend()
+        self.refresh()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self):
+        try:
+            fresh = self.backend.query(self.units)
+        except Exception as e:
+            print(f"[SYSTEMD] query failed: {e}")
+            return
+        changed = []
+        with self._lock:
+            for u, st in fresh.items():
+                old = self._cache.get(u)
+                if old and (old["active"], old["sub"]) != (st["active"], st["sub"]):
+                    changed.append(u)
+                self._cache[u] = st
+            self._ts = time.monotonic()
+        for u in changed:
+            self._notify(u)
+
+    def _on_signal(self, unit, changed):
+        with self._lock:
+            st = self._cache.setdefault(unit, _empty(unit))
+            if "ActiveState" in changed:
+                st["active"] = changed["ActiveState"]
+            if "SubState" in changed:
+                st["sub"] = changed["SubState"]
+        self._notify(unit)
+
+    def _notify(self, unit):
+        if self.on_change:
+            try:
+                self.on_change(unit, self.get(unit))
+            except Exception as e:
+                print(f"[SYSTEMD] on_change failed: {e}")
+
+    def snapshot(self):
+        """Stav všech jednotek; obnoví cache, pokud je starší než max_age_s."""
+        self._ensure_backend()
+        pushed = self._subscribed and getattr(self.backend, "watching", False)
+        if time.monotonic() - self._ts > self.max_age_s or not pushed:
+            self.refresh()
+        with self._lock:
+            return {u: dict(st) for u, st in self._cache.items()}
+
+    def get(self, unit):
+        with self._lock:
+            return dict(self._cache.get(unit) or _empty(unit))
+
+    def is_active(self, unit):
+        return 1 if self.snapshot().get(unit, {}).get("active") == "active" else 0
+
+
+if __name__ == "__main__":
+    # ruční kontrola: python3 systemd_status.py [--mock] unit1 unit2 ...
+    args = sys.argv[1:]
+    kind = "mock" if "--mock" in args else SYSTEMD_BACKEND
+    units = [a for a in args if not a.startswith("--")] or ["modbus_tcp_proxy.service"]
+    st = ServiceStatus(units, backend=make_backend(kind, units),
+                       on_change=lambda u, s: print("CHANGE", u, s["active"], s["sub"]))
+    st.start()
+    for u, s in st.snapshot().items():
+        print(u, s)
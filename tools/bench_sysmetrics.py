@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# bench_sysmetrics.py — cena jednoho volání get_system_info(): shell (původní) vs. sysmetrics
+#
+# Spuštění na RPi:  python3 tools/bench_sysmetrics.py [počet_opakování]
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import sysmetrics  # noqa: E402
+
+
+def _run(cmd):
+    try:
+        return subprocess.check_output(cmd, shell=True, text=True).strip()
+    except Exception:
+        return "N/A"
+
+
+def shell_probe():
+    """Původní varianta z monitor.get_system_info() – fork shellu na každou hodnotu."""
+    return {
+        "hostname": _run("hostname"),
+        "ip_address": _run("hostname -I"),
+        "uptime": _run("uptime -p"),
+        "loadavg": _run("cat /proc/loadavg | awk '{print $1, $2, $3}'"),
+        "cpu_temp": _run("vcgencmd measure_temp 2>/dev/null | cut -d= -f2") if shutil.which("vcgencmd") else "N/A",
+    }
+
+
+def native_probe():
+    return {
+        "hostname": sysmetrics.hostname(),
+        "ip_address": sysmetrics.ip_addresses(),
+        "uptime": sysmetrics.uptime_pretty(),
+        "loadavg": sysmetrics.loadavg_text(),
+        "cpu_temp": sysmetrics.cpu_temp_text(),
+    }
+
+
+def bench(fn, n):
+    fn()  # zahřátí (otevření handlů, import cache)
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for _ in range(n):
+        fn()
+    wall = (time.perf_counter() - t0) / n
+    cpu = (time.process_time() - cpu0) / n
+    return wall * 1000.0, cpu * 1000.0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print("shell :", shell_probe())
+    print("native:", native_probe())
+    for name, fn, reps in (("shell", shell_probe, max(1, n // 10)), ("native", native_probe, n * 20)):
+        wall, cpu = bench(fn, reps)
+        print(f"{name:7s} n={reps:5d}  {wall:9.3f} ms/volání (wall)  {cpu:8.3f} ms/volání (CPU procesu)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# bench_ws_decode.py — cena dekódování rámce store:change: json vs. orjson vs. msgpack (+ mapování polí)
+#
+# Spuštění:  python3 tools/bench_ws_decode.py [záznam.jsonl(.gz)] [počet_opakování]
+# Záznam: řádky {"t":..,"event":"store:change","data":{...}} (tools/infigy_replay.py) nebo přímo {"payload":{...}}.
+# Bez záznamu se použije vestavěný vzorek.
+import os
+import sys
+import gzip
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from socketio import packet  # noqa: E402
+import ws_codec  # noqa: E402
+
+SAMPLE = {"payload": {
+    "HW_TEMP": 54.31,
+    "HW_INFO": {"Consumption": [0.0, 1.204, 0.0], "Status": "HEATING", "Surplus": True, "Err": False},
+    "PV_ACTUAL_SOC": 87.5, "PV_ACTUAL_POWER": 3.412, "PV_ACTUAL_POWER_BATTERY": 0.845,
+    "SURPLUS_INFO_TOTAL": 0.3121,
+    "EM_INFO_Consumption": [0.412, 0.233, 0.318],
+}}
+
+
+def load_samples(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    out = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            if rec.get("event", "store:change") != "store:change":
+                continue
+            out.append(rec.get("data", rec))
+    return out
+
+
+def bench(fn, items, reps):
+    for it in items[:10]:
+        fn(it)  # zahřátí
+    n = 0
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for _ in range(reps):
+        for it in items:
+            fn(it)
+            n += 1
+    wall = (time.perf_counter() - t0) / n
+    cpu = (time.process_time() - cpu0) / n
+    return wall * 1e6, cpu * 1e6
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else None
+    reps = int(sys.argv[-1]) if len(sys.argv) > 1 and sys.argv[-1].isdigit() else 200
+    samples = load_samples(path) if path else [SAMPLE]
+    if not samples:
+        print("no store:change samples")
+        return
+    # textové rámce Socket.IO tak, jak přijdou z engineio (bez prefixu "4")
+    frames = [packet.Packet(packet.EVENT, data=["store:change", s]).encode() for s in samples]
+    size = sum(len(f) for f in frames) / len(frames)
+    print(f"samples={len(samples)} reps={reps} avg_frame={size:.0f} B")
+
+    def decode_with(mod):
+        def _fn(frame):
+            packet.Packet.json = mod
+            return packet.Packet(encoded_packet=frame)
+        return _fn
+
+    cases = [("json", decode_with(json))]
+    if ws_codec.orjson is not None:
+        cases.append(("orjson", decode_with(ws_codec.OrjsonModule)))
+    else:
+        print("orjson   : not installed")
+    results = {}
+    for name, fn in cases:
+        results[name] = bench(fn, frames, reps)
+    packet.Packet.json = json
+
+    if ws_codec.msgpack is not None:
+        from socketio import msgpack_packet
+        blobs = [msgpack_packet.MsgPackPacket(packet.EVENT, data=["store:change", s]).encode() for s in samples]
+        print(f"msgpack avg_frame={sum(len(b) for b in blobs) / len(blobs):.0f} B")
+        results["msgpack"] = bench(lambda b: msgpack_packet.MsgPackPacket(encoded_packet=b), blobs, reps)
+    else:
+        print("msgpack  : not installed")
+
+    # mapování polí (FieldMapper) nad dekódovaným payloadem, bez MQTT
+    from field_map import FieldMapper
+    import infigy_ws_to_mqtt as bridge
+    mapper = FieldMapper(bridge.FIELD_RULES, lambda *a: None, lambda *a: None)
+    mapper.throttle.send = lambda *a: None
+    payloads = [s.get("payload", {}) or {} for s in samples]
+    results["map"] = bench(mapper.handle, payloads, reps)
+
+    for name, (wall, cpu) in results.items():
+        print(f"{name:8s} {wall:8.2f} µs/rámec (wall)  {cpu:8.2f} µs/rámec (CPU procesu)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# infigy_replay.py — záznam a přehrání proudu store:change z Infigy bez fyzického boxu
+#
+# Záznam (bez MQTT, jen Socket.IO; stejné INFIGY_HOST/AUTH_* z .env):
+#   python3 tools/infigy_replay.py record zaznam.jsonl.gz [sekund] [--device default]
+#   (totéž zapisuje i běžící bridge při INFIGY_RECORD_PATH=...)
+# Přehrání přes handle_store_change() bridge proti lokální náhradě brokeru:
+#   python3 tools/infigy_replay.py replay zaznam.jsonl.gz [--speed 1|10|0] [--ref-tick 5] [--top 10] [--device default]
+#   --speed 0 = co nejrychleji; --ref-tick 0 = referenční integrace přesně mezi událostmi,
+#   jinak vzorkování po N s (původní energy_integrator)
+import os
+import sys
+import time
+import tempfile
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ws_recorder import EventRecorder, read_events  # noqa: E402
+
+
+class CaptureChannel:
+    """Náhrada MQTT kanálu: počítá publikace po topicích, drží poslední hodnotu."""
+
+    def __init__(self):
+        self.count = Counter()
+        self.last = {}
+
+    def publish(self, topic_suffix, payload, retain=True, qos=None, cls="state"):
+        self.count[topic_suffix] += 1
+        self.last[topic_suffix] = payload
+
+    def publish_raw(self, topic, payload, retain=True, qos=None, cls="discovery"):
+        self.count[topic] += 1
+        return True
+
+
+class RefIntegrator:
+    """Referenční integrace (kWh) nezávislá na EnergyAccumulator – bez ošetření mezer."""
+
+    def __init__(self, tick_s=0.0):
+        self.tick_s = tick_s
+        self.kwh = Counter()
+        self._t = None
+        self._next = None
+        self._sample = None
+
+    def feed(self, t, power):
+        """power = výkony (W) platné od předchozí události do t."""
+        if self._t is None:
+            self._t, self._next, self._sample = t, t + self.tick_s, dict(power)
+            return
+        if not self.tick_s:
+            for k, p in power.items():
+                if p > 0:
+                    self.kwh[k] += p * (t - self._t) / 3.6e6
+        else:
+            while self._next <= t:
+                for k, p in power.items():
+                    w = (self._sample.get(k, 0.0) + p) / 2.0
+                    if w > 0:
+                        self.kwh[k] += w * self.tick_s / 3.6e6
+                self._sample = dict(power)
+                self._next += self.tick_s
+        self._t = t
+
+
+def _device(bridge, name):
+    for dev in bridge.devices:
+        if name is None or dev.name == name:
+            return dev
+    sys.exit(f"unknown device {name!r} (INFIGY_DEVICES: {', '.join(d.name for d in bridge.devices)})")
+
+
+def cmd_record(args):
+    import socketio
+    import infigy_ws_to_mqtt as bridge
+    dev = _device(bridge, args.device)
+    rec = EventRecorder(args.path)
+    sio = socketio.Client(reconnection=True, reconnection_attempts=0)
+    sio.on("connect", lambda: rec.write("connect"))
+    sio.on("disconnect", lambda *a: rec.write("disconnect"))
+    sio.on("store:change", lambda data: rec.write("store:change", data))
+    sio.connect(dev.host, socketio_path=dev.socket_path, headers=dev.headers,
+                transports=["websocket"], wait_timeout=10)
+    try:
+        if args.seconds:
+            sio.sleep(args.seconds)
+        else:
+            sio.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sio.disconnect()
+        rec.close()
+        print(f"recorded {rec.events} events, {rec.written / 1024:.0f} KiB raw")
+
+
+def cmd_replay(args):
+    # stav bridge (energie, discovery, statistiky) do dočasného adresáře – nic z ostrého běhu
+    tmp = tempfile.mkdtemp(prefix="infigy_replay_")
+    for var, name in (("ENERGY_STATE_PATH", "energy_state.json"), ("ENERGY_JOURNAL_PATH", "energy_state.journal"),
+                      ("ENERGY_STATS_PATH", "energy_stats.json"), ("MQTT_SPOOL_PATH_INFIGY", "spool.bin"),
+                      ("DISCOVERY_STATE_PATH_INFIGY", "discovery.json")):
+        os.environ[var] = os.path.join(tmp, name)
+    os.environ["INFIGY_DEVICES"] = args.device or "default"   # jen přehrávané zařízení, výchozí cesty
+    os.environ["INFIGY_RECORD_PATH"] = ""   # prázdné, ne pop – load_dotenv by hodnotu z .env doplnil
+    if args.device:
+        os.environ[f"INFIGY_{args.device.upper()}_RECORD_PATH"] = ""
+    import infigy_ws_to_mqtt as bridge
+    dev = bridge.devices[0]
+
+    cap = CaptureChannel()
+    bridge.chan = cap
+    ref = RefIntegrator(args.ref_tick)
+    events = gaps = 0
+    cpu = 0.0
+    t0 = first = last = None
+    for t, event, data in read_events(args.path):
+        if first is None:
+            first = t
+            t0 = time.perf_counter()
+            dev._energy_pub_ts = dev._energy_save_ts = dev._stats_save_ts = t
+        last = t
+        if args.speed > 0:
+            delay = (t - first) / args.speed - (time.perf_counter() - t0)
+            if delay > 0:
+                time.sleep(delay)
+        if event == "disconnect":
+            dev.energy.gap()
+            gaps += 1
+            continue
+        if event != "store:change" or not isinstance(data, dict):
+            continue
+        ref.feed(t, dev.current_power)
+        c0 = time.process_time()
+        dev.handle_store_change(data, ts=t, wall=t)
+        dev.mapper.throttle.flush_due(now=t)
+        cpu += time.process_time() - c0
+        events += 1
+    if not events:
+        print("no store:change events in recording")
+        return
+    wall = time.perf_counter() - t0
+    span = last - first
+
+    print(f"recording : {events} events, {gaps} disconnects, span {span:.0f} s")
+    print(f"replay    : {wall:.2f} s wall ({span / wall if wall else 0:.1f}x), {events / wall if wall else 0:.0f} events/s, "
+          f"{cpu / events * 1e6:.1f} µs CPU/event")
+    print(f"publishes : {sum(cap.count.values())} total, {sum(cap.count.values()) / events:.2f}/event; "
+          f"throttle {dev.mapper.throttle.counters}")
+    for topic, n in cap.count.most_common(args.top):
+        print(f"  {n:8d}  {topic}")
+    print(f"energy    : bridge ({bridge.ENERGY_INTEGRATION}, gap={bridge.ENERGY_GAP_MODE}) vs. reference "
+          f"({'tick %g s' % args.ref_tick if args.ref_tick else 'exact step'})")
+    totals = dev.energy.snapshot()
+    for k in totals:
+        a, b = totals[k], ref.kwh.get(k, 0.0)
+        pct = (a - b) / b * 100.0 if b else 0.0
+        print(f"  {k:14s} {a:12.6f} kWh  ref {b:12.6f}  diff {a - b:+.6f} ({pct:+.2f} %)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("record")
+    r.add_argument("path")
+    r.add_argument("seconds", nargs="?", type=float, default=0)
+    p = sub.add_parser("replay")
+    p.add_argument("path")
+    p.add_argument("--speed", type=float, default=0, help="násobek reálného času, 0 = max")
+    p.add_argument("--ref-tick", type=float, default=0, help="0 = přesně mezi událostmi, jinak vzorkování po N s")
+    p.add_argument("--top", type=int, default=10)
+    for sp in (r, p):
+        sp.add_argument("--device", default=None, help="jméno z INFIGY_DEVICES (výchozí první)")
+    args = ap.parse_args()
+    (cmd_record if args.cmd == "record" else cmd_replay)(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# topic_throttle.py — omezení frekvence publikací po topicích (min. interval, deadband, trailing edge, průměrování)
+import time
+import threading
+
+THROTTLE_MAX_SILENCE_S = 300   # i bez změny se hodnota nejpozději po této době pošle znovu
+
+AGGREGATES = {
+    "mean": lambda st: st["sum"] / st["n"],
+    "min":  lambda st: st["min"],
+    "max":  lambda st: st["max"],
+}
+
+
+class TopicThrottle:
+    """
+    Politika na topic: min_interval_s (nejvýš jedna publikace za interval),
+    deadband (změna <= deadband se nepovažuje za změnu), agg (None|mean|min|max).
+
+    Bez agregace: první změna po uplynutí intervalu jde ven hned (leading edge),
+    změny během intervalu se slijí a poslední z nich se pošle na konci
+    intervalu (trailing edge) – poslední hodnota dávky tedy vždy odejde.
+    S agregací se vzorky sbírají a na konci každého intervalu se pošle jejich
+    mean/min/max místo jednotlivých vzorků. flush_due() volá časovač.
+    Nenumerické hodnoty (stav, příznak "0"/"1") topicu s politikou jdou ven
+    jen při změně nebo po max_silence_s, hned a bez intervalu/agregace.
+    Topic bez politiky se posílá vždy.
+    """
+
+    def __init__(self, send, max_silence_s=THROTTLE_MAX_SILENCE_S):
+        self.send = send                 # send(topic, value, qos, retain)
+        self.max_silence_s = max_silence_s
+        self._policy = {}                # topic -> (min_interval_s, deadband, agg, digits)
+        self._state = {}                 # topic -> dict
+        self._lock = threading.Lock()
+        self.counters = {"offered": 0, "sent": 0, "deadband": 0, "coalesced": 0}
+
+    def configure(self, topic, min_interval_s=0.0, deadband=0.0, agg=None, digits=None):
+        if agg and agg not in AGGREGATES:
+            raise ValueError(f"unknown aggregate {agg!r}")
+        self._policy[topic] = (float(min_interval_s or 0.0), float(deadband or 0.0), agg or None, digits)
+
+    def policy(self, topic):
+        """(min_interval_s, deadband, agg, digits) nebo None."""
+        return self._policy.get(topic)
+
+    def tune(self, topic, min_interval_s=None, deadband=None, agg=None):
+        """Změna politiky za běhu; None = ponechat, agg "" = bez agregace. Stav topicu zůstává."""
+        cur = self._policy.get(topic) or (0.0, 0.0, None, None)
+        with self._lock:
+            self.configure(topic,
+                           cur[0] if min_interval_s is None else min_interval_s,
+                           cur[1] if deadband is None else deadband,
+                           cur[2] if agg is None else agg,
+                           cur[3])
+            st = self._state.get(topic)
+            if st is not None:   # rozpracovaný agregát se po změně režimu nedá použít
+                st["n"], st["sum"], st["min"], st["max"] = 0, 0.0, None, None
+        return self._policy[topic]
+
+    def _changed(self, st, v, deadband):
+        last = st["sent"]
+        if last is None:
+            return True
+        try:
+            return abs(float(v) - float(last)) > deadband
+        except (TypeError, ValueError):
+            return v != last
+
+    def offer(self, topic, value, qos=0, retain=True, now=None):
+        now = time.monotonic() if now is None else now
+        pol = self._policy.get(topic)
+        if pol is None:
+            with self._lock:
+                self.counters["offered"] += 1
+                self.counters["sent"] += 1
+            self.send(topic, value, qos, retain)
+            return
+        interval, deadband, agg, _ = pol
+        out = None
+        with self._lock:
+            self.counters["offered"] += 1
+            st = self._state.get(topic)
+            if st is None:
+                st = self._state[topic] = {"sent": None, "ts": -1e18, "pending": None,
+                                           "qos": qos, "retain": retain,
+                                           "n": 0, "sum": 0.0, "min": None, "max": None}
+            st["qos"], st["retain"] = qos, retain
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                # stav/příznak: jen změna nebo max. ticho
+                if st["sent"] is None or st["sent"] != value or now - st["ts"] >= self.max_silence_s:
+                    out = self._emit(topic, st, now, value)
+                else:
+                    self.counters["deadband"] += 1
+            elif agg:
+                st["n"] += 1
+                st["sum"] += value
+                st["min"] = value if st["min"] is None else min(st["min"], value)
+                st["max"] = value if st["max"] is None else max(st["max"], value)
+                if st["sent"] is None:
+                    # první vzorek po startu/resetu hned, dál jen po intervalech
+                    out = self._emit(topic, st, now, self._aggregate(topic, st))
+            elif now - st["ts"] >= interval:
+                if self._changed(st, value, deadband) or now - st["ts"] >= self.max_silence_s:
+                    out = self._emit(topic, st, now, value)
+                else:
+                    self.counters["deadband"] += 1
+            else:
+                if st["pending"] is not None:
+                    self.counters["coalesced"] += 1
+                st["pending"] = value
+        if out:
+            self.send(*out)
+
+    def _aggregate(self, topic, st):
+        digits = self._policy[topic][3]
+        v = AGGREGATES[self._policy[topic][2]](st)
+        st["n"], st["sum"], st["min"], st["max"] = 0, 0.0, None, None
+        return round(v, digits) if digits is not None else v
+
+    def _emit(self, topic, st, now, value):
+        st["sent"] = value
+        st["ts"] = now
+        st["pending"] = None
+        self.counters["sent"] += 1
+        return (topic, value, st["qos"], st["retain"])
+
+    def flush_due(self, now=None):
+        """Trailing edge / konec agregačního okna pro topicy, kterým uplynul interval."""
+        now = time.monotonic() if now is None else now
+        out = []
+        with self._lock:
+            for topic, st in self._state.items():
+                interval, deadband, agg, _ = self._policy[topic]
+                if now - st["ts"] < interval:
+                    continue
+                if agg:
+                    if not st["n"]:
+                        continue
+                    v = self._aggregate(topic, st)
+                elif st["pending"] is not None:
+                    v = st["pending"]
+                    st["pending"] = None
+                else:
+                    continue
+                if self._changed(st, v, deadband) or now - st["ts"] >= self.max_silence_s:
+                    out.append(self._emit(topic, st, now, v))
+                else:
+                    self.counters["deadband"] += 1
+        for item in out:
+            self.send(*item)
+        return len(out)
+
+    def reset(self):
+        """Po reconnectu zapomenout odeslané hodnoty – další vzorek jde ven hned."""
+        with self._lock:
+            for st in self._state.values():
+                st["sent"] = None
+                st["ts"] = -1e18
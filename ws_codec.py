@@ -0,0 +1,55 @@
+# ws_codec.py — volba dekodéru rámců Socket.IO (json / orjson / msgpack) pro infigy bridge
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # noqa: F401  (potřebuje ho socketio serializer="msgpack")
+except ImportError:
+    msgpack = None
+
+CODECS = ("auto", "json", "orjson", "msgpack")
+
+
+class OrjsonModule:
+    """
+    orjson s rozhraním modulu json, jak ho volá socketio/engineio Packet:
+    dumps(obj, separators=...) -> str, loads(str|bytes). Argumenty navíc
+    (separators, ...) se ignorují – orjson píše vždy kompaktně.
+    """
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj).decode("utf-8")
+
+
+def resolve(codec):
+    """Dostupný codec pro požadavek (auto = orjson, pokud je nainstalovaný)."""
+    codec = (codec or "auto").strip().lower()
+    if codec not in CODECS:
+        print(f"[WS] unknown codec {codec!r}, using json")
+        return "json"
+    if codec == "auto":
+        return "orjson" if orjson is not None else "json"
+    if codec == "orjson" and orjson is None:
+        print("[WS] orjson not installed, using json")
+        return "json"
+    if codec == "msgpack" and msgpack is None:
+        print("[WS] msgpack not installed, using json")
+        return "json"
+    return codec
+
+
+def client_options(codec):
+    """kwargs pro socketio.Client podle codecu; msgpack musí podporovat i server."""
+    codec = resolve(codec)
+    if codec == "orjson":
+        return codec, {"json": OrjsonModule}
+    if codec == "msgpack":
+        return codec, {"serializer": "msgpack"}
+    return codec, {}
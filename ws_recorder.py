@@ -0,0 +1,73 @@
+# ws_recorder.py — záznam surových Socket.IO událostí do gzip JSONL (pro tools/infigy_replay.py)
+import gzip
+import json
+import time
+import threading
+
+RECORD_FLUSH_S = 10   # gzip flush nejvýš jednou za interval (flush zhoršuje kompresi)
+
+
+class EventRecorder:
+    """
+    Jeden řádek na událost: {"t": unix čas, "event": jméno, "data": payload}.
+    Soubor se otevírá v režimu append – každý start přidá nový gzip member,
+    gzip.open je čte jako jeden proud. Nad max_bytes (nekomprimovaně) se
+    záznam zastaví, aby nezaplnil SD kartu.
+    """
+
+    def __init__(self, path, max_bytes=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._f = gzip.open(path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.written = 0
+        self.events = 0
+        print(f"[REC] recording Socket.IO events to {path}")
+
+    def write(self, event, data=None, ts=None):
+        line = json.dumps({"t": time.time() if ts is None else ts, "event": event, "data": data},
+                          ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._f is None:
+                return
+            if self.max_bytes and self.written + len(line) > self.max_bytes:
+                print(f"[REC] size limit reached after {self.events} events, recording stopped")
+                self._close()
+                return
+            try:
+                self._f.write(line)
+                self.written += len(line)
+                self.events += 1
+                now = time.monotonic()
+                if now - self._last_flush >= RECORD_FLUSH_S:
+                    self._f.flush()
+                    self._last_flush = now
+            except OSError as e:
+                print("[REC] write error:", e)
+
+    def _close(self):
+        if self._f is not None:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def read_events(path):
+    """Generátor (t, event, data) ze záznamu; useknutý konec (pád při zápisu) se přeskočí."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                yield float(rec.get("t", 0.0)), rec.get("event", ""), rec.get("data")
+        except (EOFError, OSError) as e:
+            print(f"[REC] {path}: truncated ({e})")
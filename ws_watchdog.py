@@ -0,0 +1,110 @@
+# ws_watchdog.py — adaptivní detekce výpadku proudu událostí (EWMA intervalu) a backoff reconnectu
+import random
+import threading
+
+
+class Backoff:
+    """Exponenciální backoff s jitterem: base * 2^n, strop max_s, náhodně 50–100 % hodnoty."""
+
+    def __init__(self, base_s=1.0, max_s=60.0):
+        self.base_s = base_s
+        self.max_s = max_s
+        self.attempt = 0
+
+    def next_delay(self):
+        d = min(self.max_s, self.base_s * (2 ** self.attempt))
+        self.attempt += 1
+        return d * random.uniform(0.5, 1.0)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class StallDetector:
+    """
+    Učí se běžný interval mezi událostmi (EWMA) a za výpadek považuje ticho
+    delší než k × interval, v mezích [min_s, max_s] (max_s = dřív pevných 180 s).
+    Počítá reconnecty, výpadky, time-to-first-event po (re)connectu a downtime
+    (od poslední události před výpadkem po první událost po obnovení).
+    Časy jsou monotonic, volající je dodává.
+    """
+
+    def __init__(self, k=10.0, min_s=20.0, max_s=180.0, alpha=0.05, backoff=None):
+        self.k = k
+        self.min_s = min_s
+        self.max_s = max_s
+        self.alpha = alpha
+        self.backoff = backoff or Backoff()
+        self.interval_s = None       # EWMA intervalu mezi událostmi
+        self.last_event = None
+        self.connected_at = None
+        self._outage_from = None     # poslední událost před výpadkem
+        self._awaiting_first = False
+        self._lock = threading.Lock()
+        self.counters = {"connects": 0, "reconnects": 0, "stalls": 0, "disconnects": 0,
+                         "ttfe_s": None, "downtime_s": 0.0, "last_downtime_s": 0.0}
+
+    def threshold(self):
+        if self.interval_s is None:
+            return self.max_s
+        return max(self.min_s, min(self.max_s, self.k * self.interval_s))
+
+    def poll_interval(self):
+        """Jak často kontrolovat: čtvrtina prahu, 1..15 s."""
+        return max(1.0, min(15.0, self.threshold() / 4.0))
+
+    def on_event(self, now):
+        with self._lock:
+            if self.last_event is not None and not self._awaiting_first:
+                dt = now - self.last_event
+                self.interval_s = dt if self.interval_s is None else \
+                    self.interval_s + self.alpha * (dt - self.interval_s)
+            if self._awaiting_first:
+                self._awaiting_first = False
+                if self.connected_at is not None:
+                    self.counters["ttfe_s"] = round(now - self.connected_at, 3)
+                if self._outage_from is not None:
+                    down = now - self._outage_from
+                    self.counters["last_downtime_s"] = round(down, 3)
+                    self.counters["downtime_s"] += down
+                    self._outage_from = None
+                self.backoff.reset()
+            self.last_event = now
+
+    def on_connect(self, now):
+        with self._lock:
+            self.counters["connects"] += 1
+            if self.counters["connects"] > 1:
+                self.counters["reconnects"] += 1
+            self.connected_at = now
+            self._awaiting_first = True
+
+    def on_disconnect(self, now):
+        with self._lock:
+            self.counters["disconnects"] += 1
+            self._mark_outage(now)
+            self.connected_at = None
+
+    def _mark_outage(self, now):
+        if self._outage_from is None:
+            self._outage_from = self.last_event if self.last_event is not None else now
+
+    def check(self, now):
+        """True = spojení je navázané, ale proud stojí déle než práh (volající udělá reconnect)."""
+        with self._lock:
+            if self.connected_at is None:
+                return False
+            ref = self.last_event if not self._awaiting_first else self.connected_at
+            if ref is None or now - ref <= self.threshold():
+                return False
+            self.counters["stalls"] += 1
+            self._mark_outage(now)
+            self.connected_at = None     # do dalšího connectu už nehlásit
+            return True
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counters)
+            out["interval_s"] = self.interval_s
+            out["threshold_s"] = self.threshold()
+            return out